@@ -2,7 +2,10 @@ import streamlit as st
 from dotenv import load_dotenv
 import os
 import pandas as pd
+from datetime import date, timedelta
 from get_apt_data import get_apt_data, get_apt_list, supabase
+from per_history import load_per_panel, per_quantiles
+from screening import screen_apartments, screen_regions
 
 st.set_page_config(
     page_title="Home",
@@ -20,30 +23,77 @@ st.markdown(
     """
 )
 
-response = supabase.table('APTLastPER').select('*').execute()
-print(response)
+PAGE_SIZE = 50
 
-df = pd.DataFrame(response.data)
+# 필터/정렬/페이지는 DB에서 (screening.py), 화면에는 한 페이지만 가져온다
+regions = screen_regions(supabase)
+selected_regions = st.sidebar.multiselect(
+    "지역",
+    options=[r['address'] for r in regions],
+    help="비워 두면 전체 지역",
+)
+per_low, per_high = st.sidebar.slider("PER", min_value=0.0, max_value=100.0, value=(0.0, 100.0), step=1.0)
+page = st.sidebar.number_input("페이지", min_value=1, value=1, step=1)
+
+offset = (page - 1) * PAGE_SIZE
+rows, total = screen_apartments(
+    supabase,
+    regions=selected_regions,
+    # 기본 범위(0~100)면 PER 조건 없음 (PER이 없는 아파트도 표시)
+    PERs=(per_low or None, per_high if per_high < 100 else None),
+    limit=PAGE_SIZE,
+    offset=offset,
+)
+st.caption(f"전체 {total}개 중 {offset + 1 if rows else 0}~{offset + len(rows)}")
+
+df = pd.DataFrame(rows, columns=['apt_id', 'last_PER', 'apt_name', 'apt_PY', 'address',
+                                 'last_avg_price', 'last_avg_rent', 'updated'])
 
 # df['updated'] = pd.to_datetime(df['updated'], format='%Y-%m-%dT%H:%M:%S.%f%z').dt.strftime('%Y-%m-%d')
 df['updated'] = pd.to_datetime(df['updated'], format='ISO8601').dt.strftime('%Y-%m-%d')
-df = df.drop(columns='id')
-df = df.drop(columns='apt_id')
 
-new_order = ['last_PER', 'apt_name', 'apt_PY', 'last_avg_price', 'last_avg_rent', 'updated']
+# 미리 계산된 PER 통계 (per_stats 아파트별 마지막 달, 이 페이지 아파트만)
+stats = supabase.table('per_stats_latest').select('apt_id, per_z, market_pct').in_('apt_id', df['apt_id'].tolist()).execute()
+stats = pd.DataFrame(stats.data, columns=['apt_id', 'per_z', 'market_pct'])
+df = df.merge(stats, on='apt_id', how='left')
+df['per_z'] = df['per_z'].astype(float).round(2)
+df['market_pct'] = (df['market_pct'].astype(float) * 100).round()
+
+# 시세를 쓸 때 계산해 둔 전세가율/임대수익률 (price_metrics 아파트별 마지막 달)
+metrics = supabase.table('price_metrics_latest').select('apt_id, jeonse_ratio, rent_yield').in_('apt_id', df['apt_id'].tolist()).execute()
+metrics = pd.DataFrame(metrics.data, columns=['apt_id', 'jeonse_ratio', 'rent_yield'])
+df = df.merge(metrics, on='apt_id', how='left').drop(columns='apt_id')
+df['jeonse_ratio'] = (df['jeonse_ratio'].astype(float) * 100).round(1)
+df['rent_yield'] = (df['rent_yield'].astype(float) * 100).round(2)
+
+new_order = ['last_PER', 'apt_name', 'apt_PY', 'address', 'last_avg_price', 'last_avg_rent', 'jeonse_ratio', 'rent_yield',
+             'per_z', 'market_pct', 'updated']
 df = df[new_order]
 
 df = df.rename(columns={
     'last_PER': '최근 PER',
     'apt_name': '아파트',
     'apt_PY': '평형',
+    'address': '지역',
     'last_avg_price': '매매가',
     'last_avg_rent': '월세',
+    'jeonse_ratio': '전세가율(%)',
+    'rent_yield': '임대수익률(%)',
+    'per_z': 'PER z-score',
+    'market_pct': '시장 백분위(%)',
     'updated': '수정일',
 })
 
 # df['updated_date'] = pd.to_datetime(df['updated']).dt.date
-df = df.set_index('최근 PER').sort_index()
+# 정렬은 DB에서 (PER 낮은 순)
+df = df.set_index('최근 PER')
 
 st.dataframe(df, use_container_width=True)
 
+# PER 분포 추이 (per_daily 일별 스냅샷, 최근 1년)
+history = load_per_panel(supabase, date.today() - timedelta(days=365), date.today())
+if not history.empty:
+    st.write("### PER 분포 추이")
+    quantiles = per_quantiles(history)
+    quantiles.columns = [f"{int(q * 100)}%" for q in quantiles.columns]
+    st.line_chart(quantiles)
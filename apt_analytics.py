@@ -0,0 +1,73 @@
+"""
+아파트 시세 시리즈 정렬/PER 계산 (페이지와 배치 공통)
+
+get_apt_data()가 주는 매매/전세/월세 시리즈(price_trend 형식 리스트)를 월 단위 PeriodIndex 한 프레임으로 맞춘다.
+- 하나라도 있는 달만 행으로 둔다 (outer merge와 같음), 시세 빈 달은 이전 달 값, 그래도 없으면 0
+- 거래량 빈 달은 0
+- PER = 매매가 / (월세 * 12), 월세가 0인 달은 NaN (inf 없음, APTLastPER의 NULL과 같음)
+
+반환 프레임: index month(period[M]), Date(datetime64, 월 첫날), 매매가/전세/월세(float64), 거래량(int64), PER(float64)
+"""
+import numpy as np
+import pandas as pd
+
+# 시리즈 이름 -> (가격 컬럼, 거래량 컬럼)
+COLUMNS = {
+    'sale': ('매매가', '매매 거래량'),
+    'jeonse': ('전세', '전세 거래량'),
+    'rent': ('월세', '월세 거래량'),
+}
+
+
+def month_index(dates):
+    """'YYYYMM' 문자열/정수 배열 -> 월 PeriodIndex (문자열 파싱 없이 월 순번으로 변환)"""
+    yyyymm = np.asarray(dates, dtype=np.int64)
+    ordinals = (yyyymm // 100 - 1970) * 12 + yyyymm % 100 - 1
+    return pd.PeriodIndex(pd.arrays.PeriodArray(ordinals, dtype='period[M]'), name='month')
+
+
+def masked_per(price, rent):
+    """매매가 / (월세 * 12), 월세가 0 이하인 곳은 NaN (배열/Series 모두 가능)"""
+    price = np.asarray(price, dtype=float)
+    rent = np.asarray(rent, dtype=float)
+    per = np.full(price.shape, np.nan)
+    np.divide(price, rent * 12, out=per, where=rent > 0)
+    return per
+
+
+def _series_frame(records, price_col, volume_col):
+    if not records:
+        return pd.DataFrame({price_col: pd.Series(dtype=float), volume_col: pd.Series(dtype=float)},
+                            index=month_index([]))
+    return pd.DataFrame({
+        price_col: np.array([r['avg'] for r in records], dtype=float),
+        volume_col: np.array([r.get('cnt', 0) for r in records], dtype=float),
+    }, index=month_index([r['date'] for r in records]))
+
+
+def align_series(sale=None, jeonse=None, rent=None):
+    """
+    매매/전세/월세 시리즈를 월 단위로 맞춘 프레임
+    None인 시리즈는 컬럼을 만들지 않는다 (빈 리스트는 0으로 채운 컬럼), PER은 매매/월세가 모두 있을 때만
+    """
+    given = {name: records for name, records in (('sale', sale), ('jeonse', jeonse), ('rent', rent))
+             if records is not None}
+    df = pd.concat([_series_frame(records, *COLUMNS[name]) for name, records in given.items()], axis=1).sort_index()
+
+    for name in given:
+        price_col, volume_col = COLUMNS[name]
+        df[price_col] = df[price_col].ffill().fillna(0)
+        df[volume_col] = df[volume_col].fillna(0).astype('int64')
+    if 'sale' in given and 'rent' in given:
+        df['PER'] = masked_per(df['매매가'], df['월세'])
+
+    df.insert(0, 'Date', df.index.to_timestamp())
+    return df
+
+
+def recent_means(df, months=6):
+    """최근 months개 달의 (매매가 평균(억원), 월세 평균(만원, 내림)) - 달이 없으면 (0, 0)"""
+    if df.empty:
+        return 0.0, 0
+    last = df.iloc[-months:]
+    return round(last['매매가'].mean() / 10000, 1), int(last['월세'].mean())
@@ -0,0 +1,58 @@
+"""
+아파트/평형 식별자 테이블
+
+- apartment: 아실 seq 기준 아파트 한 행 (seq, name, description, address, year)
+- unit: 아파트의 평형 한 행 (id, seq, PY), (seq, PY)는 유일
+  unit.id는 APTInfo.apt_id / price_monthly.apt_id / APTLastPER.apt_id와 같은 값이다
+  (기존 데이터는 같은 name/PY의 APTInfo 행들 중 가장 작은 id, 새 평형은 처음 만든 APTInfo 행의 id)
+
+화면과 조회는 "아파트이름 (34평)" 문자열 대신 unit.id(정수)로 주고받는다.
+client는 local_db.supabase 또는 Supabase 클라이언트
+"""
+DDL = [
+    '''
+    CREATE TABLE IF NOT EXISTS apartment (
+        seq INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        description TEXT,
+        address TEXT,
+        year INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS unit (
+        id INTEGER PRIMARY KEY,
+        seq INTEGER NOT NULL,
+        "PY" TEXT NOT NULL,
+        UNIQUE (seq, "PY")
+    )
+    ''',
+]
+
+
+def ensure_unit_tables(execute_sql):
+    """apartment, unit 테이블 생성 (local_db.execute_sql을 넘겨받음)"""
+    for sql in DDL:
+        execute_sql(sql)
+
+
+def get_unit_id(client, seq, PY):
+    """아실 seq + 평형의 unit id (없으면 None)"""
+    rows = client.table('unit').select('id').eq('seq', int(seq)).eq('PY', str(PY)).limit(1).execute().data
+    return rows[0]['id'] if rows else None
+
+
+def register_unit(client, apt_info, PY, unit_id, address=None, year=None):
+    """새 평형을 등록 (아파트가 없으면 apartment도 만든다)"""
+    client.table('apartment').upsert({
+        'seq': int(apt_info['seq']),
+        'name': apt_info['name'],
+        'description': apt_info.get('desc'),
+        'address': address,
+        'year': year,
+    }, on_conflict='seq', ignore_duplicates=True).execute()
+    client.table('unit').upsert({
+        'id': unit_id,
+        'seq': int(apt_info['seq']),
+        'PY': str(PY),
+    }, on_conflict='seq, PY', ignore_duplicates=True).execute()
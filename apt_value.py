@@ -1,4 +1,5 @@
 import json
+import logging
 from statistics import mean
 
 import requests
@@ -7,6 +8,10 @@ from Crypto.Cipher import AES
 from Crypto.Util.Padding import unpad
 import base64
 
+from pipeline_metrics import http_get, stage
+
+logger = logging.getLogger(__name__)
+
 # payload = {'key1': 'value1', 'key2': 'value2'}
 # r = requests.get('https://exam.com/get', params=payload)
 
@@ -50,7 +55,7 @@ def decrypt(encrypted_text, secret):
 
 def fetch_and_parse_key(url):
     # Fetch the URL
-    response = requests.get(url)
+    response = http_get(url)
     response.raise_for_status()  # Ensure the request was successful
 
     # Search for the getKey pattern in the response text
@@ -61,7 +66,7 @@ def fetch_and_parse_key(url):
         secret = match.group(1)
         return secret
     else:
-        print("Pattern not found in the response.")
+        logger.warning("Pattern not found in the response.")
         return None
 
 def get_APT_info(apt_name):
@@ -74,7 +79,7 @@ def get_APT_info(apt_name):
     """
     apt_info = {}
     seq = ''
-    r = requests.get(f'https://asil.kr/json/getAptname_ver_3_4.jsp?os=pc&aptname={apt_name}')
+    r = http_get(f'https://asil.kr/json/getAptname_ver_3_4.jsp?os=pc&aptname={apt_name}')
     tmp = r.json()[0]
     if tmp['name'] == apt_name:
         seq = tmp['seq']
@@ -83,10 +88,10 @@ def get_APT_info(apt_name):
             'seq': tmp['seq'],
             'name': tmp['name'],
         }
-        print(apt_info)
+        logger.debug("apt_info: %s", apt_info)
         return apt_info
     else:
-        print(f"이름이 동일하지 않아요: {apt_name} != {tmp['name']}")
+        logger.warning("이름이 동일하지 않아요: %s != %s", apt_name, tmp['name'])
         return 0
 
 
@@ -108,53 +113,56 @@ def get_APT_transactions(apt_info, PY, YEAR, DEAL_TYPE):
         sido = 11
     req_url = f"https://asil.kr/app/data/apt_price_m2_newver_6.jsp?sido={sido}&dealmode={DEAL_TYPE}&building=apt&seq={seq}&m2=&py={PY}&py_type=&isPyQuery=true&year={YEAR}&u=0&start=0&count=1000&dong_name=&order="
     # print(req_url)
-    r = requests.get(req_url, headers=headers)
-    data = r.json()[0]['val']
-    print(data)
+    with stage('fetch'):
+        r = http_get(req_url, headers=headers)
+        data = r.json()[0]['val']
+        logger.debug("아실 응답: %d개월", len(data))
 
-    url = f"https://asil.kr/app/apt_info.jsp?os=pc&apt={seq}"
-    secret = fetch_and_parse_key(url)
+        url = f"https://asil.kr/app/apt_info.jsp?os=pc&apt={seq}"
+        secret = fetch_and_parse_key(url)
     if secret:
-        print(f"Extracted secret: {secret}")
+        logger.debug("Extracted secret for seq=%s", seq)
     else:
-        print("Failed to extract the secret.")
-
+        logger.warning("Failed to extract the secret. seq=%s", seq)
+
+    # 월별 거래 금액 복호화
+    monthly = []
+    with stage('decrypt'):
+        for m in data:
+            # 여기서 m['val']은 월간 거래 내역
+            m_data = m['val']
+            m_amount = []
+            for d in m_data:
+                # 여기서 m['val']은 일간 거래 내역
+                d_data = d['val']
+                for r in d_data:
+                    if r['reg_gbn'] == "1":
+                        # 직거래는 noise가 되므로 저장하지 않음
+                        continue
+
+                    d_money = decrypt(r['money'], secret)
+                    d_rent = decrypt(r['rent'], secret)
+
+                    r_money = convert_to_int(d_money)
+                    if DEAL_TYPE == '3':
+                        a = r_money / 10000 * 40 + int(d_rent)
+                    else:
+                        a = r_money
+                    m_amount.append(a)
+            monthly.append((m['yyyymm'], m_amount))
+
+    # 월별 평균/최소/최대/건수 집계
     amount = []
-    for m in data:
-        # 여기서 m['val']은 월간 거래 내역
-        # print(m['yyyymm'])
-        m_data = m['val']
-        m_amount = []
-        for d in m_data:
-            # 여기서 m['val']은 일간 거래 내역
-            # print(d['day'])
-            d_data = d['val']
-            for r in d_data:
-                if r['reg_gbn'] == "1":
-                    # 직거래는 noise가 되므로 저장하지 않음
-                    continue
-
-                # print(r['money'], r['rent'])
-                d_money = decrypt(r['money'], secret)
-                d_rent = decrypt(r['rent'], secret)
-                # print(d_money, d_rent)
-
-                r_money = convert_to_int(d_money)
-                # print(r_money, r['rent'])
-                # r['money'].split()
-                if DEAL_TYPE == '3':
-                    a = r_money / 10000 * 40 + int(d_rent)
-                else:
-                    a = r_money
-                m_amount.append(a)
-        if m_amount:
-            amount.append({
-                'date': m['yyyymm'],
-                'avg': mean(m_amount),
-                'min': min(m_amount),
-                'max': max(m_amount),
-                'cnt': len(m_amount)
-            })
+    with stage('aggregate'):
+        for yyyymm, m_amount in monthly:
+            if m_amount:
+                amount.append({
+                    'date': yyyymm,
+                    'avg': mean(m_amount),
+                    'min': min(m_amount),
+                    'max': max(m_amount),
+                    'cnt': len(m_amount)
+                })
     return amount
 
 
@@ -0,0 +1,194 @@
+"""
+아파트 과거 시세 백필 스크립트
+
+여러 아파트/평형을 (seq, 평형, 거래유형, 연도) 단위로 쪼개서 아실 데이터를 수집하고,
+완료된 단위는 BackfillCheckpoint 테이블에 기록한다. (올해는 아직 거래가 쌓이는 중이라 기록하지 않고 매번 다시 수집)
+중간에 중단되더라도 다시 실행하면 완료된 단위는 건너뛰고 이어서 진행한다.
+
+사용법:
+    python backfill_apt_data.py 잠실올림픽아이파크:26 헬리오시티:25,34 --workers 4
+"""
+import argparse
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from apt_value import get_APT_transactions, get_APT_info
+from get_apt_data import extract_and_save_year, extract_address
+from update_apt_data import ensure_series_columns
+from price_trend_store import save_series
+from pipeline_metrics import setup_logging, stage, rows_written, serve_prometheus, export
+
+# Load environment variables from the .env file
+load_dotenv()
+
+# 로컬 DB 사용
+from local_db import supabase, execute_sql
+from last_per import ensure_last_per_table, refresh_last_per, snapshot_per
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_TABLE = 'BackfillCheckpoint'
+
+# 1은 매매, 2는 전세, 3은 월세
+DEAL_TYPES = ['1', '2', '3']
+
+
+def ensure_checkpoint_table():
+    """체크포인트 테이블이 없으면 생성"""
+    execute_sql(f'''
+        CREATE TABLE IF NOT EXISTS "{CHECKPOINT_TABLE}" (
+            seq TEXT NOT NULL,
+            "PY" TEXT NOT NULL,
+            "DEAL_TYPE" TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            row_count INTEGER NOT NULL DEFAULT 0,
+            done_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (seq, "PY", "DEAL_TYPE", year)
+        )
+    ''')
+
+
+def get_start_year(description):
+    """
+    설명의 준공년도 다음 해를 백필 시작 연도로 반환
+    예: "서울 송파구 신천동 / 19년12월 / 1068세대 / 아파트" -> 2020
+    """
+    s_yy = description.split('/')[1].split('년')[0].strip()
+    if len(s_yy) == 2:
+        if s_yy[0] in ['0', '1', '2']:
+            yyyy = '20' + s_yy
+        else:
+            yyyy = '19' + s_yy
+        return int(yyyy) + 1
+    elif len(s_yy) == 4:
+        return int(s_yy) + 1
+    raise ValueError(f"s_yy 값이 이상해요: {s_yy}")
+
+
+def parse_targets(targets):
+    """
+    "아파트이름:평형[,평형...]" 형식의 인자를 (아파트이름, [평형, ...]) 리스트로 변환
+    """
+    result = []
+    for t in targets:
+        name, _, pys = t.rpartition(':')
+        if not name or not pys:
+            raise ValueError(f"'아파트이름:평형' 형식이 아니에요: {t}")
+        result.append((name, [py.strip() for py in pys.split(',') if py.strip()]))
+    return result
+
+
+def load_done_units():
+    """체크포인트 테이블에서 완료된 단위 목록을 가져오기 (예전에 기록된 올해 단위는 빼고 다시 수집)"""
+    rows = supabase.table(CHECKPOINT_TABLE).select('seq, PY, DEAL_TYPE, year') \
+        .lte('year', datetime.today().year - 1).execute().data
+    return {(str(r['seq']), r['PY'], r['DEAL_TYPE'], r['year']) for r in rows}
+
+
+def save_unit(apt_info, PY, DEAL_TYPE, amount):
+    """수집한 한 단위(연도)의 데이터를 APTInfo에 date 기준으로 병합 저장"""
+    save_series(supabase, apt_info, PY, DEAL_TYPE, amount,
+                extra={'year': extract_and_save_year(apt_info['desc'])},
+                new_row={'address': extract_address(apt_info['desc'])})
+
+
+def plan_units(targets, done, end_year):
+    """백필할 (apt_info, 평형, 거래유형, 연도) 단위 목록 생성 (완료된 단위는 제외)"""
+    units = []
+    for apt_name, pys in targets:
+        apt_info = get_APT_info(apt_name)
+        if not apt_info:
+            logger.warning("%s: 아실에서 찾을 수 없음", apt_name)
+            continue
+        start_year = get_start_year(apt_info['desc'])
+        for PY in pys:
+            for DEAL_TYPE in DEAL_TYPES:
+                for y in range(start_year, end_year + 1):
+                    if (str(apt_info['seq']), PY, DEAL_TYPE, y) in done:
+                        continue
+                    units.append((apt_info, PY, DEAL_TYPE, y))
+    return units
+
+
+def backfill(targets, workers=4, end_year=None):
+    """
+    targets: [(아파트이름, [평형, ...]), ...]
+    각 단위는 병렬로 수집하되, 같은 시리즈(아파트/평형/거래유형)에 대한 DB 쓰기는 직렬로 처리
+    (행이 없을 때 두 단위가 동시에 새 행을 만드는 것을 막기 위함, 기존 행 병합은 version 비교로 보호됨)
+    """
+    ensure_checkpoint_table()
+    ensure_series_columns()
+    end_year = end_year or datetime.today().year
+
+    with stage('plan'):
+        units = plan_units(targets, load_done_units(), end_year)
+    logger.info("백필 대상: %d개 단위", len(units))
+
+    series_locks = {}
+    locks_guard = threading.Lock()
+
+    def series_lock(key):
+        with locks_guard:
+            return series_locks.setdefault(key, threading.Lock())
+
+    def run_unit(apt_info, PY, DEAL_TYPE, year):
+        amount = get_APT_transactions(apt_info, PY, str(year), DEAL_TYPE) or []
+        if amount:
+            with series_lock((apt_info['seq'], PY, DEAL_TYPE)), stage('write'):
+                save_unit(apt_info, PY, DEAL_TYPE, amount)
+            rows_written('APTInfo')
+        # 올해는 남은 달의 거래가 더 들어오므로 완료로 기록하지 않는다
+        if year >= datetime.today().year:
+            return len(amount)
+        # 저장이 끝난 뒤에만 체크포인트 기록 (중단되면 해당 단위는 다시 수집됨)
+        supabase.table(CHECKPOINT_TABLE).upsert({
+            'seq': str(apt_info['seq']),
+            'PY': PY,
+            'DEAL_TYPE': DEAL_TYPE,
+            'year': year,
+            'row_count': len(amount),
+        }, on_conflict='seq, PY, DEAL_TYPE, year').execute()
+        return len(amount)
+
+    done_count, failed = 0, []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_unit, *unit): unit for unit in units}
+        for future in as_completed(futures):
+            apt_info, PY, DEAL_TYPE, year = futures[future]
+            try:
+                cnt = future.result()
+                done_count += 1
+                logger.info("[%d/%d] %s %s평 %s %s: %d개월", done_count, len(units), apt_info['name'], PY, DEAL_TYPE, year, cnt)
+            except Exception as e:
+                failed.append(futures[future])
+                logger.error("%s %s평 %s %s 실패: %s", apt_info['name'], PY, DEAL_TYPE, year, e)
+
+    logger.info("완료: %d개, 실패: %d개 (실패한 단위는 다시 실행하면 이어서 수집)", done_count, len(failed))
+    return done_count, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="아파트 과거 시세 백필")
+    parser.add_argument('targets', nargs='+', help="아파트이름:평형[,평형...]")
+    parser.add_argument('--workers', type=int, default=4, help="동시에 수집할 단위 수")
+    parser.add_argument('--end-year', type=int, default=None, help="마지막 수집 연도 (기본: 올해)")
+    parser.add_argument('--metrics-file', default=None, help="Prometheus 텍스트 포맷 메트릭 파일 경로")
+    parser.add_argument('--metrics-port', type=int, default=None, help="메트릭을 제공할 로컬 HTTP 포트")
+    args = parser.parse_args()
+
+    setup_logging()
+    if args.metrics_port:
+        serve_prometheus(args.metrics_port)
+    try:
+        backfill(parse_targets(args.targets), workers=args.workers, end_year=args.end_year)
+        # 백필이 끝나면 APTLastPER 다시 계산
+        with stage('aggregate'):
+            ensure_last_per_table()
+            refresh_last_per()
+            snapshot_per()
+    finally:
+        export(args.metrics_file)
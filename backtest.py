@@ -0,0 +1,215 @@
+"""
+PER 기준 매수/매도 백테스트 (전체 시장, 벡터화)
+
+per_panel의 아파트 x 달 패널을 아파트 x 연속된 달 2차원 배열(매매가, PER)로 펴고
+"PER이 entry 미만이면 매수, exit 초과면 매도" 규칙을 모든 아파트에 한꺼번에 적용한다.
+- 거래가 없는 달은 이전 달 값, 첫 거래 전 달은 NaN (PER은 월세가 없으면 NaN -> 신호 없음, 보유 상태 유지)
+- 보유 상태: 마지막 매수 신호가 마지막 매도 신호보다 뒤인 달 (아파트별 반복문 없음)
+- lag: 신호 달의 월평균 가격으로는 살 수 없으므로 기본 1개월 뒤 가격으로 사고판다
+- 거래 수익률 = 판 달 가격 / 산 달 가격 - 1 (끝까지 보유 중이면 마지막 달 가격으로 평가)
+- 최대 낙폭: 거래마다 산 달부터 판 달까지 가격의 고점 대비 최저 (mean_drawdown 평균, worst_drawdown 최저)
+- fwd_12m / fwd_24m: 매수한 달부터 12/24개월 뒤 가격 수익률 (시장 전체 평균은 baseline)
+
+사용법:
+    python backtest.py --entry 15 35 1 --exit 25 50 1
+    python backtest.py --snapshot --top 30
+    python backtest.py --synthetic 20000
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from per_panel import build_panel, load_long, load_long_snapshot
+
+logger = logging.getLogger(__name__)
+
+HORIZONS = (12, 24)
+LAG = 1
+
+
+def _ffill(values):
+    """2차원 배열을 시간(axis=1) 방향으로 앞 값 채우기 (앞에 값이 없으면 NaN 그대로)"""
+    idx = np.where(~np.isnan(values), np.arange(values.shape[1]), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return np.take_along_axis(values, idx, axis=1)
+
+
+def dense_panel(panel):
+    """
+    build_panel 결과 -> (apt_ids, yyyymm 배열, 매매가 2차원 배열, PER 2차원 배열)
+    열은 첫 달부터 마지막 달까지 빠짐없는 달, 매매가가 아직 없는 달은 NaN
+    """
+    apt_ids, rows = np.unique(panel['apt_id'].to_numpy(), return_inverse=True)
+    yyyymm = panel['yyyymm'].to_numpy()
+    ordinal = yyyymm // 100 * 12 + yyyymm % 100 - 1
+    cols = ordinal - ordinal.min()
+    months = np.arange(ordinal.min(), ordinal.max() + 1)
+
+    price = np.full((len(apt_ids), len(months)), np.nan)
+    per = np.full_like(price, np.nan)
+    sale = panel['price'].to_numpy(dtype=float)
+    # 첫 매매 거래 전 달은 build_panel에서 0으로 채워져 있다
+    price[rows, cols] = np.where(sale > 0, sale, np.nan)
+    per[rows, cols] = np.where(sale > 0, panel['PER'].to_numpy(dtype=float), np.nan)
+    return apt_ids, months // 12 * 100 + months % 12 + 1, _ffill(price), _ffill(per)
+
+
+def _last_index(mask, lag=LAG):
+    """달마다 그 달까지 mask가 참이었던 마지막 열 번호 (없으면 -1), lag개월 뒤로 민 int16 배열"""
+    idx = np.where(mask, np.arange(mask.shape[1], dtype=np.int16), np.int16(-1))
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    shifted = np.full_like(idx, -1)
+    shifted[:, lag:] = idx[:, :idx.shape[1] - lag]
+    return shifted
+
+
+def positions(per, entry_per, exit_per, lag=LAG):
+    """달별 보유 여부 (N x T bool), PER < entry_per 매수 / PER > exit_per 매도, lag개월 뒤에 체결"""
+    # 마지막 매수 신호가 마지막 매도 신호보다 뒤면 보유 중
+    return _last_index(per < entry_per, lag) > _last_index(per > exit_per, lag)
+
+
+def _trades(held, log_price, horizons):
+    """
+    보유 배열 -> 거래별 (아파트 행, 수익률, 보유 개월, 최대 낙폭, {h: h개월 뒤 수익률}), 거래가 없으면 None
+    산 달부터 판 달까지의 칸만 모아서(행 우선 순서) 거래 번호로 구간을 나눈 누적 최대값으로 낙폭을 계산한다
+    """
+    T = held.shape[1]
+    prev = np.zeros_like(held)
+    prev[:, 1:] = held[:, :-1]
+    # 보유한 달 + 판 달 (판 달은 다음 거래의 첫 달이 될 수 없다)
+    cells = np.flatnonzero(held | prev)
+    is_start = (held & ~prev).ravel()[cells]
+    seg = np.flatnonzero(is_start)
+    if not len(seg):
+        return None
+    lp = log_price.ravel()[cells]
+
+    trade_id = np.cumsum(is_start, dtype=np.int32) - 1
+    # 거래 번호가 커지는 순서라 offset을 더하면 누적 최대값이 거래마다 새로 시작한다 (로그 가격 < 100)
+    offset = trade_id * 100.0
+    drawdown = np.expm1(np.minimum.reduceat(lp - (np.maximum.accumulate(lp + offset) - offset), seg))
+    last = np.append(seg[1:], len(lp)) - 1
+    returns = np.expm1(lp[last] - lp[seg])
+
+    start_cells = cells[seg]
+    rows, cols = np.divmod(start_cells, T)
+    fwd = {}
+    for h in horizons:
+        ok = cols + h < T
+        fwd[h] = np.expm1(log_price.ravel()[start_cells[ok] + h] - log_price.ravel()[start_cells[ok]])
+    return rows, returns, last - seg, drawdown, fwd
+
+
+def baseline(price, horizons=HORIZONS):
+    """시장 전체(모든 아파트/달) 평균 h개월 뒤 수익률 {'fwd_12m': ...}"""
+    result = {}
+    for h in horizons:
+        fwd = price[:, h:] / price[:, :-h] - 1
+        result[f'fwd_{h}m'] = float(np.nanmean(fwd))
+    return result
+
+
+def sweep(price, per, entries, exits, lag=LAG, horizons=HORIZONS, chunk=4096):
+    """
+    매수 PER x 매도 PER 격자 (매수 <= 매도인 쌍만) 결과 DataFrame
+    컬럼: entry, exit, trades, apts, hit_rate, mean_return, mean_hold(개월), mean_drawdown, worst_drawdown, fwd_12m, fwd_24m
+    아파트를 chunk개씩 나눠서 임계값마다 마지막 신호 위치를 한 번만 계산하고, 규칙마다 비교 한 번으로 보유 배열을 만든다
+    """
+    pairs = [(e, x) for e in entries for x in exits if e <= x]
+    totals = np.zeros((len(pairs), 6))  # 거래 수, 아파트 수, 수익 거래 수, 수익률 합, 보유 개월 합, 낙폭 합
+    worst = np.zeros(len(pairs))
+    fwd_sum = np.zeros((len(pairs), len(horizons)))
+    fwd_cnt = np.zeros((len(pairs), len(horizons)))
+
+    with np.errstate(invalid='ignore'):
+        for lo in range(0, len(price), chunk):
+            log_price = np.log(price[lo:lo + chunk])
+            part = per[lo:lo + chunk]
+            last_entry = {e: _last_index(part < e, lag) for e in set(entries)}
+            last_exit = {x: _last_index(part > x, lag) for x in set(exits)}
+            for i, (e, x) in enumerate(pairs):
+                trades = _trades(last_entry[e] > last_exit[x], log_price, horizons)
+                if trades is None:
+                    continue
+                rows, returns, hold, drawdown, fwd = trades
+                totals[i] += (len(returns), np.count_nonzero(np.diff(rows)) + 1, np.count_nonzero(returns > 0),
+                              returns.sum(), hold.sum(), drawdown.sum())
+                worst[i] = min(worst[i], drawdown.min())
+                for j, h in enumerate(horizons):
+                    fwd_sum[i, j] += fwd[h].sum()
+                    fwd_cnt[i, j] += len(fwd[h])
+
+    n = np.where(totals[:, 0] > 0, totals[:, 0], np.nan)
+    result = pd.DataFrame({
+        'entry': [e for e, _ in pairs],
+        'exit': [x for _, x in pairs],
+        'trades': totals[:, 0].astype(int),
+        'apts': totals[:, 1].astype(int),
+        'hit_rate': totals[:, 2] / n,
+        'mean_return': totals[:, 3] / n,
+        'mean_hold': totals[:, 4] / n,
+        'mean_drawdown': totals[:, 5] / n,
+        'worst_drawdown': np.where(totals[:, 0] > 0, worst, np.nan),
+    })
+    for j, h in enumerate(horizons):
+        result[f'fwd_{h}m'] = fwd_sum[:, j] / np.where(fwd_cnt[:, j] > 0, fwd_cnt[:, j], np.nan)
+    return result
+
+
+def backtest(price, per, entry_per, exit_per, lag=LAG, horizons=HORIZONS):
+    """규칙 하나의 결과 dict (sweep의 한 행)"""
+    return sweep(price, per, [entry_per], [exit_per], lag, horizons).iloc[0].to_dict()
+
+
+def _grid(start, stop, step):
+    return np.round(np.arange(start, stop + step / 2, step), 6)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    from pipeline_metrics import setup_logging
+
+    parser = argparse.ArgumentParser(description="PER 기준 매수/매도 백테스트")
+    parser.add_argument('--entry', type=float, nargs=3, default=[15, 35, 1], metavar=('START', 'STOP', 'STEP'),
+                        help="매수 PER 격자 (끝 포함)")
+    parser.add_argument('--exit', type=float, nargs=3, default=[25, 50, 1], metavar=('START', 'STOP', 'STEP'),
+                        help="매도 PER 격자 (끝 포함)")
+    parser.add_argument('--lag', type=int, default=LAG, help="신호 후 체결까지 개월 수")
+    parser.add_argument('--snapshot', nargs='?', const='', default=None, help="DB 대신 Parquet 스냅샷에서 읽기")
+    parser.add_argument('--synthetic', type=int, default=0, help="합성 데이터 아파트 수 (시간 측정용)")
+    parser.add_argument('--sort', default='mean_return', help="정렬 컬럼")
+    parser.add_argument('--top', type=int, default=20, help="출력할 규칙 수")
+    parser.add_argument('--out', default=None, help="전체 결과 CSV 경로")
+    args = parser.parse_args()
+
+    # Load environment variables from the .env file
+    load_dotenv()
+    setup_logging()
+
+    start = time.perf_counter()
+    if args.synthetic:
+        from bench_per_panel import synthetic_long
+        long = synthetic_long(args.synthetic)
+    elif args.snapshot is not None:
+        long = load_long_snapshot(args.snapshot or None)
+    else:
+        # 로컬 DB 사용
+        from local_db import execute_sql
+        long = load_long(execute_sql)
+    apt_ids, months, price, per = dense_panel(build_panel(long))
+    logger.info("패널 %d개 아파트 x %d개월 (%.1f초)", len(apt_ids), len(months), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    result = sweep(price, per, _grid(*args.entry), _grid(*args.exit), args.lag)
+    logger.info("규칙 %d개 (%.1f초), 시장 평균 %s", len(result), time.perf_counter() - start,
+                ', '.join(f'{k} {v:.1%}' for k, v in baseline(price).items()))
+
+    if args.out:
+        result.to_csv(args.out, index=False)
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(result.sort_values(args.sort, ascending=False).head(args.top).to_string(index=False))
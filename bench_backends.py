@@ -0,0 +1,117 @@
+"""
+DB 백엔드별 벤치마크 (get_apt_list, PER 계산 job)
+
+DATABASE_URL마다 별도 프로세스를 띄워서 (local_db는 import 시점에 백엔드가 정해짐)
+schema bootstrap -> 테이블이 비어 있으면 합성 데이터 적재 -> get_apt_list(), refresh_last_per()를 반복 측정한다.
+이미 데이터가 있는 DB면 적재 없이 그 데이터로 측정한다.
+
+사용법:
+    python bench_backends.py --apts 1000 \
+        --url postgresql://localhost/invest_bench \
+        --url sqlite:///bench.db \
+        --url duckdb:///bench.duckdb
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+MONTHS = [y * 100 + m for y in range(2019, 2025) for m in range(1, 13)]
+BASE_PRICE = {1: 100000, 2: 60000, 3: 250}
+
+
+def seed(supabase, execute_sql, apts, batch_size=5000):
+    """apts개 아파트 x 평형 2개 x 거래유형 3개 APTInfo 행과 월별 시세 적재"""
+    rnd = random.Random(0)
+    rows = [{
+        'name': f'아파트{i}', 'PY': py, 'DEAL_TYPE': str(dt), 'seq': str(1000 + i), 'description': '',
+        'price_trend': '[]', 'status': 1, 'year': 200001 + (i % 24) * 100, 'address': '서울 송파구',
+    } for i in range(apts) for py in ('25', '34') for dt in (1, 2, 3)]
+    for i in range(0, len(rows), batch_size):
+        supabase.table('APTInfo').upsert(rows[i:i + batch_size]).execute()
+    execute_sql('''
+        UPDATE "APTInfo" SET apt_id = (
+            SELECT MIN(b.id) FROM "APTInfo" b WHERE b.name = "APTInfo".name AND b."PY" = "APTInfo"."PY"
+        )
+    ''')
+
+    apt_ids = [r['apt_id'] for r in execute_sql('SELECT DISTINCT apt_id FROM "APTInfo" ORDER BY apt_id').data]
+    batch = []
+    for apt_id in apt_ids:
+        for dt, base in BASE_PRICE.items():
+            for yyyymm in MONTHS:
+                if rnd.random() < 0.3:
+                    continue
+                avg = base * rnd.uniform(0.9, 1.1)
+                batch.append({'apt_id': apt_id, 'deal_type': dt, 'yyyymm': yyyymm,
+                              'avg': avg, 'min': avg * 0.95, 'max': avg * 1.05, 'cnt': rnd.randint(1, 10)})
+                if len(batch) >= batch_size:
+                    supabase.table('price_monthly').upsert(batch, on_conflict='apt_id, deal_type, yyyymm').execute()
+                    batch = []
+    if batch:
+        supabase.table('price_monthly').upsert(batch, on_conflict='apt_id, deal_type, yyyymm').execute()
+
+
+def timed(fn, repeat):
+    """반복 실행 시간(ms) 중앙값"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def worker(apts, repeat):
+    """DATABASE_URL 환경변수의 백엔드에서 측정하고 결과를 JSON 한 줄로 출력"""
+    from local_db import BACKEND, supabase, execute_sql
+    from schema import bootstrap
+    from last_per import ensure_last_per_table, refresh_last_per
+    from get_apt_data import get_apt_list
+
+    bootstrap()
+    ensure_last_per_table()
+    seed_ms = 0.0
+    if not execute_sql('SELECT COUNT(*) AS n FROM "APTInfo"').data[0]['n']:
+        start = time.perf_counter()
+        seed(supabase, execute_sql, apts)
+        seed_ms = (time.perf_counter() - start) * 1000
+
+    result = {
+        'backend': BACKEND,
+        'series': execute_sql('SELECT COUNT(*) AS n FROM "APTInfo"').data[0]['n'],
+        'months': execute_sql('SELECT COUNT(*) AS n FROM price_monthly').data[0]['n'],
+        'seed_ms': round(seed_ms, 1),
+        'get_apt_list_ms': round(timed(get_apt_list, repeat), 1),
+        'per_job_ms': round(timed(refresh_last_per, repeat), 1),
+    }
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DB 백엔드별 벤치마크")
+    parser.add_argument('--url', action='append', default=[], help="측정할 DATABASE_URL (여러 번 지정)")
+    parser.add_argument('--apts', type=int, default=1000, help="빈 DB에 적재할 아파트 수")
+    parser.add_argument('--repeat', type=int, default=5, help="측정 반복 횟수")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.apts, args.repeat)
+        sys.exit(0)
+
+    print(f"{'backend':<12}{'series':>8}{'months':>10}{'seed(ms)':>12}{'get_apt_list(ms)':>18}{'PER job(ms)':>14}")
+    for url in args.url:
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--worker', '--apts', str(args.apts), '--repeat', str(args.repeat)],
+            env=dict(os.environ, DATABASE_URL=url), capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"{url}: 실패\n{proc.stderr[-2000:]}")
+            continue
+        r = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"{r['backend']:<12}{r['series']:>8}{r['months']:>10}{r['seed_ms']:>12}"
+              f"{r['get_apt_list_ms']:>18}{r['per_job_ms']:>14}")
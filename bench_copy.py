@@ -0,0 +1,91 @@
+"""
+대량 적재 벤치마크: 행 단위 insert() vs 배치 upsert() vs copy_rows()
+
+price_monthly와 같은 컬럼의 bench_copy 테이블을 만들어서 합성 월별 시세를 적재하고 초당 행 수를 비교한다.
+행 단위 insert는 느려서 --insert-rows 행만 측정한다. 끝나면 bench_copy 테이블을 지운다.
+
+사용법:
+    python bench_copy.py --rows 200000
+"""
+import argparse
+import random
+import time
+
+from dotenv import load_dotenv
+
+from price_monthly import DDL as MONTHLY_DDL, MONTHLY_COLUMNS, MONTHLY_TABLE
+
+# Load environment variables from the .env file
+load_dotenv()
+
+# 로컬 DB 사용
+from local_db import BACKEND, supabase, execute_sql, copy_rows
+
+BENCH_TABLE = 'bench_copy'
+
+
+def synthetic_rows(n, seed=0):
+    """apt_id x 거래유형 x 월 순서의 합성 월별 시세 n행 (제너레이터)"""
+    rnd = random.Random(seed)
+    months = [y * 100 + m for y in range(2006, 2025) for m in range(1, 13)]
+    for i in range(n):
+        avg = rnd.uniform(50000, 200000)
+        yield {
+            'apt_id': i // (3 * len(months)) + 1,
+            'deal_type': i // len(months) % 3 + 1,
+            'yyyymm': months[i % len(months)],
+            'avg': avg, 'min': avg * 0.95, 'max': avg * 1.05, 'cnt': rnd.randint(1, 10),
+        }
+
+
+def reset_table():
+    execute_sql(f'DROP TABLE IF EXISTS {BENCH_TABLE}')
+    execute_sql(MONTHLY_DDL[0].replace(MONTHLY_TABLE, BENCH_TABLE))
+
+
+def timed(label, n, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28}{n:>10}{elapsed:>10.2f}{n / elapsed:>14,.0f}")
+
+
+def bench(rows, insert_rows, batch_size):
+    print(f"backend: {BACKEND}")
+    print(f"{'방식':<28}{'행 수':>10}{'초':>10}{'행/초':>14}")
+
+    reset_table()
+    timed('insert() 행 단위', insert_rows,
+          lambda: [supabase.table(BENCH_TABLE).insert(r).execute() for r in synthetic_rows(insert_rows)])
+
+    reset_table()
+
+    def upsert_batches():
+        batch = []
+        for r in synthetic_rows(rows):
+            batch.append(r)
+            if len(batch) >= batch_size:
+                supabase.table(BENCH_TABLE).upsert(batch, on_conflict='apt_id, deal_type, yyyymm').execute()
+                batch = []
+        if batch:
+            supabase.table(BENCH_TABLE).upsert(batch, on_conflict='apt_id, deal_type, yyyymm').execute()
+    timed(f'upsert() {batch_size}행 배치', rows, upsert_batches)
+
+    reset_table()
+    timed('copy_rows()', rows, lambda: copy_rows(BENCH_TABLE, MONTHLY_COLUMNS, synthetic_rows(rows)))
+    # 이미 있는 행을 다시 넣기: 스테이징 테이블 + ON CONFLICT 병합
+    timed('copy_rows() 스테이징 병합', rows,
+          lambda: copy_rows(BENCH_TABLE, MONTHLY_COLUMNS, synthetic_rows(rows, seed=1),
+                            on_conflict='apt_id, deal_type, yyyymm'))
+
+    execute_sql(f'DROP TABLE IF EXISTS {BENCH_TABLE}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="대량 적재 벤치마크")
+    parser.add_argument('--rows', type=int, default=200000, help="배치 upsert / COPY로 넣을 행 수")
+    parser.add_argument('--insert-rows', type=int, default=2000, help="행 단위 insert로 넣을 행 수")
+    parser.add_argument('--batch-size', type=int, default=1000, help="upsert 배치 크기")
+    args = parser.parse_args()
+
+    bench(args.rows, args.insert_rows, args.batch_size)
@@ -0,0 +1,73 @@
+"""
+PER 계산 벤치마크: 아파트별 align_series 반복 vs per_panel 벡터화 계산
+
+합성 매매/월세 월별 시세(2006~2024년, 달마다 70% 확률로 거래)로
+- 아파트별: price_trend 형식 리스트 -> apt_analytics.align_series -> 최근 6개월 평균/PER (--sample개만 돌리고 전체로 환산)
+- 패널: build_panel + last_per_frame 한 번
+을 측정하고, 샘플 아파트의 결과가 같은지 확인한다.
+
+사용법:
+    python bench_per_panel.py --apts 1000 10000
+"""
+import argparse
+import random
+import time
+
+import pandas as pd
+
+from apt_analytics import align_series, recent_means
+from per_panel import build_panel, last_per_frame
+from save_last_PER import same_per
+
+MONTHS = [y * 100 + m for y in range(2006, 2025) for m in range(1, 13)]
+
+
+def synthetic_long(apts, seed=0):
+    """apt_id, deal_type, yyyymm, avg 긴 형식 DataFrame"""
+    rnd = random.Random(seed)
+    rows = [(apt_id, dt, yyyymm, base * rnd.uniform(0.9, 1.1))
+            for apt_id in range(1, apts + 1)
+            for dt, base in ((1, 100000), (3, 250))
+            for yyyymm in MONTHS if rnd.random() < 0.7]
+    return pd.DataFrame(rows, columns=['apt_id', 'deal_type', 'yyyymm', 'avg'])
+
+
+def per_apartment(long, apt_ids):
+    """아파트마다 align_series 호출"""
+    result = {}
+    for apt_id, g in long[long['apt_id'].isin(apt_ids)].groupby('apt_id'):
+        dataset1 = [{'date': str(r.yyyymm), 'avg': r.avg, 'cnt': 1} for r in g[g['deal_type'] == 1].itertuples()]
+        dataset3 = [{'date': str(r.yyyymm), 'avg': r.avg, 'cnt': 1} for r in g[g['deal_type'] == 3].itertuples()]
+        df = align_series(sale=dataset1, rent=dataset3)
+        result[apt_id] = (*recent_means(df), df['PER'].iloc[-1])
+    return result
+
+
+def bench(apts, sample):
+    long = synthetic_long(apts)
+    sample_ids = list(range(1, min(sample, apts) + 1))
+
+    start = time.perf_counter()
+    expected = per_apartment(long, sample_ids)
+    old_s = (time.perf_counter() - start) / len(sample_ids) * apts
+
+    start = time.perf_counter()
+    frame = last_per_frame(build_panel(long)).set_index('apt_id')
+    new_s = time.perf_counter() - start
+
+    mismatches = sum(
+        1 for apt_id, (price, rent, per) in expected.items()
+        if abs(frame.loc[apt_id, 'last_avg_price'] - price) > 0.1 or frame.loc[apt_id, 'last_avg_rent'] != rent
+        or not same_per(frame.loc[apt_id, 'last_PER'], per))
+    print(f"{apts:>8}{len(long):>12,}{old_s:>16.2f}{new_s:>12.3f}{old_s / new_s:>10.0f}x{mismatches:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PER 계산 벤치마크")
+    parser.add_argument('--apts', type=int, nargs='+', default=[1000, 10000], help="아파트 수 (여러 개 가능)")
+    parser.add_argument('--sample', type=int, default=200, help="아파트별 방식으로 실제로 계산할 아파트 수")
+    args = parser.parse_args()
+
+    print(f"{'아파트':>8}{'월 행':>12}{'아파트별(초, 환산)':>16}{'패널(초)':>12}{'배속':>11}{'불일치':>10}")
+    for n in args.apts:
+        bench(n, args.sample)
@@ -1,10 +1,17 @@
-import json
 import streamlit as st
+import logging
 import os
 from dotenv import load_dotenv
 
+from apt_analytics import COLUMNS, align_series
+from price_dense import OBSERVED_COLUMNS, load_dense
+from price_monthly import get_series
+from price_trend_store import get_price_trend
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # 로컬 DB 사용 여부 확인 (SUPABASE_URL이 없으면 로컬 DB 사용)
 def _check_use_local_db():
     if os.environ.get("SUPABASE_URL"):
@@ -27,56 +34,68 @@ else:
     supabase: Client = create_client(url, key)
 
 
-def get_apt_data(apt_display_name):
+def get_apt_data(apt, start=None, end=None):
     """
     아파트 데이터를 가져오는 함수
-    apt_display_name: "아파트이름 (평형평)" 형식의 문자열
+    apt: unit id (get_apt_list()의 'id'), 예전 방식의 "아파트이름 (평형평)" 문자열도 받는다
+    start/end: 'YYYYMM' 조회 기간 (포함), None이면 전체
+    price_monthly 테이블에서 읽고, 아직 옮겨지지 않은 시리즈는 APTInfo.price_trend에서 기간만 잘라서 읽는다
     """
     try:
-        # 표시 이름에서 실제 이름과 평형 추출
-        # "아파트이름 (평형평)" 형식에서 마지막 괄호를 기준으로 파싱
-        # 예: "래미안슈르(301~342동) (34평)" -> name: "래미안슈르(301~342동)", PY: "34"
-        last_paren_idx = apt_display_name.rfind(" (")
-        if last_paren_idx != -1:
-            apt_name = apt_display_name[:last_paren_idx]
-            PY = apt_display_name[last_paren_idx+2:].split("평")[0]
+        if isinstance(apt, str):
+            # 표시 이름에서 실제 이름과 평형 추출
+            # "아파트이름 (평형평)" 형식에서 마지막 괄호를 기준으로 파싱
+            # 예: "래미안슈르(301~342동) (34평)" -> name: "래미안슈르(301~342동)", PY: "34"
+            last_paren_idx = apt.rfind(" (")
+            if last_paren_idx != -1:
+                apt_name = apt[:last_paren_idx]
+                PY = apt[last_paren_idx+2:].split("평")[0]
+            else:
+                # 폴백: 기존 방식
+                apt_name = apt.split(" (")[0]
+                PY = apt.split("(")[1].split("평")[0]
+            rows = supabase.table('APTInfo').select('id, name, PY, DEAL_TYPE, apt_id').eq('name', apt_name).eq('PY', PY).execute().data or []
+            apt_id = min((r['apt_id'] for r in rows if r.get('apt_id') is not None), default=None)
         else:
-            # 폴백: 기존 방식
-            apt_name = apt_display_name.split(" (")[0]
-            PY = apt_display_name.split("(")[1].split("평")[0]
-        
-        def parse_price_trend(data):
-            """price_trend를 파싱하는 헬퍼 함수 - 이미 리스트면 그대로 반환"""
-            if data is None:
-                return []
-            if isinstance(data, list):
-                return data
-            if isinstance(data, str):
-                return json.loads(data)
-            return []
-
-        # 매매 데이터 가져오기 (DEAL_TYPE = '1')
-        response = supabase.table('APTInfo').select('*').eq('name', apt_name).eq('PY', PY).eq('DEAL_TYPE', '1').limit(1).single().execute()
-        res1 = response.data
-        dataset1 = parse_price_trend(res1['price_trend']) if res1 else []
-
-        # 전세 데이터 가져오기 (DEAL_TYPE = '2')
-        response = supabase.table('APTInfo').select('*').eq('name', apt_name).eq('PY', PY).eq('DEAL_TYPE', '2').limit(1).single().execute()
-        res2 = response.data
-        dataset2 = parse_price_trend(res2['price_trend']) if res2 else []
-
-        # 월세 데이터 가져오기 (DEAL_TYPE = '3')
-        response = supabase.table('APTInfo').select('*').eq('name', apt_name).eq('PY', PY).eq('DEAL_TYPE', '3').limit(1).single().execute()
-        res3 = response.data
-        dataset3 = parse_price_trend(res3['price_trend']) if res3 else []
-        
-        return apt_name, PY, dataset1, dataset2, dataset3
-        
+            # 거래유형별 행을 apt_id 인덱스로 한 번에 조회 (price_trend JSON은 받지 않음)
+            apt_id = int(apt)
+            rows = supabase.table('APTInfo').select('id, name, PY, DEAL_TYPE').eq('apt_id', apt_id).execute().data or []
+            if not rows:
+                return None, None, [], [], []
+            apt_name, PY = rows[0]['name'], rows[0]['PY']
+
+        series = get_series(supabase, apt_id, start, end) if apt_id is not None else {1: [], 2: [], 3: []}
+
+        datasets = []
+        for deal_type in (1, 2, 3):
+            dataset = series[deal_type]
+            row = next((r for r in rows if r['DEAL_TYPE'] == str(deal_type)), None)
+            if not dataset and row:
+                # price_monthly에 없으면 price_trend jsonb에서 기간만 잘라서 가져온다
+                dataset = get_price_trend(supabase, row['id'], start, end)
+            datasets.append(dataset)
+
+        return apt_name, PY, datasets[0], datasets[1], datasets[2]
+
     except Exception as e:
         print(f"아파트 데이터 조회 중 오류 발생: {e}")
         return None, None, [], [], []
 
 
+def get_apt_frame(apt_id, start=None, end=None):
+    """
+    빈 달을 채워 저장해 둔 시세 프레임 (price_dense.load_dense: 매매가/전세/월세, 거래량, 관측 여부, PER)
+    price_dense에 아직 없는 아파트는 get_apt_data + align_series로 맞추고 거래량이 있는 달을 관측으로 본다
+    """
+    df = load_dense(supabase, apt_id, start, end)
+    if df.empty:
+        _, _, dataset1, dataset2, dataset3 = get_apt_data(apt_id, start, end)
+        df = align_series(sale=dataset1, jeonse=dataset2, rent=dataset3)
+        for name, col in OBSERVED_COLUMNS.items():
+            df[col] = df[COLUMNS[name][1]] > 0
+    return df
+
+
 # TODO: sqlalchemy로 SQL 부분 정리하기
 def extract_and_save_year(description):
     """
@@ -126,18 +145,25 @@ def update_apt_year():
 
 def get_apt_list():
     """
-    아파트 목록을 name, year, PY, address와 함께 반환하는 함수
+    아파트 목록을 id(unit id), name, year, PY, address와 함께 반환하는 함수
     status=1인 (활성화된) 아파트만 반환
+    apt_id가 없는 예전 행은 get_apt_data로 조회할 수 없으므로 빼고 경고를 남긴다 (migrate_price_monthly.py로 채움)
     """
     try:
-        data = supabase.table('APTInfo').select('name, year, PY, address').eq('status', 1).execute().data
-        # 중복 제거 및 정렬 (이름과 평형을 함께 고려)
+        data = supabase.table('APTInfo').select('name, year, PY, address, apt_id').eq('status', 1).execute().data
+        missing = sorted({f"{d['name']} ({d['PY']}평)" for d in data if d.get('apt_id') is None})
+        if missing:
+            logger.warning("apt_id 없는 아파트 %d개 제외 (migrate_price_monthly.py 실행 필요): %s",
+                           len(missing), ', '.join(missing[:10]))
+        # 중복 제거 및 정렬 (unit id 기준)
         unique_apts = {}
         for d in data:
-            # 이름과 평형을 함께 키로 사용
-            key = f"{d['name']}_{d['PY']}"
+            key = d.get('apt_id')
+            if key is None:
+                continue
             if key not in unique_apts or d.get('year', 0) < unique_apts[key].get('year', float('inf')):
                 unique_apts[key] = {
+                    'id': key,  # get_apt_data에 넘길 unit id
                     'name': f"{d['name']} ({d['PY']}평)",  # 표시될 때는 평형 정보 포함
                     'original_name': d['name'],  # 원래 이름은 따로 저장
                     'year': d.get('year', 0),
@@ -0,0 +1,194 @@
+"""
+APTLastPER 계산 (DB에서 한 번의 INSERT ... SELECT)
+
+price_monthly의 매매(1)/월세(3) 월별 시세를 아파트/평형(apt_id)별로 모아서
+- 매매/월세 중 하나라도 있는 달을 날짜순으로 놓고 빈 값은 이전 달 값으로 채운다 (없으면 0)
+- 최근 6개 달의 평균 매매가(억원, 소수 첫째 자리)와 평균 월세(만원, 정수)
+- 마지막 달의 PER = 매매가 / (월세 * 12), 월세가 0이면 NULL
+을 계산해서 apt_id(unit.id) 기준으로 upsert 한다. save_last_PER.load_data와 같은 계산이다.
+
+수집(update_apt_data.py, backfill_apt_data.py)이 끝나면 refresh_last_per()를 호출한다.
+refresh_dirty_per()는 price_change 변경 로그에서 지난 계산 이후 매매/월세가 바뀐 아파트만 다시 계산한다
+(커서는 change_cursor의 'last_per', 커서가 없거나 full이면 전체).
+Home.py는 계산된 APTLastPER 테이블만 읽는다.
+스크리닝(screening.py)용으로 주소/준공년월/평형(숫자)을 같이 저장하고, apt_screen 뷰로 활성 아파트만 보여준다.
+job이 끝날 때 snapshot_per()로 APTLastPER 전체를 per_daily 일별 스냅샷에 한 번 남긴다 (per_history.py).
+(refresh_last_per/refresh_dirty_per는 계산만 한다, 한 job에서 여러 번 불러도 스냅샷은 한 번)
+"""
+import logging
+from datetime import date
+
+from local_db import BACKEND, supabase, execute_sql
+from per_history import DDL as HISTORY_DDL, SNAPSHOT_SQL, partition_sql
+from price_changes import changed_apt_ids, pending_changes, save_cursor
+
+logger = logging.getLogger(__name__)
+
+CONSUMER = 'last_per'
+
+# apt_id가 없는 예전 행은 name/PY로 채우고 (못 채우면 지운다, 다음 계산 때 다시 만들어짐)
+# 중복 행은 가장 최근 행만 남기고 apt_id 유니크 인덱스를 만든다
+ENSURE_SQL = [
+    'ALTER TABLE "APTLastPER" ADD COLUMN IF NOT EXISTS apt_id INTEGER',
+    '''
+    UPDATE "APTLastPER" l SET apt_id = a.apt_id
+    FROM (SELECT name, "PY", MIN(apt_id) AS apt_id FROM "APTInfo" GROUP BY name, "PY") a
+    WHERE l.apt_id IS NULL AND l.apt_name = a.name AND l."apt_PY" = a."PY"
+    ''',
+    'DELETE FROM "APTLastPER" WHERE apt_id IS NULL',
+    'DELETE FROM "APTLastPER" a USING "APTLastPER" b WHERE a.apt_id = b.apt_id AND a.id < b.id',
+    'CREATE UNIQUE INDEX IF NOT EXISTS "APTLastPER_apt_id_key" ON "APTLastPER" (apt_id)',
+    'DROP INDEX IF EXISTS "APTLastPER_name_py_key"',
+    'DROP INDEX IF EXISTS "APTLastPER_name_py"',
+    # 스크리닝 컬럼 (예전 행은 여기서 채우고, 이후에는 REFRESH_SQL이 채운다)
+    'ALTER TABLE "APTLastPER" ADD COLUMN IF NOT EXISTS address TEXT',
+    'ALTER TABLE "APTLastPER" ADD COLUMN IF NOT EXISTS year INTEGER',
+    'ALTER TABLE "APTLastPER" ADD COLUMN IF NOT EXISTS area_py REAL',
+    '''
+    UPDATE "APTLastPER" l SET address = a.address, year = a.year, area_py = CAST(a."PY" AS REAL)
+    FROM (SELECT apt_id, MIN(address) AS address, MIN(year) AS year, MIN("PY") AS "PY"
+          FROM "APTInfo" GROUP BY apt_id) a
+    WHERE l.area_py IS NULL AND l.apt_id = a.apt_id
+    ''',
+]
+
+# 스크리닝: PER 순 정렬 + LIMIT를 인덱스 순서로 읽는다 (지역을 고르면 지역 인덱스)
+SCREEN_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS "APTLastPER_PER" ON "APTLastPER" ("last_PER", apt_id)',
+    'CREATE INDEX IF NOT EXISTS "APTLastPER_address_PER" ON "APTLastPER" (address, "last_PER", apt_id)',
+]
+
+# 활성(status = 1) 아파트의 APTLastPER, 지역별 개수/준공/평형 범위 (필터 선택지용)
+SCREEN_VIEWS = [
+    '''
+    apt_screen AS
+    SELECT l.apt_id, l.apt_name, l."apt_PY", l.area_py, l.address, l.year,
+           l.last_avg_price, l.last_avg_rent, l."last_PER", l.updated
+    FROM "APTLastPER" l
+    WHERE EXISTS (SELECT 1 FROM "APTInfo" a WHERE a.apt_id = l.apt_id AND a.status = 1)
+    ''',
+    '''
+    apt_screen_regions AS
+    SELECT address, COUNT(*) AS n, MIN(year) AS min_year, MAX(year) AS max_year,
+           MIN(area_py) AS min_py, MAX(area_py) AS max_py
+    FROM apt_screen
+    WHERE address IS NOT NULL
+    GROUP BY address
+    ''',
+]
+
+# {apt_filter}: 일부 apt_id만 계산할 때의 조건 (Postgres, SQLite, DuckDB 공통 문법)
+REFRESH_SQL = '''
+    WITH apts AS (
+        SELECT apt_id, MIN(name) AS name, MIN("PY") AS py, MIN(address) AS address, MIN(year) AS year
+        FROM "APTInfo"
+        WHERE status = 1 AND apt_id IS NOT NULL {apt_filter}
+        GROUP BY apt_id
+    ),
+    months AS (
+        SELECT m.apt_id, m.yyyymm,
+               MAX(m.avg) FILTER (WHERE m.deal_type = 1) AS price,
+               MAX(m.avg) FILTER (WHERE m.deal_type = 3) AS rent
+        FROM price_monthly m JOIN apts USING (apt_id)
+        WHERE m.deal_type IN (1, 3)
+        GROUP BY m.apt_id, m.yyyymm
+    ),
+    grouped AS (
+        -- 값이 있는 달마다 그룹 번호가 1씩 늘어나므로, 같은 그룹 안의 값이 직전 값이다
+        SELECT apt_id, yyyymm, price, rent,
+               COUNT(price) OVER w AS price_grp,
+               COUNT(rent) OVER w AS rent_grp,
+               ROW_NUMBER() OVER (PARTITION BY apt_id ORDER BY yyyymm DESC) AS rn
+        FROM months
+        WINDOW w AS (PARTITION BY apt_id ORDER BY yyyymm)
+    ),
+    filled AS (
+        SELECT apt_id, rn,
+               COALESCE(MAX(price) OVER (PARTITION BY apt_id, price_grp), 0) AS price,
+               COALESCE(MAX(rent) OVER (PARTITION BY apt_id, rent_grp), 0) AS rent
+        FROM grouped
+    )
+    INSERT INTO "APTLastPER" (apt_id, apt_name, "apt_PY", address, year, area_py,
+                              last_avg_price, last_avg_rent, "last_PER", updated)
+    SELECT a.apt_id, a.name, a.py, a.address, a.year, CAST(a.py AS REAL),
+           ROUND(CAST(AVG(f.price) / 10000 AS NUMERIC), 1),
+           CAST(FLOOR(AVG(f.rent)) AS INTEGER),
+           MAX(f.price / NULLIF(f.rent * 12, 0)) FILTER (WHERE f.rn = 1),
+           CURRENT_TIMESTAMP
+    FROM filled f JOIN apts a USING (apt_id)
+    WHERE f.rn <= 6
+    GROUP BY a.apt_id, a.name, a.py, a.address, a.year
+    ON CONFLICT (apt_id) DO UPDATE SET
+        apt_name = EXCLUDED.apt_name,
+        "apt_PY" = EXCLUDED."apt_PY",
+        address = EXCLUDED.address,
+        year = EXCLUDED.year,
+        area_py = EXCLUDED.area_py,
+        last_avg_price = EXCLUDED.last_avg_price,
+        last_avg_rent = EXCLUDED.last_avg_rent,
+        "last_PER" = EXCLUDED."last_PER",
+        updated = EXCLUDED.updated
+    RETURNING apt_id
+'''
+
+
+def ensure_screen_views(run_sql=execute_sql):
+    # Postgres는 CREATE VIEW IF NOT EXISTS가 없고, SQLite는 CREATE OR REPLACE VIEW가 없다
+    prefix = 'CREATE OR REPLACE VIEW ' if BACKEND == 'postgresql' else 'CREATE VIEW IF NOT EXISTS '
+    for sql in SCREEN_INDEXES:
+        run_sql(sql)
+    for sql in SCREEN_VIEWS:
+        run_sql(prefix + sql)
+
+
+def ensure_last_per_table():
+    # SQLite/DuckDB 파일은 schema.py bootstrap이 유니크 인덱스와 스크리닝 뷰까지 만든다
+    if BACKEND != 'postgresql':
+        return
+    for sql in ENSURE_SQL + HISTORY_DDL:
+        execute_sql(sql)
+    ensure_screen_views()
+
+
+def snapshot_per(day=None):
+    """APTLastPER 전체를 day(기본 오늘) 스냅샷으로 per_daily에 저장"""
+    day = day or date.today()
+    if BACKEND == 'postgresql':
+        execute_sql(partition_sql(day))
+    execute_sql(SNAPSHOT_SQL, {'day': day.isoformat()})
+
+
+def refresh_last_per(apt_ids=None):
+    """
+    APTLastPER 다시 계산
+    apt_ids: 일부 아파트/평형만 계산할 때 apt_id 리스트 (None이면 전체)
+    반환값: 갱신된 행 수
+    """
+    params = {}
+    apt_filter = ''
+    if apt_ids is not None:
+        params = {f'apt_id_{i}': apt_id for i, apt_id in enumerate(apt_ids)}
+        apt_filter = f"AND apt_id IN ({', '.join(':' + k for k in params)})" if params else 'AND 1 = 0'
+    rows = execute_sql(REFRESH_SQL.format(apt_filter=apt_filter), params).data
+    logger.info("APTLastPER %d개 갱신", len(rows))
+    return len(rows)
+
+
+def refresh_dirty_per(full=False):
+    """
+    지난 계산 이후 매매(1)/월세(3) 시리즈가 바뀐 아파트만 APTLastPER 다시 계산
+    full이거나 처음 실행(커서 없음)이면 전체
+    반환값: (다시 계산한 아파트 수, 건너뛴 아파트 수)
+    """
+    changes, cursor = pending_changes(supabase, CONSUMER, full)
+    apt_ids = None
+    if changes is not None:
+        apt_ids = changed_apt_ids([c for c in changes if c['deal_type'] in (1, 3)])
+
+    n = refresh_last_per(apt_ids)
+    active = execute_sql(
+        'SELECT COUNT(DISTINCT apt_id) AS n FROM "APTInfo" WHERE status = 1 AND apt_id IS NOT NULL').data[0]['n']
+    # 계산이 끝난 뒤에 커서를 옮겨야 실패한 실행의 변경을 다음 실행이 다시 읽는다
+    save_cursor(supabase, CONSUMER, cursor)
+    logger.info("APTLastPER %s: 다시 계산 %d개, 건너뜀 %d개", '전체' if apt_ids is None else '변경분', n, max(active - n, 0))
+    return n, max(active - n, 0)
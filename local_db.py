@@ -1,7 +1,17 @@
 """
-로컬 PostgreSQL 데이터베이스 연결 모듈
+로컬 데이터베이스 연결 모듈
+
+DATABASE_URL 스킴으로 백엔드를 고른다
+- postgresql://localhost/invest_info (기본)
+- sqlite:///invest_info.db
+- duckdb:///invest_info.duckdb (duckdb, duckdb-engine 패키지 필요)
+
+SQLite/DuckDB 파일은 schema.py bootstrap으로 만든다.
+Postgres 함수(merge_price_trend, price_trend_window)는 임베디드 백엔드에서는 파이썬으로 대신 실행한다.
+수십만 행 적재(마이그레이션, 백필)는 insert/upsert 대신 copy_rows()로 COPY FROM STDIN 한다.
 """
 import json
+from itertools import islice
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 import os
@@ -15,6 +25,69 @@ DATABASE_URL = os.environ.get(
 engine = create_engine(DATABASE_URL)
 Session = sessionmaker(bind=engine)
 
+# 'postgresql', 'sqlite', 'duckdb'
+BACKEND = engine.dialect.name
+
+# 대소문자 구분이 필요한 컬럼명 (쌍따옴표로 감싸야 함)
+CASE_SENSITIVE_COLS = ["PY", "DEAL_TYPE", "last_PER", "apt_PY"]
+
+
+def _quote_col(col):
+    """대소문자 구분이 필요한 컬럼명을 쌍따옴표로 감싸기"""
+    col = col.strip()
+    if col in CASE_SENSITIVE_COLS:
+        return f'"{col}"'
+    return col
+
+
+def _adapt(val):
+    """dict/list 값은 JSON 문자열로 넘긴다 (jsonb 컬럼/함수 인자용, Supabase 클라이언트와 같은 입력 형식)"""
+    if isinstance(val, (dict, list)):
+        return json.dumps(val, ensure_ascii=False)
+    return val
+
+
+def _build_where(conditions, prefix):
+    """
+    (컬럼, 연산자, 값) 조건 리스트로 WHERE 절과 파라미터 생성
+    연산자가 IN / NOT IN이면 값 리스트를 각각 파라미터로 펼친다
+    """
+    where_clauses = []
+    params = {}
+    for i, (col, op, val) in enumerate(conditions):
+        param_name = f"{prefix}_{i}"
+        if op in ("IN", "NOT IN"):
+            names = [f"{param_name}_{j}" for j in range(len(val))]
+            if not names:
+                where_clauses.append("FALSE" if op == "IN" else "TRUE")
+                continue
+            where_clauses.append(f"{_quote_col(col)} {op} ({', '.join(':' + n for n in names)})")
+            params.update(zip(names, val))
+        else:
+            where_clauses.append(f"{_quote_col(col)} {op} :{param_name}")
+            params[param_name] = val
+    return " WHERE " + " AND ".join(where_clauses), params
+
+
+def _conflict_sql(keys, on_conflict, ignore_duplicates=False):
+    """upsert용 ON CONFLICT 절 (on_conflict: '컬럼1, 컬럼2', 충돌하면 나머지 컬럼을 새 값으로)"""
+    if not on_conflict:
+        return ""
+    conflict_cols = [c.strip() for c in on_conflict.split(',')]
+    target = ", ".join(_quote_col(c) for c in conflict_cols)
+    update_cols = [k for k in keys if k not in conflict_cols]
+    if ignore_duplicates or not update_cols:
+        return f" ON CONFLICT ({target}) DO NOTHING"
+    sets = ", ".join(f"{_quote_col(k)} = EXCLUDED.{_quote_col(k)}" for k in update_cols)
+    return f" ON CONFLICT ({target}) DO UPDATE SET {sets}"
+
+
+def _execute_count(session, sql, params):
+    """UPDATE/DELETE 실행 후 변경된 행 수 (DuckDB는 rowcount를 주지 않아서 RETURNING으로 센다)"""
+    if BACKEND == "duckdb":
+        return len(session.execute(text(sql + " RETURNING 1"), params).fetchall())
+    return session.execute(text(sql), params).rowcount
+
 
 class LocalSupabaseClient:
     """
@@ -23,28 +96,84 @@ class LocalSupabaseClient:
     def table(self, table_name):
         return TableQuery(table_name)
 
+    def rpc(self, fn, params=None):
+        """DB 함수 호출 (Supabase rpc와 동일)"""
+        return RpcQuery(fn, params)
+
+
+# not_ 다음 필터의 반대 연산자
+NEGATED_OPS = {"=": "<>", ">": "<=", ">=": "<", "<=": ">", "IN": "NOT IN"}
+
+
+class FilterMixin:
+    """
+    eq / gt / gte / lte / in_ / not_ 필터 (Supabase postgrest 빌더와 같은 이름)
+    예: .eq('apt_id', 1).gte('yyyymm', 202401), .not_.in_('yyyymm', [202401, 202402])
+    """
+    _negate_next = False
+
+    def _add(self, col, op, val):
+        if self._negate_next:
+            self._negate_next = False
+            if op not in NEGATED_OPS:
+                raise ValueError(f"not_ 으로 뒤집을 수 없는 연산자: {op}")
+            op = NEGATED_OPS[op]
+        self._conditions.append((col, op, val))
+        return self
+
+    @property
+    def not_(self):
+        self._negate_next = True
+        return self
+
+    def eq(self, col, val):
+        return self._add(col, "=", val)
+
+    def gt(self, col, val):
+        return self._add(col, ">", val)
+
+    def gte(self, col, val):
+        return self._add(col, ">=", val)
 
-class TableQuery:
+    def lte(self, col, val):
+        return self._add(col, "<=", val)
+
+    def in_(self, col, values):
+        return self._add(col, "IN", list(values))
+
+
+class TableQuery(FilterMixin):
     def __init__(self, table_name):
         self.table_name = table_name
         self._select_cols = "*"
         self._conditions = []
         self._limit_val = None
+        self._offset_val = None
+        self._order = []
         self._single = False
+        self._count = None
 
     def select(self, cols, count=None):
         self._select_cols = cols
-        # count 매개변수는 Supabase 호환을 위해 받지만 로컬에서는 무시
+        # count='exact'면 limit/range와 상관없이 필터에 맞는 전체 행 수를 QueryResult.count로 돌려준다
+        self._count = count
         return self
 
-    def eq(self, col, val):
-        self._conditions.append((col, val))
+    def order(self, col, desc=False):
+        """정렬 (Supabase와 같이 여러 번 호출하면 순서대로 적용)"""
+        self._order.append(f"{_quote_col(col)} {'DESC' if desc else 'ASC'}")
         return self
 
     def limit(self, n):
         self._limit_val = n
         return self
 
+    def range(self, start, end):
+        """start ~ end 번째 행 (0부터, end 포함, Supabase와 같음)"""
+        self._offset_val = start
+        self._limit_val = end - start + 1
+        return self
+
     def single(self):
         self._single = True
         self._limit_val = 1
@@ -52,11 +181,7 @@ class TableQuery:
 
     def _quote_column(self, col):
         """대소문자 구분이 필요한 컬럼명을 쌍따옴표로 감싸기"""
-        case_sensitive_cols = ["PY", "DEAL_TYPE", "last_PER", "apt_PY"]
-        col = col.strip()
-        if col in case_sensitive_cols:
-            return f'"{col}"'
-        return col
+        return _quote_col(col)
 
     def _process_select_cols(self, cols):
         """SELECT 절의 컬럼명들을 처리"""
@@ -73,21 +198,22 @@ class TableQuery:
             cols = self._process_select_cols(self._select_cols)
             sql = f'SELECT {cols} FROM "{self.table_name}"'
 
-            params = {}
+            where_sql, params = '', {}
             if self._conditions:
-                where_clauses = []
-                for i, (col, val) in enumerate(self._conditions):
-                    param_name = f"param_{i}"
-                    # 대소문자 구분되는 컬럼명 처리
-                    if col in ["PY", "DEAL_TYPE", "last_PER", "apt_PY"]:
-                        where_clauses.append(f'"{col}" = :{param_name}')
-                    else:
-                        where_clauses.append(f"{col} = :{param_name}")
-                    params[param_name] = val
-                sql += " WHERE " + " AND ".join(where_clauses)
+                where_sql, params = _build_where(self._conditions, "param")
+                sql += where_sql
+
+            count = None
+            if self._count == 'exact':
+                count = session.execute(text(f'SELECT COUNT(*) FROM "{self.table_name}"' + where_sql), params).scalar()
+
+            if self._order:
+                sql += " ORDER BY " + ", ".join(self._order)
 
             if self._limit_val:
                 sql += f" LIMIT {self._limit_val}"
+            if self._offset_val:
+                sql += f" OFFSET {self._offset_val}"
 
             result = session.execute(text(sql), params)
             rows = result.fetchall()
@@ -97,16 +223,23 @@ class TableQuery:
 
             if self._single:
                 return QueryResult(data[0] if data else None)
-            return QueryResult(data)
+            return QueryResult(data, count=count)
         finally:
             session.close()
 
-    def update(self, values):
+    def update(self, values, count=None):
+        # count 매개변수는 Supabase 호환을 위해 받으며, 로컬에서는 항상 변경된 행 수를 QueryResult.count로 돌려준다
         return UpdateQuery(self.table_name, values, self._conditions)
 
     def insert(self, values):
         return InsertQuery(self.table_name, values)
 
+    def delete(self):
+        return DeleteQuery(self.table_name, self._conditions)
+
+    def upsert(self, values, on_conflict=None, ignore_duplicates=False):
+        return UpsertQuery(self.table_name, values, on_conflict, ignore_duplicates)
+
 
 class InsertQuery:
     def __init__(self, table_name, values):
@@ -122,14 +255,51 @@ class InsertQuery:
 
             for i, (col, val) in enumerate(self.values.items()):
                 param_name = f"val_{i}"
-                if col in ["PY", "DEAL_TYPE", "last_PER", "apt_PY"]:
+                if col in CASE_SENSITIVE_COLS:
                     cols.append(f'"{col}"')
                 else:
                     cols.append(col)
                 placeholders.append(f":{param_name}")
-                params[param_name] = val
+                params[param_name] = _adapt(val)
+
+            # Supabase처럼 삽입된 행을 돌려준다
+            sql = f'INSERT INTO "{self.table_name}" ({", ".join(cols)}) VALUES ({", ".join(placeholders)}) RETURNING *'
+
+            result = session.execute(text(sql), params)
+            data = [dict(row._mapping) for row in result]
+            session.commit()
+            return QueryResult(data)
+        finally:
+            session.close()
+
+
+class UpsertQuery:
+    """
+    INSERT ... ON CONFLICT 로 동작하는 upsert
+    values는 dict 하나 또는 같은 키를 가진 dict 리스트를 받는다 (Supabase와 동일)
+    """
+    def __init__(self, table_name, values, on_conflict=None, ignore_duplicates=False):
+        self.table_name = table_name
+        self.rows = values if isinstance(values, list) else [values]
+        self.on_conflict = on_conflict
+        self.ignore_duplicates = ignore_duplicates
+
+    def execute(self):
+        if not self.rows:
+            return QueryResult([])
+
+        session = Session()
+        try:
+            keys = list(self.rows[0].keys())
+            cols = [_quote_col(k) for k in keys]
+            placeholders = [f":val_{i}" for i in range(len(keys))]
+            params = [
+                {f"val_{i}": _adapt(row[k]) for i, k in enumerate(keys)}
+                for row in self.rows
+            ]
 
             sql = f'INSERT INTO "{self.table_name}" ({", ".join(cols)}) VALUES ({", ".join(placeholders)})'
+            sql += _conflict_sql(keys, self.on_conflict, self.ignore_duplicates)
 
             session.execute(text(sql), params)
             session.commit()
@@ -138,16 +308,12 @@ class InsertQuery:
             session.close()
 
 
-class UpdateQuery:
+class UpdateQuery(FilterMixin):
     def __init__(self, table_name, values, conditions=None):
         self.table_name = table_name
         self.values = values
         self._conditions = conditions or []
 
-    def eq(self, col, val):
-        self._conditions.append((col, val))
-        return self
-
     def execute(self):
         session = Session()
         try:
@@ -156,35 +322,273 @@ class UpdateQuery:
 
             for i, (col, val) in enumerate(self.values.items()):
                 param_name = f"set_{i}"
-                if col in ["PY", "DEAL_TYPE", "last_PER", "apt_PY"]:
+                if col in CASE_SENSITIVE_COLS:
                     set_clauses.append(f'"{col}" = :{param_name}')
                 else:
                     set_clauses.append(f"{col} = :{param_name}")
-                params[param_name] = val
+                params[param_name] = _adapt(val)
 
             sql = f'UPDATE "{self.table_name}" SET ' + ", ".join(set_clauses)
 
             if self._conditions:
-                where_clauses = []
-                for i, (col, val) in enumerate(self._conditions):
-                    param_name = f"where_{i}"
-                    if col in ["PY", "DEAL_TYPE", "last_PER", "apt_PY"]:
-                        where_clauses.append(f'"{col}" = :{param_name}')
-                    else:
-                        where_clauses.append(f"{col} = :{param_name}")
-                    params[param_name] = val
-                sql += " WHERE " + " AND ".join(where_clauses)
+                where_sql, where_params = _build_where(self._conditions, "where")
+                sql += where_sql
+                params.update(where_params)
 
-            session.execute(text(sql), params)
+            count = _execute_count(session, sql, params)
             session.commit()
-            return QueryResult(None)
+            return QueryResult(None, count=count)
+        finally:
+            session.close()
+
+
+class DeleteQuery(FilterMixin):
+    def __init__(self, table_name, conditions=None):
+        self.table_name = table_name
+        self._conditions = list(conditions or [])
+
+    def execute(self):
+        if not self._conditions:
+            # 실수로 테이블 전체를 지우지 않도록 (Supabase도 조건 없는 delete를 거부한다)
+            raise ValueError("delete()에는 조건이 필요합니다")
+        session = Session()
+        try:
+            where_sql, params = _build_where(self._conditions, "where")
+            count = _execute_count(session, f'DELETE FROM "{self.table_name}"' + where_sql, params)
+            session.commit()
+            return QueryResult(None, count=count)
+        finally:
+            session.close()
+
+
+class RpcQuery:
+    """
+    SELECT * FROM fn(인자 => 값, ...)
+    스칼라를 돌려주는 함수는 값 하나, 테이블을 돌려주는 함수는 행 리스트 (Supabase rpc와 동일)
+    """
+    def __init__(self, fn, params=None):
+        self.fn = fn
+        self.params = params or {}
+
+    def execute(self):
+        if BACKEND != "postgresql":
+            return QueryResult(_EMBEDDED_RPC[self.fn](**self.params))
+        session = Session()
+        try:
+            args = ", ".join(f"{k} => :{k}" for k in self.params)
+            result = session.execute(text(f"SELECT * FROM {self.fn}({args})"),
+                                     {k: _adapt(v) for k, v in self.params.items()})
+            columns = list(result.keys())
+            rows = [dict(zip(columns, row)) for row in result.fetchall()]
+            session.commit()
+            if columns == [self.fn]:
+                return QueryResult(rows[0][self.fn] if rows else None)
+            return QueryResult(rows)
         finally:
             session.close()
 
 
 class QueryResult:
-    def __init__(self, data):
+    def __init__(self, data, count=None):
         self.data = data
+        self.count = count
+
+
+def execute_sql(sql, params=None):
+    """
+    빌더로 표현하기 어려운 SQL(DDL 등)을 직접 실행하는 함수
+    결과 행이 있으면 dict 리스트로 반환
+    """
+    session = Session()
+    try:
+        result = session.execute(text(sql), params or {})
+        data = [dict(row._mapping) for row in result] if result.returns_rows else []
+        session.commit()
+        return QueryResult(data)
+    finally:
+        session.close()
+
+
+COPY_BUFFER = 1 << 16
+_END = object()
+
+
+def _csv_field(val):
+    """COPY CSV 필드: None은 따옴표 없는 빈 값(NULL), 나머지는 항상 따옴표로 감싼다 (빈 문자열과 구분)"""
+    if val is None:
+        return ''
+    return '"' + str(_adapt(val)).replace('"', '""') + '"'
+
+
+class _CsvStream:
+    """행 이터러블을 COPY가 읽어 가는 파일처럼 감싼다 (읽어 갈 때 필요한 만큼만 행을 만든다)"""
+    def __init__(self, rows, columns):
+        self._rows = iter(rows)
+        self._columns = columns
+        self._buf = ''
+        self.count = 0
+
+    def read(self, size=-1):
+        size = COPY_BUFFER if size is None or size < 0 else size
+        parts = [self._buf]
+        n = len(self._buf)
+        while n < size:
+            row = next(self._rows, _END)
+            if row is _END:
+                break
+            if isinstance(row, dict):
+                row = [row[c] for c in self._columns]
+            line = ','.join(_csv_field(v) for v in row) + '\n'
+            parts.append(line)
+            n += len(line)
+            self.count += 1
+        data = ''.join(parts)
+        self._buf = data[size:]
+        return data[:size]
+
+
+def _insert_batches(table, columns, rows, on_conflict, ignore_duplicates, batch_size):
+    """COPY가 없는 백엔드용: batch_size행씩 executemany"""
+    sql = (f'INSERT INTO "{table}" ({", ".join(_quote_col(c) for c in columns)}) '
+           f'VALUES ({", ".join(f":val_{i}" for i in range(len(columns)))})'
+           + _conflict_sql(columns, on_conflict, ignore_duplicates))
+    rows = iter(rows)
+    total = 0
+    session = Session()
+    try:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            session.execute(text(sql), [
+                {f"val_{i}": _adapt(row[c] if isinstance(row, dict) else row[i]) for i, c in enumerate(columns)}
+                for row in batch
+            ])
+            total += len(batch)
+        session.commit()
+        return total
+    finally:
+        session.close()
+
+
+def copy_rows(table, columns, rows, on_conflict=None, ignore_duplicates=False, batch_size=5000):
+    """
+    대량 적재: rows(dict 또는 columns 순서의 튜플, 제너레이터 가능)를 전부 메모리에 올리지 않고 흘려 넣는다
+    - Postgres: COPY FROM STDIN (CSV) 한 번
+    - on_conflict('컬럼1, 컬럼2')를 주면 임시 스테이징 테이블에 COPY 한 뒤 INSERT ... SELECT ... ON CONFLICT로 병합
+      (upsert와 같은 규칙, 같은 키가 여러 번 나오면 마지막 행)
+    - SQLite/DuckDB: batch_size행씩 executemany
+    한 트랜잭션으로 처리하므로 중간에 실패하면 아무것도 들어가지 않는다. 반환값: 적재한 행 수
+    """
+    if BACKEND != "postgresql":
+        return _insert_batches(table, columns, rows, on_conflict, ignore_duplicates, batch_size)
+
+    cols = ", ".join(_quote_col(c) for c in columns)
+    stream = _CsvStream(rows, columns)
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        target = f'"{table}"'
+        if on_conflict:
+            cur.execute(f'CREATE TEMP TABLE _copy_stage (LIKE "{table}" INCLUDING DEFAULTS, _copy_row BIGSERIAL) '
+                        'ON COMMIT DROP')
+            target = "_copy_stage"
+        cur.copy_expert(f"COPY {target} ({cols}) FROM STDIN WITH (FORMAT csv)", stream, size=COPY_BUFFER)
+        if on_conflict:
+            keys = ", ".join(_quote_col(c) for c in on_conflict.split(','))
+            cur.execute(f'INSERT INTO "{table}" ({cols}) '
+                        f'SELECT DISTINCT ON ({keys}) {cols} FROM _copy_stage ORDER BY {keys}, _copy_row DESC'
+                        + _conflict_sql(columns, on_conflict, ignore_duplicates))
+        conn.commit()
+        return stream.count
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# 임베디드 merge_price_trend가 version 충돌로 다시 병합하는 최대 횟수
+MERGE_RETRIES = 10
+
+
+def _write_monthly(session, apt_id, deal_type, amount, replace_from, kind):
+    """merge_price_trend와 같은 트랜잭션에서 price_monthly upsert, price_change 기록 (Postgres 함수와 같은 규칙)"""
+    from price_changes import CHANGE_TABLE, change_row
+    from price_monthly import MONTHLY_COLUMNS, MONTHLY_TABLE, to_rows
+
+    rows = to_rows(apt_id, deal_type, amount)
+    if replace_from is not None:
+        where_sql, params = _build_where([
+            ("apt_id", "=", apt_id), ("deal_type", "=", int(deal_type)), ("yyyymm", ">=", int(replace_from)),
+            ("yyyymm", "NOT IN", [r["yyyymm"] for r in rows]),
+        ], "where")
+        session.execute(text(f'DELETE FROM "{MONTHLY_TABLE}"' + where_sql), params)
+    if rows:
+        session.execute(text(
+            f'INSERT INTO "{MONTHLY_TABLE}" ({", ".join(MONTHLY_COLUMNS)}) '
+            f'VALUES ({", ".join(":" + c for c in MONTHLY_COLUMNS)})'
+            + _conflict_sql(MONTHLY_COLUMNS, "apt_id, deal_type, yyyymm")
+        ), rows)
+    change = change_row(apt_id, deal_type, kind or ("replace" if replace_from else "merge"), amount, replace_from)
+    if change:
+        session.execute(text(f'INSERT INTO "{CHANGE_TABLE}" ({", ".join(change)}) '
+                             f'VALUES ({", ".join(":" + c for c in change)})'), change)
+
+
+def _merge_price_trend(p_id, p_amount, p_replace_from=None, p_kind=None):
+    """
+    merge_price_trend의 임베디드 백엔드용 구현 (version 비교 후 쓰기, 충돌하면 MERGE_RETRIES번까지 다시 병합)
+    price_trend, price_monthly, price_change를 한 세션에서 쓰고 한 번에 커밋한다
+    """
+    from price_trend_store import merge_by_month, parse_price_trend
+
+    for _ in range(MERGE_RETRIES):
+        session = Session()
+        try:
+            row = session.execute(
+                text('SELECT price_trend, version, apt_id, "DEAL_TYPE" FROM "APTInfo" WHERE id = :id'), {"id": p_id}
+            ).mappings().first()
+            if row is None:
+                return []
+            version = row["version"] or 0
+            price_trend = merge_by_month(parse_price_trend(row["price_trend"]), p_amount, p_replace_from)
+            count = _execute_count(
+                session,
+                'UPDATE "APTInfo" SET price_trend = :price_trend, version = :next, updated_at = CURRENT_TIMESTAMP '
+                'WHERE id = :id AND version = :version',
+                {"price_trend": json.dumps(price_trend), "next": version + 1, "id": p_id, "version": version},
+            )
+            if not count:
+                session.rollback()
+                continue
+            if row["apt_id"] is not None:
+                _write_monthly(session, row["apt_id"], row["DEAL_TYPE"], p_amount, p_replace_from, p_kind)
+            session.commit()
+            return [{"months": len(price_trend), "apt_id": row["apt_id"], "deal_type": row["DEAL_TYPE"]}]
+        finally:
+            session.close()
+    # 계속 다른 작업이 먼저 쓰거나 UPDATE 행 수가 맞지 않으면 무한히 돌지 않고 실패로 넘긴다 (작업 큐가 재시도)
+    raise RuntimeError(f"APTInfo id={p_id} version 충돌이 {MERGE_RETRIES}번 계속됨")
+
+
+def _price_trend_window(p_id, p_start=None, p_end=None):
+    """price_trend_window의 임베디드 백엔드용 구현"""
+    from price_trend_store import parse_price_trend
+
+    session = Session()
+    try:
+        data = session.execute(text('SELECT price_trend FROM "APTInfo" WHERE id = :id'), {"id": p_id}).scalar()
+    finally:
+        session.close()
+    return [d for d in parse_price_trend(data)
+            if (p_start is None or d["date"] >= p_start) and (p_end is None or d["date"] <= p_end)]
+
+
+_EMBEDDED_RPC = {
+    "merge_price_trend": _merge_price_trend,
+    "price_trend_window": _price_trend_window,
+}
 
 
 # 전역 클라이언트 인스턴스
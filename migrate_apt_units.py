@@ -0,0 +1,78 @@
+"""
+apartment / unit 테이블 한 번 채우기
+
+1. apartment, unit 테이블 생성 (APTInfo.apt_id가 비어 있으면 먼저 채운다)
+2. APTInfo의 아실 seq별로 apartment 한 행 (이름/설명/주소/준공연도는 그 seq의 가장 작은 id 행 기준)
+3. APTInfo.apt_id별로 unit 한 행 (id = apt_id)
+4. APTLastPER에 apt_id를 채우고 apt_id 유니크 인덱스로 바꾼다
+
+seq가 숫자가 아닌 행과, 같은 seq/평형인데 이름이 달라서 apt_id가 둘 이상인 시리즈는 옮기지 않고 로그만 남긴다.
+여러 번 실행해도 같은 결과가 나온다.
+
+사용법:
+    python migrate_apt_units.py
+"""
+import logging
+
+from dotenv import load_dotenv
+
+from apt_units import ensure_unit_tables
+from pipeline_metrics import setup_logging
+
+# Load environment variables from the .env file
+load_dotenv()
+
+# 로컬 DB 사용
+from local_db import execute_sql
+from last_per import ensure_last_per_table
+from migrate_price_monthly import assign_apt_ids
+
+logger = logging.getLogger(__name__)
+
+
+def migrate():
+    """반환값: (apartment 행 수, unit 행 수)"""
+    ensure_unit_tables(execute_sql)
+    assign_apt_ids()
+
+    skipped = execute_sql('''
+        SELECT DISTINCT name, "PY", seq FROM "APTInfo" WHERE seq IS NULL OR seq !~ '^[0-9]+$'
+    ''').data
+    for r in skipped:
+        logger.warning("seq가 숫자가 아님, 건너뜀: %s %s평 (seq=%r)", r['name'], r['PY'], r['seq'])
+
+    execute_sql('''
+        INSERT INTO apartment (seq, name, description, address, year)
+        SELECT DISTINCT ON (CAST(seq AS INTEGER)) CAST(seq AS INTEGER), name, description, address, year
+        FROM "APTInfo"
+        WHERE seq ~ '^[0-9]+$'
+        ORDER BY CAST(seq AS INTEGER), id
+        ON CONFLICT (seq) DO NOTHING
+    ''')
+    execute_sql('''
+        INSERT INTO unit (id, seq, "PY")
+        SELECT DISTINCT ON (CAST(seq AS INTEGER), "PY") apt_id, CAST(seq AS INTEGER), "PY"
+        FROM "APTInfo"
+        WHERE seq ~ '^[0-9]+$' AND apt_id IS NOT NULL
+        ORDER BY CAST(seq AS INTEGER), "PY", apt_id
+        ON CONFLICT DO NOTHING
+    ''')
+
+    orphans = execute_sql('''
+        SELECT DISTINCT a.apt_id, a.name, a."PY" FROM "APTInfo" a
+        WHERE a.seq ~ '^[0-9]+$' AND NOT EXISTS (SELECT 1 FROM unit u WHERE u.id = a.apt_id)
+    ''').data
+    for r in orphans:
+        logger.warning("같은 seq/평형의 다른 시리즈가 있음, unit 없음: apt_id=%s %s %s평", r['apt_id'], r['name'], r['PY'])
+
+    ensure_last_per_table()
+
+    apartments = execute_sql('SELECT COUNT(*) AS n FROM apartment').data[0]['n']
+    units = execute_sql('SELECT COUNT(*) AS n FROM unit').data[0]['n']
+    return apartments, units
+
+
+if __name__ == "__main__":
+    setup_logging()
+    apartments, units = migrate()
+    logger.info("완료: 아파트 %d개, 평형 %d개", apartments, units)
@@ -0,0 +1,74 @@
+"""
+APTInfo.price_trend JSON -> price_monthly 테이블 한 번 옮기기
+
+1. price_monthly 테이블과 APTInfo.apt_id 컬럼 생성
+2. 같은 name/PY 행들에 apt_id(가장 작은 id)를 채운다
+3. 모든 행의 price_trend를 읽어서 (예전 연도별 dict 형식은 펼쳐서) 월 단위 행으로 COPY 적재 후 병합
+
+여러 번 실행해도 같은 결과가 나온다.
+
+사용법:
+    python migrate_price_monthly.py
+"""
+import argparse
+import logging
+
+from dotenv import load_dotenv
+
+from pipeline_metrics import rows_written, setup_logging, stage
+from price_monthly import MONTHLY_COLUMNS, MONTHLY_TABLE, ensure_monthly_table, to_rows
+from price_trend_store import parse_price_trend
+
+# Load environment variables from the .env file
+load_dotenv()
+
+# 로컬 DB 사용
+from local_db import supabase, execute_sql, copy_rows
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def assign_apt_ids():
+    """name/PY가 같은 행들에 같은 apt_id(그 중 가장 작은 id)를 채운다"""
+    execute_sql('''
+        UPDATE "APTInfo" a SET apt_id = m.apt_id
+        FROM (SELECT name, "PY", MIN(id) AS apt_id FROM "APTInfo" GROUP BY name, "PY") m
+        WHERE a.name = m.name AND a."PY" = m."PY" AND a.apt_id IS DISTINCT FROM m.apt_id
+    ''')
+
+
+def month_rows(ids):
+    """APTInfo 행을 하나씩 읽어서 price_monthly 행을 흘려보낸다 (전체를 메모리에 올리지 않음)"""
+    # price_trend가 큰 행이 많아서 한 행씩 읽는다
+    for i, row_id in enumerate(ids, 1):
+        row = supabase.table('APTInfo').select('id, apt_id, DEAL_TYPE, price_trend').eq('id', row_id).single().execute().data
+        if row and row['DEAL_TYPE']:
+            yield from to_rows(row['apt_id'], row['DEAL_TYPE'], parse_price_trend(row['price_trend']))
+        if i % 1000 == 0 or i == len(ids):
+            logger.info("%d/%d 시리즈 처리", i, len(ids))
+
+
+def migrate(batch_size=BATCH_SIZE):
+    """반환값: 옮긴 월 행 수"""
+    with stage('plan'):
+        ensure_monthly_table(execute_sql)
+        assign_apt_ids()
+        ids = [r['id'] for r in supabase.table('APTInfo').select('id').execute().data]
+
+    # Postgres는 COPY 한 번 + 스테이징 테이블에서 병합, 임베디드 백엔드는 batch_size행씩
+    with stage('write'):
+        total = copy_rows(MONTHLY_TABLE, MONTHLY_COLUMNS, month_rows(ids),
+                          on_conflict='apt_id, deal_type, yyyymm', batch_size=batch_size)
+    rows_written(MONTHLY_TABLE, total)
+    return total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="price_trend JSON을 price_monthly 테이블로 옮기기")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="COPY가 없는 백엔드에서 한 번에 넣을 월 행 수")
+    args = parser.parse_args()
+
+    setup_logging()
+    total = migrate(args.batch_size)
+    logger.info("완료: %d개 월 행", total)
@@ -0,0 +1,156 @@
+"""
+APTInfo.price_trend를 text(JSON 문자열) -> jsonb로 바꾸고, 서버에서 병합/조회하는 함수를 만든다
+
+- merge_price_trend(p_id, p_amount, p_replace_from, p_kind): 새 달만 보내서 DB 안에서 date 기준으로 병합
+  (새 달이 모두 마지막 달 이후면 || 로 뒤에 이어붙이기만 한다)
+  한 UPDATE 문으로 처리되므로 동시에 여러 작업이 써도 앞선 변경을 덮어쓰지 않는다
+  apt_id가 있는 행은 같은 트랜잭션에서 price_monthly upsert와 price_change 변경 로그까지 쓴다
+  (중간에 실패하면 셋 다 롤백, p_kind: 로그 kind, 없으면 merge/replace)
+- price_trend_window(p_id, p_start, p_end): jsonb path 쿼리로 기간 안의 달만 돌려준다
+
+예전 연도별 dict 형식({'2020': [...], ...})은 바꾸기 전에 리스트로 펼친다 (change_apt_data.py와 같은 처리).
+여러 번 실행해도 된다. Supabase에서는 SQL 목록을 SQL Editor에서 그대로 실행하면 된다.
+
+사용법:
+    python migrate_price_trend_jsonb.py
+"""
+import logging
+
+from dotenv import load_dotenv
+
+from pipeline_metrics import setup_logging
+from price_changes import ensure_change_table
+from price_monthly import ensure_monthly_table
+
+# Load environment variables from the .env file
+load_dotenv()
+
+# 로컬 DB 사용
+from local_db import execute_sql
+
+logger = logging.getLogger(__name__)
+
+# text 컬럼일 때만 실행 (jsonb로 바뀐 뒤에는 건너뜀)
+FLATTEN_TEXT_SQL = '''
+    UPDATE "APTInfo" SET price_trend = (
+        SELECT COALESCE(jsonb_agg(e ORDER BY e->>'date'), '[]'::jsonb)::text
+        FROM jsonb_each(price_trend::jsonb) y, jsonb_array_elements(y.value) e
+    )
+    WHERE left(ltrim(price_trend), 1) = '{'
+'''
+
+ALTER_SQL = '''
+    ALTER TABLE "APTInfo" ALTER COLUMN price_trend TYPE jsonb
+    USING COALESCE(NULLIF(price_trend, '')::jsonb, '[]'::jsonb)
+'''
+
+FUNCTIONS_SQL = [
+    # p_kind가 없던 예전 함수 (남아 있으면 인자 3개 호출이 모호해진다)
+    'DROP FUNCTION IF EXISTS merge_price_trend(integer, jsonb, text)',
+    '''
+    CREATE OR REPLACE FUNCTION merge_price_trend(p_id integer, p_amount jsonb, p_replace_from text DEFAULT NULL,
+                                                 p_kind text DEFAULT NULL)
+    RETURNS TABLE (months integer, apt_id integer, deal_type text)
+    LANGUAGE plpgsql AS $$
+    #variable_conflict use_column
+    DECLARE
+        v_months integer;
+        v_apt_id integer;
+        v_deal_type text;
+        v_from integer;
+        v_to integer;
+    BEGIN
+        UPDATE "APTInfo" a SET
+            price_trend = CASE
+                WHEN p_replace_from IS NULL
+                     AND COALESCE((SELECT max(e->>'date') FROM jsonb_array_elements(a.price_trend) e), '')
+                         < (SELECT min(e->>'date') FROM jsonb_array_elements(p_amount) e)
+                    THEN COALESCE(a.price_trend, '[]'::jsonb) || p_amount
+                ELSE (
+                    SELECT COALESCE(jsonb_agg(m.e ORDER BY m.e->>'date'), '[]'::jsonb)
+                    FROM (
+                        SELECT DISTINCT ON (s.e->>'date') s.e
+                        FROM (
+                            SELECT e, 0 AS pri FROM jsonb_array_elements(p_amount) e
+                            UNION ALL
+                            SELECT e, 1 FROM jsonb_array_elements(COALESCE(a.price_trend, '[]'::jsonb)) e
+                            WHERE p_replace_from IS NULL OR e->>'date' < p_replace_from
+                        ) s
+                        ORDER BY s.e->>'date', s.pri
+                    ) m
+                )
+            END,
+            version = COALESCE(a.version, 0) + 1,
+            updated_at = now()
+        WHERE a.id = p_id
+        RETURNING jsonb_array_length(a.price_trend), a.apt_id, a."DEAL_TYPE" INTO v_months, v_apt_id, v_deal_type;
+        IF NOT FOUND THEN
+            RETURN;
+        END IF;
+
+        -- price_monthly.upsert_months, price_changes.change_row와 같은 규칙
+        IF v_apt_id IS NOT NULL THEN
+            IF p_replace_from IS NOT NULL THEN
+                DELETE FROM price_monthly m
+                WHERE m.apt_id = v_apt_id AND m.deal_type = v_deal_type::smallint AND m.yyyymm >= p_replace_from::integer
+                  AND m.yyyymm NOT IN (SELECT (e->>'date')::integer FROM jsonb_array_elements(p_amount) e);
+            END IF;
+            INSERT INTO price_monthly (apt_id, deal_type, yyyymm, avg, min, max, cnt)
+            SELECT v_apt_id, v_deal_type::smallint, (e->>'date')::integer, (e->>'avg')::double precision,
+                   (e->>'min')::double precision, (e->>'max')::double precision, COALESCE((e->>'cnt')::numeric::integer, 0)
+            FROM jsonb_array_elements(p_amount) e
+            ON CONFLICT ON CONSTRAINT price_monthly_pkey DO UPDATE
+            SET avg = EXCLUDED.avg, min = EXCLUDED.min, max = EXCLUDED.max, cnt = EXCLUDED.cnt;
+
+            SELECT min(s.month), max(s.month) INTO v_from, v_to
+            FROM (SELECT (e->>'date')::integer AS month FROM jsonb_array_elements(p_amount) e
+                  UNION ALL SELECT p_replace_from::integer) s;
+            IF v_from IS NOT NULL THEN
+                INSERT INTO price_change (apt_id, deal_type, from_month, to_month, kind)
+                VALUES (v_apt_id, v_deal_type::smallint, v_from, CASE WHEN p_replace_from IS NULL THEN v_to END,
+                        COALESCE(p_kind, CASE WHEN p_replace_from IS NULL THEN 'merge' ELSE 'replace' END));
+            END IF;
+        END IF;
+
+        RETURN QUERY SELECT v_months, v_apt_id, v_deal_type;
+    END
+    $$
+    ''',
+    '''
+    CREATE OR REPLACE FUNCTION price_trend_window(p_id integer, p_start text DEFAULT NULL, p_end text DEFAULT NULL)
+    RETURNS jsonb
+    LANGUAGE sql STABLE AS $$
+        SELECT jsonb_path_query_array(
+            COALESCE(price_trend, '[]'::jsonb),
+            '$[*] ? (@.date >= $start && @.date <= $end)',
+            jsonb_build_object('start', COALESCE(p_start, ''), 'end', COALESCE(p_end, '999999'))
+        )
+        FROM "APTInfo" WHERE id = p_id
+    $$
+    ''',
+]
+
+
+def migrate():
+    # merge_price_trend가 쓰는 컬럼 (update_apt_data.ensure_series_columns, price_monthly와 같은 컬럼)
+    execute_sql('ALTER TABLE "APTInfo" ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ')
+    execute_sql('ALTER TABLE "APTInfo" ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0')
+    ensure_monthly_table(execute_sql)
+    ensure_change_table(execute_sql)
+
+    column_type = execute_sql('''
+        SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'APTInfo' AND column_name = 'price_trend'
+    ''').data[0]['data_type']
+    if column_type != 'jsonb':
+        execute_sql(FLATTEN_TEXT_SQL)
+        execute_sql(ALTER_SQL)
+        logger.info("price_trend: %s -> jsonb", column_type)
+    for sql in FUNCTIONS_SQL:
+        execute_sql(sql)
+    logger.info("merge_price_trend, price_trend_window 함수 생성")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    migrate()
@@ -2,7 +2,10 @@ import streamlit as st
 import pandas as pd
 import altair as alt
 from urllib.error import URLError
-from get_apt_data import get_apt_data, get_apt_list
+from get_apt_data import get_apt_frame, supabase
+from apt_analytics import month_index
+from screening import screen_apartments, screen_regions
+from price_metrics import get_metrics
 
 # 자동 리렌더링 방지
 st.set_page_config(page_title="아파트", page_icon="🏢")
@@ -15,73 +18,56 @@ st.sidebar.header("아파트")
 # )
 
 
-@st.cache_data
-def load_data(dataset1, dataset2):
-    # 데이터프레임 생성
-    df1 = pd.DataFrame(dataset1)
-    df2 = pd.DataFrame(dataset2)
-
-    # 빈 데이터셋 처리
-    if df1.empty and df2.empty:
-        return pd.DataFrame(columns=['Date', '매매가', '매매 거래량', '월세', '월세 거래량', 'PER'])
-
-    # 매매 데이터 처리
-    if not df1.empty:
-        df1['date'] = pd.to_datetime(df1['date'], format='%Y%m')
-        df1 = df1.rename(columns={
-            'date': 'Date',
-            'avg': '매매가',
-            'cnt': '매매 거래량'
-        })
-        df1['Date'] = df1['Date'].dt.date
-    else:
-        df1 = pd.DataFrame(columns=['Date', '매매가', '매매 거래량'])
-
-    # 월세 데이터 처리
-    if not df2.empty:
-        df2['date'] = pd.to_datetime(df2['date'], format='%Y%m')
-        df2 = df2.rename(columns={
-            'date': 'Date',
-            'avg': '월세',
-            'cnt': '월세 거래량'
-        })
-        df2['Date'] = df2['Date'].dt.date
-    else:
-        df2 = pd.DataFrame(columns=['Date', '월세', '월세 거래량'])
-
-    # Date를 기준으로 병합
-    if df1.empty:
-        df3 = df2.copy()
-        df3['매매가'] = 0
-        df3['매매 거래량'] = 0
-    elif df2.empty:
-        df3 = df1.copy()
-        df3['월세'] = 0
-        df3['월세 거래량'] = 0
-    else:
-        df3 = pd.merge(df1, df2, on='Date', how='outer')
+@st.cache_data(ttl=3600)
+def load_data(apt_id):
+    """빈 달을 채워 저장해 둔 월별 시세 (price_dense, PER은 월세가 없는 달 NaN)"""
+    return get_apt_frame(apt_id)
+
+
+# 아파트 선택 목록 한 페이지 크기
+PAGE_SIZE = 100
+
+# per_stats 컬럼 -> 화면 컬럼
+STATS_COLUMNS = {
+    'per_12m': 'PER 12개월',
+    'per_36m': 'PER 36개월',
+    'per_z': 'PER z-score',
+    'market_pct': '시장 백분위',
+}
 
-    df3 = df3.sort_values(by='Date')
 
-    # 결측치를 이전 달 값으로 채워넣기
-    df3['매매가'] = df3['매매가'].astype(float).ffill()
-    df3['월세'] = df3['월세'].astype(float).ffill()
-    df3 = df3.fillna(0)
+@st.cache_data(ttl=3600)
+def load_stats(apt_id):
+    """per_stats에 미리 계산된 달별 PER 통계 (month 인덱스)"""
+    rows = supabase.table('per_stats').select('yyyymm, ' + ', '.join(STATS_COLUMNS)).eq('apt_id', apt_id).execute().data
+    stats = pd.DataFrame(rows, columns=['yyyymm', *STATS_COLUMNS]).rename(columns=STATS_COLUMNS)
+    return stats.drop(columns='yyyymm').set_index(month_index(stats['yyyymm'])).astype(float)
 
-    # 'PER' 계산 (월세가 0인 경우 inf 방지)
-    df3['PER'] = df3.apply(lambda row: row['매매가'] / (row['월세'] * 12) if row['월세'] > 0 else 0, axis=1)
 
-    return df3
+# price_metrics 컬럼 -> 화면 컬럼
+METRIC_COLUMNS = {
+    'jeonse_ratio': '전세가율',
+    'rent_yield': '임대수익률',
+    'conv_rate': '전월세 전환율',
+}
+
+
+@st.cache_data(ttl=3600)
+def load_metrics(apt_id):
+    """시세를 쓸 때 price_metrics에 계산해 둔 달별 전세가율/임대수익률/전환율 (month 인덱스)"""
+    metrics = pd.DataFrame(get_metrics(supabase, apt_id), columns=['yyyymm', *METRIC_COLUMNS]).rename(columns=METRIC_COLUMNS)
+    return metrics.drop(columns='yyyymm').set_index(month_index(metrics['yyyymm'])).astype(float)
+
 
 try:
-    # 전체 아파트 목록 가져오기
-    apt_list = get_apt_list()
+    # 지역별 아파트 수/준공/평형 범위 (필터 선택지)
+    regions = screen_regions(supabase)
     
     # 사이드바에 필터 추가
     st.sidebar.subheader("필터")
     
     # 지역 목록 가져오기
-    addresses = sorted({apt.get('address', '') for apt in apt_list if apt.get('address')})
+    addresses = [r['address'] for r in regions]
     
     # 기본 선택될 지역들
     default_addresses = [
@@ -106,8 +92,7 @@ try:
     current_year = datetime.now().year
 
     # 준공년도 범위 계산 (경과 연수로 변환)
-    years = sorted({apt['year'] for apt in apt_list if apt.get('year')})
-    years = [y//100 for y in years if y]  # 년도만 추출 (예: 202312 -> 2023)
+    years = [y // 100 for r in regions for y in (r['min_year'], r['max_year']) if y]  # 년도만 추출 (예: 202312 -> 2023)
 
     if years:
         min_elapsed = current_year - max(years)  # 최소 경과 연수 (미래 준공 포함시 음수 가능)
@@ -132,7 +117,7 @@ try:
     selected_min_year = current_year - elapsed_years[1]
     
     # 평수 범위 계산
-    PYs = sorted({float(apt['PY']) for apt in apt_list if apt.get('PY')})
+    PYs = [p for r in regions for p in (r['min_py'], r['max_py']) if p]
     min_PY = min(PYs) - 1 if PYs else 0
     max_PY = max(PYs) + 1 if PYs else 100
     
@@ -144,33 +129,41 @@ try:
         value=(float(min_PY), float(max_PY)),
         format="%.1f평"
     )
+    page = st.sidebar.number_input("목록 페이지", min_value=1, value=1, step=1)
     
-    # 필터링된 아파트 목록 생성 (지역, 경과 연수, 평수 기준으로 필터링)
-    filtered_apts = [
-        apt for apt in apt_list
-        if (apt.get('address', '') in selected_addresses) and  # 지역 필터
-        (selected_min_year <= apt.get('year', 0) // 100 <= selected_max_year) and  # 경과 연수 필터 (년도만 비교)
-        (PY_range[0] <= float(apt.get('PY', 0)) <= PY_range[1])  # 평수 필터
-    ]
+    # 필터링된 아파트 목록 (지역, 경과 연수, 평수 조건으로 DB에서 PER 낮은 순 한 페이지만)
+    filtered_apts, total = [], 0
+    if selected_addresses:
+        filtered_apts, total = screen_apartments(
+            supabase,
+            regions=selected_addresses,
+            years=(selected_min_year * 100 + 1, selected_max_year * 100 + 12),  # 경과 연수 필터 (yyyymm)
+            PYs=PY_range,
+            limit=PAGE_SIZE,
+            offset=(page - 1) * PAGE_SIZE,
+        )
+    st.sidebar.caption(f"조건에 맞는 아파트 {total}개")
     
-    # 필터링된 아파트 이름 목록
-    apt_names = [apt['name'] for apt in filtered_apts]
+    # 필터링된 아파트 unit id 목록 (화면에는 이름으로 표시)
+    apt_rows = {apt['apt_id']: apt for apt in filtered_apts}
+    apt_names = {apt_id: apt['apt_name'] for apt_id, apt in apt_rows.items()}
     
     # 아파트 선택
-    apt = st.selectbox("Choose a APT", apt_names)
+    apt = st.selectbox("Choose a APT", list(apt_names), format_func=apt_names.get)
     
     if not apt:
         st.error("Please select a APT.")
     else:
         # 선택된 아파트 데이터 로드
-        apt_name, apt_PY, dataset1, dataset2, dataset3 = get_apt_data(apt)
-        df = load_data(dataset1, dataset3)
+        apt_name, apt_PY = apt_rows[apt]['apt_name'], apt_rows[apt]['apt_PY']
+        df = load_data(apt).join(load_stats(apt)).join(load_metrics(apt))
         
         # 기간 선택 슬라이더 (아파트 선택 후 표시)
         start_date, end_date = st.sidebar.select_slider(
             '조회하고 싶은 기간을 선택하세요',
             options=df["Date"].tolist(),
-            value=(df["Date"].min(), df["Date"].max())
+            value=(df["Date"].min(), df["Date"].max()),
+            format_func=lambda d: d.strftime('%Y-%m')
         )
         df = df[(df['Date'] >= start_date) & (df['Date'] <= end_date)]
         
@@ -179,14 +172,18 @@ try:
 
         # 데이터가 있는 경우에만 차트 표시
         if not df.empty and len(df) > 0:
-            # PER 평균 미리 계산 (동적 계산 방지)
-            avg_per = df['PER'].mean() if df['PER'].sum() > 0 else 0
-
-            line_chart1 = alt.Chart(df).mark_line(point=True).encode(
+            # 매매가 선은 빈 달을 채운 값, 점은 실제 거래가 있는 달만
+            price_line = alt.Chart(df).mark_line().encode(
+                x=alt.X("Date:T", title="Date"),
+                y=alt.Y("매매가:Q", title="매매가"),
+                color=alt.value('red'),
+            )
+            price_points = alt.Chart(df[df['매매 관측']]).mark_point(filled=True).encode(
                 x=alt.X("Date:T", title="Date"),
                 y=alt.Y("매매가:Q", title="매매가"),
                 color=alt.value('red'),
             )
+            line_chart1 = alt.layer(price_line, price_points)
 
             line_chart2 = alt.Chart(df).mark_line(point=True).encode(
                 x=alt.X("Date:T", title="Date"),
@@ -194,16 +191,32 @@ try:
                 color=alt.value('blue'),
             )
 
-            # 수평선 추가 (미리 계산된 값 사용)
-            hline1 = alt.Chart(pd.DataFrame({'y': [avg_per]})).mark_rule(color='orange', strokeWidth=1).encode(y='y:Q')
+            # 최근 12개월 PER 평균 (per_stats에 미리 계산된 값)
+            line_chart3 = alt.Chart(df).mark_line(strokeWidth=1).encode(
+                x=alt.X("Date:T", title="Date"),
+                y=alt.Y("PER 12개월:Q", title="PER"),
+                color=alt.value('orange'),
+            )
+
+            # 수평선 추가
             hline2 = alt.Chart(pd.DataFrame({'y': [35]})).mark_rule(color='yellow', strokeWidth=1).encode(y='y:Q')
             hline3 = alt.Chart(pd.DataFrame({'y': [30]})).mark_rule(color='green', strokeWidth=1).encode(y='y:Q')
 
             # 차트에 수평선 추가
-            base_chart = alt.layer(line_chart2, hline1, hline2, hline3).resolve_scale()
+            base_chart = alt.layer(line_chart2, line_chart3, hline2, hline3).resolve_scale()
             # 전체 차트 그리기
             final_chart = alt.layer(line_chart1, base_chart).resolve_scale(y='independent')
             st.altair_chart(final_chart, use_container_width=True)
+
+            # 전세가율 / 임대수익률 (price_metrics)
+            ratio_df = df.melt(id_vars='Date', value_vars=list(METRIC_COLUMNS.values()), var_name='지표', value_name='값').dropna()
+            if not ratio_df.empty:
+                ratio_chart = alt.Chart(ratio_df).mark_line(point=True).encode(
+                    x=alt.X("Date:T", title="Date"),
+                    y=alt.Y("값:Q", title="비율", axis=alt.Axis(format='%')),
+                    color="지표:N",
+                )
+                st.altair_chart(ratio_chart, use_container_width=True)
         else:
             st.warning("표시할 데이터가 없습니다.")
 
@@ -211,12 +224,15 @@ try:
         if not df.empty and len(df) > 0:
             df_display = df.set_index('Date').copy()
 
+            # 최근 6개월은 매매/월세 거래가 있는 마지막 6개 달 (APTLastPER, Home과 같은 기준, 채운 빈 달은 세지 않음)
+            observed = df_display[df_display['매매 관측'] | df_display['월세 관측']]
+
             # 최근 6개월 매매가 평균
-            avg_price = df_display[-6:]['매매가'].mean() if len(df_display) > 0 else 0
+            avg_price = observed[-6:]['매매가'].mean() if len(observed) > 0 else 0
             st.write(f"- 최근 6개월 매매가 평균: {round(avg_price/10000, 1)}억원")
 
             # 최근 6개월 월세 평균
-            avg_rent = df_display[-6:]['월세'].mean() if len(df_display) > 0 else 0
+            avg_rent = observed[-6:]['월세'].mean() if len(observed) > 0 else 0
             st.write(f"- 최근 6개월 월세 평균: {int(avg_rent)}만원")
 
             # 최근 월세 시세를 통해 추정한 기대 매매가
@@ -227,6 +243,21 @@ try:
             else:
                 st.write("- 최근 월세 시세를 통해 추정한 기대 매매가: 월세 데이터 없음")
 
+            # 마지막 달 PER 위치 (자기 이력 대비 / 같은 달 전체 아파트 중)
+            last = df_display.iloc[-1]
+            if pd.notna(last['PER z-score']):
+                st.write(f"- PER z-score (자기 이력 대비): {last['PER z-score']:.2f}")
+            if pd.notna(last['시장 백분위']):
+                st.write(f"- PER 시장 백분위: 하위 {last['시장 백분위']:.0%}")
+
+            # 마지막 달 전세/월세 지표 (price_metrics)
+            if pd.notna(last['전세가율']):
+                st.write(f"- 전세가율: {last['전세가율']:.1%}")
+            if pd.notna(last['임대수익률']):
+                st.write(f"- 임대수익률 (세전): {last['임대수익률']:.2%}")
+            if pd.notna(last['전월세 전환율']):
+                st.write(f"- 전월세 전환율: {last['전월세 전환율']:.2%}")
+
             st.divider()
 
             st.dataframe(df_display, use_container_width=True)
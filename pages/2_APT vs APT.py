@@ -2,92 +2,49 @@ import streamlit as st
 import pandas as pd
 import altair as alt
 from urllib.error import URLError
-from get_apt_data import get_apt_data, get_apt_list
+from get_apt_data import get_apt_frame, get_apt_list, supabase
 
 st.markdown("# 아파트 비교")
 st.sidebar.header("아파트 비교")
 
+# 화면 이름 -> apt_similar.kind
+SIMILAR_KINDS = {'가격 흐름': 'price', 'PER': 'per'}
 
-@st.cache_data
-def load_data(dataset1, dataset2, dataset3):
-    # 데이터프레임 생성
-    df1 = pd.DataFrame(dataset1)
-    df2 = pd.DataFrame(dataset2)
-    df3 = pd.DataFrame(dataset3)
-    # 'date'를 datetime 형식으로 변환
-    df1['date'] = pd.to_datetime(df1['date'], format='%Y%m')
-    df1 = df1.rename(columns={
-        'date': 'Date',
-        'avg': '매매가',
-        'cnt': '매매 거래량'
-    })
-    df1['Date'] = df1['Date'].dt.date
-    df2['date'] = pd.to_datetime(df2['date'], format='%Y%m')
-    df2 = df2.rename(columns={
-        'date': 'Date',
-        'avg': '전세',
-        'cnt': '전세 거래량'
-    })
-    df2['Date'] = df2['Date'].dt.date
-    df3['date'] = pd.to_datetime(df3['date'], format='%Y%m')
-    df3 = df3.rename(columns={
-        'date': 'Date',
-        'avg': '월세',
-        'cnt': '월세 거래량'
-    })
-    df3['Date'] = df3['Date'].dt.date
-
-    # df1 = pd.DataFrame(list(dataset1.items()), columns=['Date', 'Data'])
-    # df1[['매매가', '매매 거래량']] = pd.DataFrame(df1['Data'].tolist(), index=df1.index)
-    # df1.drop('Data', axis=1, inplace=True)
-    # df2 = pd.DataFrame(list(dataset2.items()), columns=['Date', 'Data'])
-    # df2[['전세', '전세 거래량']] = pd.DataFrame(df2['Data'].tolist(), index=df2.index)
-    # df2.drop('Data', axis=1, inplace=True)
-    # df3 = pd.DataFrame(list(dataset3.items()), columns=['Date', 'Data'])
-    # df3[['월세', '월세 거래량']] = pd.DataFrame(df3['Data'].tolist(), index=df3.index)
-    # df3.drop('Data', axis=1, inplace=True)
-    #
-    # # 데이터프레임을 날짜로 정렬
-    # df1['Date'] = pd.to_datetime(df1['Date'], format='%Y%m')
-    # df1['Date'] = df1['Date'].dt.date
-    # df2['Date'] = pd.to_datetime(df2['Date'], format='%Y%m')
-    # df2['Date'] = df2['Date'].dt.date
-    # df3['Date'] = pd.to_datetime(df3['Date'], format='%Y%m')
-    # df3['Date'] = df3['Date'].dt.date
-    # df1 = df1.sort_values(by='Date')
-    # df2 = df2.sort_values(by='Date')
-    # df3 = df3.sort_values(by='Date')
-
-    # Date를 기준으로 병합
-    # df3 = pd.merge(df1, df2, on='Date', how='inner')
-    df_temp = pd.merge(df1, df2, on='Date', how='outer')
-    df4 = pd.merge(df_temp, df3, on='Date', how='outer')
-    df4 = df4.sort_values(by='Date')
-
-    # 결측치를 이전 달 값으로 채워넣기
-    df4['매매가'] = df4['매매가'].astype(float).ffill()
-    df4['전세'] = df4['전세'].astype(float).ffill()
-    df4['월세'] = df4['월세'].astype(float).ffill()
-    df4 = df4.fillna(0)
-
-    # 'PER' 계산
-    df4['PER'] = df4['매매가'] / (df4['월세'] * 12)
-
-    return df4
+
+@st.cache_data(ttl=3600)
+def load_data(apt_id):
+    """빈 달을 채워 저장해 둔 매매/전세/월세 월별 시세 (price_dense, PER은 월세가 없는 달 NaN)"""
+    return get_apt_frame(apt_id)
+
+
+@st.cache_data(ttl=3600)
+def load_similar(apt_id, kind):
+    """미리 계산된 비슷한 단지 (similarity.py의 apt_similar, 상관계수 높은 순)"""
+    return supabase.table('apt_similar').select('similar_id, corr, overlap') \
+        .eq('apt_id', apt_id).eq('kind', kind).order('rank_no').execute().data or []
 
 try:
     apt_list = get_apt_list()
-    apt_names = [apt['name'] for apt in apt_list]
-    apts = st.multiselect("Choose a APT", apt_names)
-    
+    apt_names = {apt['id']: apt['name'] for apt in apt_list}
+    apts = st.multiselect("Choose a APT", list(apt_names), format_func=apt_names.get)
+
+    # 첫 번째로 고른 아파트와 월별 흐름이 비슷한 단지 추천
+    if apts:
+        kind = SIMILAR_KINDS[st.sidebar.radio("비슷한 단지 기준", list(SIMILAR_KINDS), horizontal=True)]
+        similar = {s['similar_id']: s for s in load_similar(apts[0], kind)
+                   if s['similar_id'] in apt_names and s['similar_id'] not in apts}
+        if similar:
+            apts = apts + st.multiselect(
+                f"{apt_names[apts[0]]}와 비슷한 단지",
+                list(similar),
+                format_func=lambda i: f"{apt_names[i]} (상관계수 {similar[i]['corr']:.2f}, {similar[i]['overlap']}개월)")
+
     if not apts:
         st.error("Please select a APT.")
     else:
         data = []
         for apt in apts:
-            apt_name, apt_PY, dataset1, dataset2, dataset3 = get_apt_data(apt)
-            df = load_data(dataset1, dataset2, dataset3)
-            data.append({apt_name: df})
+            data.append({apt_names[apt]: load_data(apt)})
         
         date_list = []
         date_min, date_max = None, None
@@ -111,7 +68,8 @@ try:
         start_date, end_date = st.sidebar.select_slider(
             '조회하고 싶은 기간을 선택하세요',
             options=date_list,
-            value=(date_min, date_max))
+            value=(date_min, date_max),
+            format_func=lambda d: d.strftime('%Y-%m'))
         # df = df[(df['Date'] >= start_date) & (df['Date'] <= end_date)]
 
 
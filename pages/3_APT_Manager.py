@@ -1,8 +1,10 @@
 import streamlit as st
-import json
 from datetime import datetime, timedelta
 from get_apt_data import get_apt_list, supabase
 from apt_value import get_APT_info, get_APT_transactions
+from price_trend_store import save_series
+from apt_units import get_unit_id
+from price_changes import record_change
 
 st.set_page_config(page_title="아파트 관리", page_icon="")
 
@@ -66,6 +68,7 @@ def collect_apt_data(apt_info, PY, progress_bar=None, status_text=None):
             status_text.text(f"{deal_name} 데이터 수집 중...")
 
         price_trend = []
+        failed_years = []
 
         # 3년치 데이터 수집
         for year in range(start_year, today.year + 1):
@@ -74,6 +77,7 @@ def collect_apt_data(apt_info, PY, progress_bar=None, status_text=None):
                 if amount:
                     price_trend.extend(amount)
             except Exception as e:
+                failed_years.append(year)
                 st.warning(f"{year}년 {deal_name} 데이터 수집 실패: {e}")
 
         # 날짜순 정렬
@@ -81,32 +85,16 @@ def collect_apt_data(apt_info, PY, progress_bar=None, status_text=None):
 
         # DB에 저장
         try:
-            # 기존 데이터 확인
-            response = supabase.table('APTInfo').select('id').eq('name', apt_info['name']).eq('PY', PY).eq('DEAL_TYPE', deal_type).execute()
-
             # 주소 추출
             address = extract_address(apt_info['desc'])
             year_built = extract_year(apt_info['desc'])
 
-            if response.data:
-                # 기존 데이터 업데이트
-                supabase.table('APTInfo').update({
-                    'price_trend': json.dumps(price_trend),
-                    'status': 1
-                }).eq('id', response.data[0]['id']).execute()
-            else:
-                # 새 데이터 삽입
-                supabase.table('APTInfo').insert({
-                    'name': apt_info['name'],
-                    'PY': PY,
-                    'DEAL_TYPE': deal_type,
-                    'seq': apt_info['seq'],
-                    'description': apt_info['desc'],
-                    'address': address,
-                    'year': year_built,
-                    'price_trend': json.dumps(price_trend),
-                    'status': 1
-                }).execute()
+            # 기존 데이터가 있으면 DB 함수 merge_price_trend가 서버에서 병합 (수집한 구간은 새 데이터로 다시 씀)
+            # 실패한 연도가 있으면 그해 저장된 달이 지워지지 않도록 다시 쓰지 않고 병합만 한다
+            save_series(supabase, apt_info, PY, deal_type, price_trend,
+                        replace_from=None if failed_years else f"{start_year}01",
+                        extra={'status': 1},
+                        new_row={'address': address, 'year': year_built})
 
             results.append({
                 'deal_type': deal_name,
@@ -156,18 +144,16 @@ def extract_year(description):
         return None
 
 
-def delete_apt_data(apt_name, PY):
-    """아파트 데이터 삭제 (status를 0으로 변경)"""
+def delete_apt_data(apt_id):
+    """아파트 데이터 삭제 (unit id의 모든 거래유형 행 status를 0으로 변경)"""
     try:
-        # APTInfo 테이블에서 status를 0으로 변경
-        response = supabase.table('APTInfo').select('id').eq('name', apt_name).eq('PY', PY).execute()
+        response = supabase.table('APTInfo').select('id, DEAL_TYPE').eq('apt_id', apt_id).execute()
 
         if response.data:
+            # APTInfo 테이블에서 status를 0으로 변경
+            supabase.table('APTInfo').update({'status': 0}).eq('apt_id', apt_id).execute()
             for record in response.data:
-                supabase.table('APTInfo').update({'status': 0}).eq('id', record['id']).execute()
-
-            # APTLastPER 테이블에서도 삭제
-            supabase.table('APTLastPER').select('id').eq('apt_name', apt_name).eq('apt_PY', PY).execute()
+                record_change(supabase, apt_id, record['DEAL_TYPE'], 'deactivate')
             # APTLastPER는 실제로 삭제하거나 유지할 수 있음
 
             return True
@@ -222,9 +208,12 @@ with tab1:
 
                 if py_input:
                     # 이미 등록된 아파트인지 확인
-                    existing = supabase.table('APTInfo').select('id, status').eq('name', selected_apt['name']).eq('PY', py_input).eq('status', 1).execute()
+                    unit_id = get_unit_id(supabase, selected_apt['seq'], py_input)
+                    existing = None
+                    if unit_id is not None:
+                        existing = supabase.table('APTInfo').select('id, status').eq('apt_id', unit_id).eq('status', 1).execute()
 
-                    if existing.data:
+                    if existing and existing.data:
                         st.warning(f"{selected_apt['name']} {py_input}평은 이미 등록되어 있습니다.")
                     else:
                         if st.button("아파트 추가 및 데이터 수집", type="primary"):
@@ -266,10 +255,11 @@ with tab2:
 
     if apt_list:
         # 선택 가능한 목록 생성
-        apt_options = [apt['name'] for apt in apt_list]
+        apt_options = {apt['id']: apt['name'] for apt in apt_list}
 
         with st.form(key="delete_form"):
-            selected_apt = st.selectbox("삭제할 아파트 선택", apt_options, index=None, placeholder="아파트를 선택하세요")
+            selected_apt = st.selectbox("삭제할 아파트 선택", list(apt_options), format_func=apt_options.get,
+                                        index=None, placeholder="아파트를 선택하세요")
 
             st.warning("삭제하면 이 아파트의 데이터가 비활성화됩니다.")
 
@@ -277,9 +267,9 @@ with tab2:
 
             if submit_button and selected_apt:
                 # 선택된 아파트 정보 찾기
-                apt_info = next((apt for apt in apt_list if apt['name'] == selected_apt), None)
+                apt_info = next((apt for apt in apt_list if apt['id'] == selected_apt), None)
                 if apt_info:
-                    success = delete_apt_data(apt_info['original_name'], apt_info['PY'])
+                    success = delete_apt_data(apt_info['id'])
                     if success:
                         st.success(f"{apt_info['original_name']} {apt_info['PY']}평이 삭제되었습니다.")
                         st.cache_data.clear()
@@ -0,0 +1,78 @@
+import streamlit as st
+import altair as alt
+from urllib.error import URLError
+from get_apt_data import supabase
+from region_index import list_regions, load_region_index
+
+st.set_page_config(page_title="지역", page_icon="🗺️")
+
+st.markdown("# 지역 지수")
+st.sidebar.header("지역 지수")
+
+# 화면 이름 -> region_index.level
+LEVEL_NAMES = {'구': 'gu', '시': 'si'}
+
+# 지수 컬럼 -> 화면 컬럼
+INDEX_COLUMNS = {
+    'price': '매매가',
+    'jeonse': '전세',
+    'rent': '월세',
+    'per': 'PER',
+}
+
+
+@st.cache_data(ttl=3600)
+def load_regions(level):
+    return list_regions(supabase, level)
+
+
+@st.cache_data(ttl=3600)
+def load_data(regions, level):
+    """선택한 지역들의 월별 거래량 가중 지수 (region_index만 읽음)"""
+    return load_region_index(supabase, regions, level).rename(columns=INDEX_COLUMNS)
+
+
+try:
+    level = LEVEL_NAMES[st.sidebar.radio("단위", list(LEVEL_NAMES), horizontal=True)]
+    regions = [r['region'] for r in load_regions(level)]
+
+    default_regions = [r for r in ('서울 송파구', '서울') if r in regions]
+    selected = st.multiselect("지역", regions, default=default_regions)
+
+    if not selected:
+        st.error("지역을 선택하세요.")
+    else:
+        df = load_data(tuple(selected), level)
+        if df.empty:
+            st.warning("표시할 데이터가 없습니다.")
+        else:
+            dates = df['Date'].drop_duplicates().sort_values().tolist()
+            start_date, end_date = st.sidebar.select_slider(
+                '조회하고 싶은 기간을 선택하세요',
+                options=dates,
+                value=(dates[0], dates[-1]),
+                format_func=lambda d: d.strftime('%Y-%m'))
+            df = df[(df['Date'] >= start_date) & (df['Date'] <= end_date)]
+
+            # 차트 그리기 (거래가 없는 달은 빈칸)
+            for col in INDEX_COLUMNS.values():
+                st.write(f"### {col}")
+                chart = alt.Chart(df.dropna(subset=[col])).mark_line(point=True).encode(
+                    x=alt.X("Date:T", title="Date"),
+                    y=alt.Y(f"{col}:Q", title=col),
+                    color="region:N",
+                )
+                st.altair_chart(chart, use_container_width=True)
+
+            st.divider()
+
+            st.dataframe(df.drop(columns='yyyymm').set_index(['region', 'Date']), use_container_width=True)
+
+except URLError as e:
+    st.error(
+        """
+        **This demo requires internet access.**
+        Connection error: %s
+    """
+        % e.reason
+    )
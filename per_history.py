@@ -0,0 +1,76 @@
+"""
+PER 일별 스냅샷(per_daily)
+
+APTLastPER는 아파트마다 최신 값 한 행뿐이라, PER 계산 job(save_last_PER, update_apt_data, backfill_apt_data)이 끝날 때마다
+last_per.snapshot_per()로 APTLastPER 전체를 오늘 날짜로 per_daily에 복사해 둔다 (같은 날 다시 돌면 그날 행을 덮어쓴다).
+- snap_date DATE, apt_id INTEGER, per REAL, avg_price REAL(억원), avg_rent INTEGER(만원)
+  -> 4~8바이트 컬럼만 써서 행이 작다 (apt_name 같은 문자열은 unit/APTInfo에서 조인)
+- Postgres는 snap_date 월 단위 RANGE 파티션 (per_daily_202410), 스냅샷을 쓸 때 그 달 파티션을 만든다
+  기간 조회는 해당 달 파티션만 읽고, 오래된 달은 파티션째 DROP/분리하면 된다
+
+load_per_panel()은 기간 전체를 한 번의 조회로 읽는다.
+client는 local_db.supabase 또는 Supabase 클라이언트
+"""
+from datetime import date
+
+import pandas as pd
+
+HISTORY_TABLE = 'per_daily'
+
+DDL = [
+    f'''
+    CREATE TABLE IF NOT EXISTS {HISTORY_TABLE} (
+        snap_date DATE NOT NULL,
+        apt_id INTEGER NOT NULL,
+        per REAL,
+        avg_price REAL,
+        avg_rent INTEGER,
+        PRIMARY KEY (snap_date, apt_id)
+    ) PARTITION BY RANGE (snap_date)
+    ''',
+]
+
+# 오늘 APTLastPER 전체를 복사 (Postgres, SQLite, DuckDB 공통 문법)
+SNAPSHOT_SQL = f'''
+    INSERT INTO {HISTORY_TABLE} (snap_date, apt_id, per, avg_price, avg_rent)
+    SELECT :day, apt_id, "last_PER", last_avg_price, last_avg_rent
+    FROM "APTLastPER"
+    WHERE apt_id IS NOT NULL
+    ON CONFLICT (snap_date, apt_id) DO UPDATE SET
+        per = EXCLUDED.per,
+        avg_price = EXCLUDED.avg_price,
+        avg_rent = EXCLUDED.avg_rent
+'''
+
+
+def partition_sql(day):
+    """day(date)가 속한 달의 파티션 생성 SQL (Postgres)"""
+    start = day.replace(day=1)
+    end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return (f"CREATE TABLE IF NOT EXISTS {HISTORY_TABLE}_{start:%Y%m} PARTITION OF {HISTORY_TABLE} "
+            f"FOR VALUES FROM ('{start}') TO ('{end}')")
+
+
+def load_per_panel(client, start, end, apt_ids=None, as_pandas=True):
+    """
+    start ~ end('YYYY-MM-DD', 포함) 기간의 스냅샷을 한 번에 읽기
+    apt_ids: 일부 아파트만 읽을 때 apt_id 리스트
+    반환값: snap_date, apt_id, per, avg_price, avg_rent 컬럼의 DataFrame (as_pandas=False면 dict 리스트)
+    """
+    query = client.table(HISTORY_TABLE).select('snap_date, apt_id, per, avg_price, avg_rent') \
+        .gte('snap_date', str(start)).lte('snap_date', str(end))
+    if apt_ids is not None:
+        query = query.in_('apt_id', list(apt_ids))
+    rows = query.execute().data or []
+    if not as_pandas:
+        return rows
+    df = pd.DataFrame(rows, columns=['snap_date', 'apt_id', 'per', 'avg_price', 'avg_rent'])
+    df['snap_date'] = pd.to_datetime(df['snap_date'])
+    return df
+
+
+def per_quantiles(panel, q=(0.1, 0.25, 0.5, 0.75, 0.9)):
+    """날짜별 전체 아파트 PER 분위수 (행: snap_date, 열: 분위)"""
+    if panel.empty:
+        return pd.DataFrame(columns=list(q))
+    return panel.dropna(subset=['per']).groupby('snap_date')['per'].quantile(list(q)).unstack()
@@ -0,0 +1,87 @@
+"""
+전체 아파트 PER 패널 계산 (벡터화)
+
+save_last_PER.load_data를 아파트마다 부르는 대신, 모든 아파트의 매매(1)/월세(3) 월별 시세를
+긴 DataFrame 하나(apt_id, yyyymm, price, rent)로 읽어서 정렬된 NumPy 배열 위에서 한꺼번에 계산한다.
+- 아파트별로 매매/월세 중 하나라도 있는 달만 행으로 둔다 (load_data의 outer merge와 같음)
+- 빈 값은 같은 아파트의 이전 달 값, 그래도 없으면 0
+- PER = price / (rent * 12), 월세가 0이면 NaN (apt_analytics.masked_per, APTLastPER와 같음)
+- price_6m / rent_6m: 그 달까지 최근 6개 행 평균 (누적합 차이로 계산)
+
+last_per_frame()은 아파트별 마지막 달만 뽑아서 APTLastPER와 같은 값(억원 소수 첫째 자리, 월세 내림)을 만든다.
+"""
+import numpy as np
+import pandas as pd
+
+from apt_analytics import masked_per
+
+WINDOW = 6
+
+LONG_SQL = 'SELECT apt_id, deal_type, yyyymm, avg FROM price_monthly WHERE deal_type IN (1, 3)'
+
+
+def load_long(execute_sql, apt_ids=None):
+    """price_monthly에서 매매/월세 월별 시세를 한 번에 읽기 (apt_id, deal_type, yyyymm, avg)"""
+    sql, params = LONG_SQL, {}
+    if apt_ids is not None:
+        params = {f'apt_id_{i}': apt_id for i, apt_id in enumerate(apt_ids)}
+        sql += f" AND apt_id IN ({', '.join(':' + k for k in params)})" if params else ' AND 1 = 0'
+    return pd.DataFrame(execute_sql(sql, params).data, columns=['apt_id', 'deal_type', 'yyyymm', 'avg'])
+
+
+def load_long_snapshot(path=None):
+    """Parquet 스냅샷(price_snapshot.py)에서 같은 형식으로 읽기 (DB 없이)"""
+    from price_snapshot import DEFAULT_SNAPSHOT_DIR, load_panel
+
+    return load_panel(path or DEFAULT_SNAPSHOT_DIR, columns=['apt_id', 'deal_type', 'yyyymm', 'avg'],
+                      filters=[('deal_type', 'in', [1, 3])])
+
+
+def rolling_mean(values, pos, window=WINDOW):
+    """
+    아파트별로 정렬된 배열에서 최근 window개 행 평균 (pos: 아파트 안에서의 순번)
+    NaN은 빼고 평균, 창 안에 값이 하나도 없으면 NaN
+    """
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    csum = np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))])
+    ccnt = np.concatenate([[0], np.cumsum(valid)])
+    i = np.arange(len(values))
+    lo = i - np.minimum(pos, window - 1)
+    count = ccnt[i + 1] - ccnt[lo]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, (csum[i + 1] - csum[lo]) / count, np.nan)
+
+
+def build_panel(long):
+    """
+    긴 형식(apt_id, deal_type, yyyymm, avg) -> 아파트 x 달 패널
+    반환값: apt_id, yyyymm, price, rent, PER, price_6m, rent_6m 컬럼 (apt_id, yyyymm 순 정렬)
+    """
+    wide = (long.set_index(['apt_id', 'yyyymm', 'deal_type'])['avg']
+            .unstack('deal_type')
+            .reindex(columns=[1, 3])
+            .sort_index())
+    wide.columns = ['price', 'rent']
+    wide = wide.groupby(level='apt_id').ffill().fillna(0)
+
+    panel = wide.reset_index()
+    pos = panel.groupby('apt_id').cumcount().to_numpy()
+    price = panel['price'].to_numpy(dtype=float)
+    rent = panel['rent'].to_numpy(dtype=float)
+    panel['PER'] = masked_per(price, rent)
+    panel['price_6m'] = rolling_mean(price, pos)
+    panel['rent_6m'] = rolling_mean(rent, pos)
+    return panel
+
+
+def last_per_frame(panel):
+    """아파트별 마지막 달 -> apt_id, last_avg_price(억원), last_avg_rent(만원), last_PER"""
+    last = panel.drop_duplicates('apt_id', keep='last')
+    return pd.DataFrame({
+        'apt_id': last['apt_id'].to_numpy(),
+        # DB의 ROUND와 같이 .5는 올림 (pandas round는 짝수 쪽으로 반올림)
+        'last_avg_price': np.floor(last['price_6m'].to_numpy() / 10000 * 10 + 0.5) / 10,
+        'last_avg_rent': np.floor(last['rent_6m'].to_numpy()).astype(int),
+        'last_PER': last['PER'].to_numpy(),
+    })
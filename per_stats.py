@@ -0,0 +1,204 @@
+"""
+PER 통계 사전 계산(per_stats)
+
+per_panel의 아파트 x 달 패널에서 달마다
+- per_6m / per_12m / per_36m: 그 달을 포함한 최근 6/12/36개월(달력 기준)에 거래가 있는 달의 PER 평균
+  (월세가 없는 달은 빼고, 거래가 드문 아파트도 창 길이는 같다)
+- per_z: 그 달까지의 자기 이력 PER 대비 z-score (값이 12개 이상일 때)
+- per_mom: 직전 달 대비 PER 변화 (PER 포인트)
+- market_pct: 같은 달 전체 아파트 중 PER 백분위 (0~1, 낮을수록 PER이 낮음, DB의 CUME_DIST)
+를 계산해서 저장한다. Home / 1_APT 화면은 이 테이블(최신 달은 per_stats_latest 뷰)을 읽기만 한다.
+
+증분(기본): price_change 변경 로그에서 커서 이후 바뀐 아파트만 전체 이력을 읽어 다시 계산하고
+가장 이르게 바뀐 달 이후 행만 바꿔 쓴 뒤, 그 달 이후의 market_pct만 다시 계산한다.
+모든 통계가 그 달까지의 이력만 보므로 바뀐 달 이전 값은 그대로다. 커서가 없으면 전체 계산.
+
+사용법:
+    python per_stats.py
+    python per_stats.py --full
+"""
+import argparse
+import logging
+
+import numpy as np
+
+from local_db import BACKEND, supabase, execute_sql, copy_rows
+from per_panel import build_panel, load_long
+from price_changes import changed_from_months, pending_changes, save_cursor
+
+logger = logging.getLogger(__name__)
+
+STATS_TABLE = 'per_stats'
+CONSUMER = 'per_stats'
+ROLLING_WINDOWS = (6, 12, 36)
+Z_MIN_MONTHS = 12
+STATS_COLUMNS = ['apt_id', 'yyyymm', 'per', 'per_6m', 'per_12m', 'per_36m', 'per_z', 'per_mom']
+
+DDL = [
+    f'''
+    CREATE TABLE IF NOT EXISTS {STATS_TABLE} (
+        apt_id INTEGER NOT NULL,
+        yyyymm INTEGER NOT NULL,
+        per REAL,
+        per_6m REAL,
+        per_12m REAL,
+        per_36m REAL,
+        per_z REAL,
+        per_mom REAL,
+        market_pct REAL,
+        PRIMARY KEY (apt_id, yyyymm)
+    )
+    ''',
+    f'CREATE INDEX IF NOT EXISTS {STATS_TABLE}_month ON {STATS_TABLE} (yyyymm)',
+]
+
+# 아파트별 마지막 달 (Home 순위용)
+LATEST_VIEW = f'''
+    {STATS_TABLE}_latest AS
+    SELECT s.* FROM {STATS_TABLE} s
+    JOIN (SELECT apt_id, MAX(yyyymm) AS yyyymm FROM {STATS_TABLE} GROUP BY apt_id) m USING (apt_id, yyyymm)
+'''
+
+MARKET_PCT_SQL = [
+    f'UPDATE {STATS_TABLE} SET market_pct = NULL WHERE per IS NULL AND yyyymm >= :from_month',
+    f'''
+    UPDATE {STATS_TABLE} SET market_pct = r.pct
+    FROM (
+        SELECT apt_id, yyyymm, CUME_DIST() OVER (PARTITION BY yyyymm ORDER BY per) AS pct
+        FROM {STATS_TABLE}
+        WHERE per IS NOT NULL AND yyyymm >= :from_month
+    ) r
+    WHERE {STATS_TABLE}.apt_id = r.apt_id AND {STATS_TABLE}.yyyymm = r.yyyymm
+    ''',
+]
+
+
+def ensure_stats_table(run_sql=execute_sql):
+    for sql in DDL:
+        run_sql(sql)
+    # Postgres는 CREATE VIEW IF NOT EXISTS가 없고, SQLite는 CREATE OR REPLACE VIEW가 없다
+    run_sql(('CREATE OR REPLACE VIEW ' if BACKEND == 'postgresql' else 'CREATE VIEW IF NOT EXISTS ') + LATEST_VIEW)
+
+
+def calendar_mean(values, apt_ids, yyyymm, months):
+    """
+    (apt_id, yyyymm) 순으로 정렬된 배열에서 같은 아파트의 최근 months개월(그 달 포함, 달력 기준) 행 평균
+    NaN은 빼고 평균, 창 안에 값이 하나도 없으면 NaN
+    """
+    values = np.asarray(values, dtype=float)
+    yyyymm = np.asarray(yyyymm, dtype=np.int64)
+    ordinal = yyyymm // 100 * 12 + yyyymm % 100 - 1
+    # 아파트 순번을 앞에 붙인 정렬 키 (다른 아파트 행이 창에 들어오지 않을 만큼 간격을 둔다)
+    _, apt_rank = np.unique(np.asarray(apt_ids), return_inverse=True)
+    key = apt_rank.astype(np.int64) * (int(ordinal.max(initial=0)) + months + 1) + ordinal
+    lo = np.searchsorted(key, key - months, side='right')
+
+    valid = ~np.isnan(values)
+    csum = np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))])
+    ccnt = np.concatenate([[0], np.cumsum(valid)])
+    i = np.arange(len(values))
+    count = ccnt[i + 1] - ccnt[lo]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, (csum[i + 1] - csum[lo]) / count, np.nan)
+
+
+def expanding_z(values, pos, min_count=Z_MIN_MONTHS):
+    """아파트별로 정렬된 배열에서 처음부터 그 행까지의 평균/표준편차 기준 z-score (NaN은 빼고)"""
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    v = np.where(valid, values, 0.0)
+    csum = np.concatenate([[0.0], np.cumsum(v)])
+    csq = np.concatenate([[0.0], np.cumsum(v * v)])
+    ccnt = np.concatenate([[0], np.cumsum(valid)])
+    i = np.arange(len(values))
+    lo = i - pos
+    n = ccnt[i + 1] - ccnt[lo]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (csum[i + 1] - csum[lo]) / n
+        var = ((csq[i + 1] - csq[lo]) - n * mean * mean) / (n - 1)
+        std = np.sqrt(np.maximum(var, 0))
+        return np.where(valid & (n >= min_count) & (std > 0), (values - mean) / std, np.nan)
+
+
+def compute_stats(panel):
+    """build_panel 결과 -> STATS_COLUMNS 프레임 (market_pct 제외)"""
+    stats = panel[['apt_id', 'yyyymm']].copy()
+    pos = panel.groupby('apt_id').cumcount().to_numpy()
+    per = panel['PER'].to_numpy(dtype=float)
+    stats['per'] = per
+    for window in ROLLING_WINDOWS:
+        stats[f'per_{window}m'] = calendar_mean(per, panel['apt_id'].to_numpy(), panel['yyyymm'].to_numpy(), window)
+    stats['per_z'] = expanding_z(per, pos)
+    prev = np.concatenate([[np.nan], per[:-1]])
+    stats['per_mom'] = np.where(pos > 0, per - prev, np.nan)
+    return stats
+
+
+def _records(stats):
+    """copy_rows에 넘길 튜플 (NaN -> NULL, numpy 값 -> 파이썬 값)"""
+    stats = stats[STATS_COLUMNS].astype(object)
+    return stats.where(stats.notna(), None).itertuples(index=False, name=None)
+
+
+def write_stats(stats, apt_ids=None, from_month=0):
+    """
+    from_month 이후 통계를 upsert 하고, 시세가 사라진 달의 행은 지운 뒤 market_pct 다시 계산
+    apt_ids: 다시 계산한 아파트 (None이면 전체)
+    """
+    stats = stats[stats['yyyymm'] >= from_month]
+    n = copy_rows(STATS_TABLE, STATS_COLUMNS, _records(stats), on_conflict='apt_id, yyyymm')
+
+    params = {'from_month': from_month}
+    apt_filter = ''
+    if apt_ids is not None:
+        params.update({f'apt_id_{i}': apt_id for i, apt_id in enumerate(apt_ids)})
+        apt_filter = f"AND apt_id IN ({', '.join(':apt_id_' + str(i) for i in range(len(apt_ids)))})"
+    execute_sql(f'''
+        DELETE FROM {STATS_TABLE}
+        WHERE yyyymm >= :from_month {apt_filter}
+          AND NOT EXISTS (
+              SELECT 1 FROM price_monthly m
+              WHERE m.apt_id = {STATS_TABLE}.apt_id AND m.yyyymm = {STATS_TABLE}.yyyymm AND m.deal_type IN (1, 3)
+          )
+    ''', params)
+    for sql in MARKET_PCT_SQL:
+        execute_sql(sql, {'from_month': from_month})
+    return n
+
+
+def refresh_per_stats(full=False):
+    """
+    per_stats 갱신 (full이거나 커서가 없으면 전체, 아니면 변경 로그 기준 증분)
+    반환값: 다시 쓴 행 수
+    """
+    ensure_stats_table()
+    changes, cursor = pending_changes(supabase, CONSUMER, full)
+
+    if changes is None:
+        n = write_stats(compute_stats(build_panel(load_long(execute_sql))))
+        logger.info("per_stats 전체 계산: %d행", n)
+    else:
+        # PER은 매매(1)/월세(3)만 본다
+        from_months = changed_from_months([c for c in changes if c['deal_type'] in (1, 3)])
+        if not from_months:
+            logger.info("per_stats: 바뀐 아파트 없음")
+            save_cursor(supabase, CONSUMER, cursor)
+            return 0
+        apt_ids = sorted(from_months)
+        from_month = min(from_months.values())
+        n = write_stats(compute_stats(build_panel(load_long(execute_sql, apt_ids))), apt_ids, from_month)
+        logger.info("per_stats 증분 계산: 아파트 %d개, %s 이후 %d행", len(apt_ids), from_month, n)
+
+    save_cursor(supabase, CONSUMER, cursor)
+    return n
+
+
+if __name__ == "__main__":
+    from pipeline_metrics import setup_logging
+
+    parser = argparse.ArgumentParser(description="PER 통계 사전 계산")
+    parser.add_argument('--full', action='store_true', help="변경 로그와 상관없이 전체 다시 계산")
+    args = parser.parse_args()
+
+    setup_logging()
+    refresh_per_stats(args.full)
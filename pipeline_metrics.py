@@ -0,0 +1,258 @@
+"""
+수집/갱신 파이프라인 로깅 및 메트릭 모듈
+
+- setup_logging(): print 대신 쓰는 레벨별 로깅 설정 (LOG_LEVEL, LOG_FORMAT=json 환경변수)
+- stage(): 단계별(plan, fetch, decrypt, aggregate, write) 소요 시간 측정
+- http_get(): 호스트별 HTTP 지연시간/다운로드 바이트를 기록하는 requests.get 래퍼
+- rows_written(): 테이블별 DB 쓰기 행 수 기록
+- write_prometheus() / serve_prometheus(): Prometheus 텍스트 포맷으로 파일 또는 로컬 HTTP 포트에 내보내기
+- compare_runs(): 이전 실행의 메트릭 파일과 비교해서 단계별 평균 시간 변화를 출력
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Prometheus 기본 히스토그램 버킷 (초)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class JsonFormatter(logging.Formatter):
+    """로그 한 줄을 JSON 객체로 출력 (extra로 넘긴 필드 포함)"""
+    _reserved = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+    def format(self, record):
+        data = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        data.update({k: v for k, v in vars(record).items() if k not in self._reserved})
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def setup_logging(level=None):
+    """
+    스크립트 진입점에서 한 번 호출
+    LOG_LEVEL (기본 INFO), LOG_FORMAT=json 이면 JSON 한 줄 로그
+    """
+    level = level or os.environ.get("LOG_LEVEL", "INFO")
+    handler = logging.StreamHandler()
+    if os.environ.get("LOG_FORMAT") == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, b in enumerate(self.buckets):
+            if value <= b:
+                self.counts[i] += 1
+
+
+class MetricsRegistry:
+    """카운터와 히스토그램을 담는 스레드 안전한 저장소"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((labels or {}).items()))
+
+    def inc(self, name, value=1, labels=None, help_text=None):
+        with self._lock:
+            key = self._key(name, labels)
+            self._counters[key] = self._counters.get(key, 0) + value
+            if help_text:
+                self._help.setdefault(name, help_text)
+
+    def observe(self, name, value, labels=None, help_text=None, buckets=DEFAULT_BUCKETS):
+        with self._lock:
+            key = self._key(name, labels)
+            if key not in self._histograms:
+                self._histograms[key] = _Histogram(buckets)
+            self._histograms[key].observe(value)
+            if help_text:
+                self._help.setdefault(name, help_text)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """Prometheus 텍스트 포맷 문자열"""
+        def fmt_labels(labels, extra=None):
+            items = list(labels) + (extra or [])
+            if not items:
+                return ''
+            return '{' + ','.join(f'{k}="{str(v)}"' for k, v in items) + '}'
+
+        lines = []
+        with self._lock:
+            for name in sorted({n for n, _ in self._counters}):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for (n, labels), v in sorted(self._counters.items()):
+                    if n == name:
+                        lines.append(f"{name}{fmt_labels(labels)} {v}")
+            for name in sorted({n for n, _ in self._histograms}):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for (n, labels), h in sorted(self._histograms.items()):
+                    if n != name:
+                        continue
+                    for b, c in zip(h.buckets, h.counts):
+                        lines.append(f"{name}_bucket{fmt_labels(labels, [('le', b)])} {c}")
+                    lines.append(f"{name}_bucket{fmt_labels(labels, [('le', '+Inf')])} {h.count}")
+                    lines.append(f"{name}_sum{fmt_labels(labels)} {h.sum}")
+                    lines.append(f"{name}_count{fmt_labels(labels)} {h.count}")
+        return '\n'.join(lines) + '\n'
+
+
+# 전역 레지스트리
+metrics = MetricsRegistry()
+
+
+@contextmanager
+def stage(name):
+    """
+    단계별 소요 시간 측정
+    with stage('fetch'):
+        ...
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe('pipeline_stage_duration_seconds', time.perf_counter() - start, {'stage': name},
+                        help_text="Time spent per pipeline stage")
+
+
+def http_get(url, **kwargs):
+    """호스트별 지연시간, 상태 코드, 다운로드 바이트를 기록하는 requests.get"""
+    host = urlparse(url).netloc
+    start = time.perf_counter()
+    try:
+        r = requests.get(url, **kwargs)
+    except Exception:
+        metrics.inc('http_requests_total', labels={'host': host, 'status': 'error'},
+                    help_text="HTTP requests by host and status")
+        raise
+    finally:
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - start, {'host': host},
+                        help_text="HTTP request latency by host")
+    metrics.inc('http_requests_total', labels={'host': host, 'status': str(r.status_code)},
+                help_text="HTTP requests by host and status")
+    metrics.inc('http_response_bytes_total', len(r.content), {'host': host},
+                help_text="Bytes downloaded by host")
+    return r
+
+
+def rows_written(table, n=1):
+    """DB에 쓴 행 수 기록"""
+    metrics.inc('db_rows_written_total', n, {'table': table}, help_text="Rows written to the database")
+
+
+def write_prometheus(path, keep_previous=True):
+    """
+    메트릭을 Prometheus 텍스트 포맷 파일로 기록
+    keep_previous=True면 기존 파일을 '<path>.prev'로 남겨서 다음 실행과 비교할 수 있게 한다
+    """
+    if keep_previous and os.path.exists(path):
+        shutil.copyfile(path, path + '.prev')
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(metrics.render())
+    os.replace(tmp, path)
+
+
+def serve_prometheus(port, addr='127.0.0.1'):
+    """로컬 HTTP 포트에서 /metrics 제공 (데몬 스레드)"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info("메트릭 서버 시작: http://%s:%d/metrics", addr, port)
+    return server
+
+
+def parse_prometheus(path):
+    """Prometheus 텍스트 파일을 {'name{labels}': value} dict로 읽기"""
+    values = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            key, _, value = line.rpartition(' ')
+            values[key] = float(value)
+    return values
+
+
+def compare_runs(prev_path, cur_path, threshold=0.2):
+    """
+    이전 실행과 현재 실행의 단계/호스트별 평균 시간(_sum/_count)을 비교
+    threshold 비율 이상 느려진 항목은 WARNING으로 남기고, 비교 결과 리스트를 반환
+    """
+    prev, cur = parse_prometheus(prev_path), parse_prometheus(cur_path)
+    result = []
+    for key, total in cur.items():
+        if '_sum' not in key:
+            continue
+        count_key = key.replace('_sum', '_count', 1)
+        if not cur.get(count_key) or not prev.get(count_key) or key not in prev:
+            continue
+        before = prev[key] / prev[count_key]
+        after = total / cur[count_key]
+        change = (after - before) / before if before else 0.0
+        result.append((key.replace('_sum', '', 1), before, after, change))
+        log = logger.warning if change >= threshold else logger.info
+        log("%s 평균 %.4fs -> %.4fs (%+.0f%%)", key.replace('_sum', '', 1), before, after, change * 100)
+    return result
+
+
+def export(metrics_file=None):
+    """스크립트 종료 시 호출: 파일로 기록하고 이전 실행과 비교"""
+    if metrics_file:
+        write_prometheus(metrics_file)
+        if os.path.exists(metrics_file + '.prev'):
+            compare_runs(metrics_file + '.prev', metrics_file)
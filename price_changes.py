@@ -0,0 +1,184 @@
+"""
+월별 시세 변경 로그(price_change)
+
+시세 쓰기(DB 함수 merge_price_trend, price_trend_store.write_price_trend / save_series가 부름)와 아파트 삭제가
+바뀐 구간을 한 행씩 남긴다. 시세 쓰기는 price_trend, price_monthly와 같은 트랜잭션에서 남기므로
+시세만 바뀌고 로그가 빠지는 일이 없다.
+- id: 계속 늘어나는 순번 (소비자는 마지막으로 읽은 id를 커서로 저장)
+- apt_id, deal_type: 바뀐 시리즈 (unit id, 1 매매 / 2 전세 / 3 월세)
+- from_month, to_month: 바뀐 yyyymm 구간 (to_month가 NULL이면 from_month 이후 전부)
+- kind: 'insert' 새 시리즈, 'merge' 기존 시리즈에 병합, 'replace' from_month 이후를 다시 씀 (사라진 달 포함),
+        'deactivate' status 0으로 변경
+PER 계산, Parquet 내보내기, 캐시 등은 pending_changes()로 커서 이후 변경만 읽어서 해당 아파트만 다시 처리하고,
+처리가 끝나면 save_cursor()로 커서를 옮긴다. 소비자별 커서는 change_cursor 테이블에 저장한다.
+
+id는 커밋 순서가 아니라 발급 순서라서, 읽을 때 head보다 작은 id가 아직 커밋 전일 수 있다.
+그래서 커서는 마지막 id와 함께 그때 비어 있던 id(gaps)를 기억하고, 다음 번에 그 id들을 다시 읽어서
+그 사이 커밋된 변경을 포함한다 (changes_until). head보다 GAP_WINDOW개 넘게 뒤처진 빈 id는
+롤백이나 실패한 INSERT로 영영 비어 있는 것으로 보고 잊는다.
+client는 local_db.supabase 또는 Supabase 클라이언트
+"""
+import json
+
+from price_monthly import to_yyyymm
+
+CHANGE_TABLE = 'price_change'
+CURSOR_TABLE = 'change_cursor'
+# 커밋이 늦은 변경을 기다리는 범위 (head 기준 id 수)
+GAP_WINDOW = 10000
+
+DDL = [
+    f'''
+    CREATE TABLE IF NOT EXISTS {CHANGE_TABLE} (
+        id BIGSERIAL PRIMARY KEY,
+        apt_id INTEGER NOT NULL,
+        deal_type SMALLINT NOT NULL,
+        from_month INTEGER,
+        to_month INTEGER,
+        kind TEXT NOT NULL,
+        changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    ''',
+    # 오래된 로그 정리용
+    f'CREATE INDEX IF NOT EXISTS {CHANGE_TABLE}_changed_at ON {CHANGE_TABLE} (changed_at)',
+    f'''
+    CREATE TABLE IF NOT EXISTS {CURSOR_TABLE} (
+        consumer TEXT PRIMARY KEY,
+        last_id BIGINT NOT NULL DEFAULT 0,
+        gaps TEXT
+    )
+    ''',
+    # gaps 컬럼이 생기기 전에 만든 테이블 (Postgres만, 임베디드는 schema.py bootstrap이 위 DDL로 만든다)
+    f'ALTER TABLE {CURSOR_TABLE} ADD COLUMN IF NOT EXISTS gaps TEXT',
+]
+
+
+def ensure_change_table(execute_sql):
+    """price_change, change_cursor 테이블 생성 (local_db.execute_sql을 넘겨받음)"""
+    for sql in DDL:
+        execute_sql(sql)
+
+
+def change_row(apt_id, deal_type, kind, amount=(), replace_from=None):
+    """
+    시리즈 하나의 변경 로그 행 (id 제외)
+    amount: 쓴 월별 데이터 (바뀐 구간 계산용), replace_from: 'YYYYMM' (kind='replace')
+    반환값: dict (기록할 구간이 없으면 None)
+    """
+    months = [to_yyyymm(d['date']) for d in amount]
+    if replace_from is not None:
+        months.append(to_yyyymm(replace_from))
+    if not months and kind != 'deactivate':
+        return None
+    return {
+        'apt_id': apt_id,
+        'deal_type': int(deal_type),
+        'from_month': min(months) if months else None,
+        # replace는 replace_from 이후 기존 달이 지워질 수 있어서 끝을 열어 둔다
+        'to_month': max(months) if months and kind != 'replace' else None,
+        'kind': kind,
+    }
+
+
+def record_change(client, apt_id, deal_type, kind, amount=(), replace_from=None):
+    """
+    시리즈 하나의 변경을 기록 (시세 쓰기는 merge_price_trend가 남기므로 아파트 삭제 같은 다른 변경용)
+    반환값: 변경 로그 id (기록할 구간이 없으면 None)
+    """
+    row = change_row(apt_id, deal_type, kind, amount, replace_from)
+    if row is None:
+        return None
+    rows = client.table(CHANGE_TABLE).insert(row).execute().data
+    return rows[0]['id'] if rows else None
+
+
+def changes_since(client, cursor=0, limit=1000):
+    """
+    커서(id) 이후의 변경을 id 순으로 최대 limit개
+    반환값: (변경 리스트, 다음 커서) - 더 읽을 게 없으면 다음 커서는 넘겨받은 커서와 같다
+    """
+    rows = client.table(CHANGE_TABLE).select('*').gt('id', cursor).order('id').limit(limit).execute().data or []
+    return rows, (rows[-1]['id'] if rows else cursor)
+
+
+def changes_until(client, cursor, head, gaps=(), limit=5000):
+    """
+    커서 이후 head(latest_change_id로 미리 읽은 id)까지의 변경 전부
+    gaps: 지난번에 비어 있던 id (그 사이 커밋됐으면 함께 돌려준다)
+    반환값: (변경 리스트 id 순, 이번에도 비어 있는 id 리스트) - 빈 id는 다음 번에 gaps로 넘긴다
+    """
+    changes = []
+    if gaps:
+        changes = client.table(CHANGE_TABLE).select('*').in_('id', list(gaps)).execute().data or []
+    start = cursor
+    while cursor < head:
+        rows, cursor = changes_since(client, cursor, limit)
+        if not rows:
+            break
+        changes.extend(c for c in rows if c['id'] <= head)
+    seen = {c['id'] for c in changes}
+    candidates = [*gaps, *range(max(start, head - GAP_WINDOW) + 1, head + 1)]
+    return sorted(changes, key=lambda c: c['id']), [i for i in candidates if i not in seen and i > head - GAP_WINDOW]
+
+
+def missing_ids(client, head):
+    """head 이전 GAP_WINDOW개 id 중 아직 보이지 않는 id (처음부터 다시 계산하는 소비자의 gaps)"""
+    rows = client.table(CHANGE_TABLE).select('id').gt('id', head - GAP_WINDOW).lte('id', head).execute().data or []
+    seen = {r['id'] for r in rows}
+    return [i for i in range(max(head - GAP_WINDOW, 0) + 1, head + 1) if i not in seen]
+
+
+def pending_changes(client, consumer, full=False):
+    """
+    소비자가 다시 처리할 변경: 커서 이후 지금까지 + 지난번에 커밋 전이던(비어 있던 id) 변경
+    반환값: (변경 리스트, 새 커서) - full이거나 처음 실행(커서 없음)이면 변경 리스트는 None (전체 다시 계산)
+    처리가 끝난 뒤에 save_cursor(client, consumer, 새 커서)로 저장해야 실패한 실행의 변경을 다음 실행이 다시 읽는다
+    """
+    head = latest_change_id(client)
+    cursor = None if full else get_cursor(client, consumer)
+    if cursor is None:
+        return None, {'last_id': head, 'gaps': missing_ids(client, head)}
+    changes, gaps = changes_until(client, cursor['last_id'], head, cursor['gaps'])
+    return changes, {'last_id': head, 'gaps': gaps}
+
+
+def latest_change_id(client):
+    """지금까지 기록된 마지막 변경 id (없으면 0)"""
+    rows = client.table(CHANGE_TABLE).select('id').order('id', desc=True).limit(1).execute().data
+    return rows[0]['id'] if rows else 0
+
+
+def changed_apt_ids(changes):
+    """변경 리스트에서 다시 처리할 apt_id 목록 (중복 제거, 정렬)"""
+    return sorted({c['apt_id'] for c in changes})
+
+
+def changed_from_months(changes):
+    """apt_id별로 바뀐 가장 이른 yyyymm ({apt_id: yyyymm}, 구간이 없는 변경은 0 = 처음부터)"""
+    result = {}
+    for c in changes:
+        month = c['from_month'] or 0
+        result[c['apt_id']] = min(result.get(c['apt_id'], month), month)
+    return result
+
+
+def get_cursor(client, consumer):
+    """소비자(예: 'per_stats')의 커서 {'last_id': 마지막으로 처리한 변경 id, 'gaps': 그때 비어 있던 id} (처음이면 None)"""
+    rows = client.table(CURSOR_TABLE).select('last_id, gaps').eq('consumer', consumer).limit(1).execute().data
+    if not rows:
+        return None
+    return {'last_id': rows[0]['last_id'], 'gaps': json.loads(rows[0]['gaps'] or '[]')}
+
+
+def save_cursor(client, consumer, cursor):
+    """pending_changes가 돌려준 커서 저장"""
+    client.table(CURSOR_TABLE).upsert({
+        'consumer': consumer,
+        'last_id': cursor['last_id'],
+        'gaps': json.dumps(cursor['gaps']),
+    }, on_conflict='consumer').execute()
+
+
+def prune_changes(client, before):
+    """changed_at이 before(ISO 시각 문자열)보다 이전인 로그 삭제, 반환값: 삭제한 행 수"""
+    return client.table(CHANGE_TABLE).delete().lte('changed_at', before).execute().count
@@ -0,0 +1,188 @@
+"""
+빈 달을 채운 월별 시세(price_dense) 읽기/쓰기 모듈
+
+price_monthly는 거래가 있는 달만 있어서 화면마다 매매/전세/월세를 날짜로 바꾸고 합치고 정렬하고 앞 값으로 채웠다.
+시리즈를 쓸 때(price_trend_store의 write_price_trend / save_series) 아파트마다 한 번 채워서 저장해 두고
+화면은 load_dense()로 바로 그릴 수 있는 프레임을 받는다 (합치기/날짜 파싱 없음).
+- 달력: 아파트의 첫 거래 달부터 마지막 거래 달까지(거래유형 상관없이) 빠짐없는 달, 세 거래유형 모두 같은 달 목록
+- avg: 그 달 시세, 거래가 없는 달은 이전 달 값, 그 거래유형의 첫 거래 전은 NULL
+- cnt: 거래량 (채운 달은 0), observed: 실제 거래가 있는 달이면 참
+빈 달은 앞 달 값을 쓰므로 바뀐 달 이후는 모두 다시 쓴다.
+
+client는 local_db.supabase 또는 Supabase 클라이언트
+
+사용법 (기존 데이터 전체 채우기):
+    python price_dense.py
+"""
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+
+from apt_analytics import COLUMNS, masked_per, month_index
+from price_monthly import MONTHLY_TABLE
+
+logger = logging.getLogger(__name__)
+
+DENSE_TABLE = 'price_dense'
+DENSE_COLUMNS = ['apt_id', 'deal_type', 'yyyymm', 'avg', 'cnt', 'observed']
+DEAL_TYPES = {1: 'sale', 2: 'jeonse', 3: 'rent'}
+# 시리즈 이름 -> 관측 여부 컬럼 (load_dense)
+OBSERVED_COLUMNS = {'sale': '매매 관측', 'jeonse': '전세 관측', 'rent': '월세 관측'}
+
+DDL = [
+    f'''
+    CREATE TABLE IF NOT EXISTS {DENSE_TABLE} (
+        apt_id INTEGER NOT NULL,
+        deal_type SMALLINT NOT NULL,
+        yyyymm INTEGER NOT NULL,
+        avg DOUBLE PRECISION,
+        cnt INTEGER NOT NULL DEFAULT 0,
+        observed BOOLEAN NOT NULL,
+        PRIMARY KEY (apt_id, deal_type, yyyymm)
+    )
+    ''',
+]
+
+
+def ensure_dense_table(execute_sql):
+    for sql in DDL:
+        execute_sql(sql)
+
+
+def _to_ordinal(yyyymm):
+    yyyymm = np.asarray(yyyymm, dtype=np.int64)
+    return yyyymm // 100 * 12 + yyyymm % 100 - 1
+
+
+def compute_dense(long):
+    """
+    긴 형식(apt_id, deal_type, yyyymm, avg, cnt) -> DENSE_COLUMNS 프레임 (apt_id, deal_type, yyyymm 순 정렬)
+    여러 아파트를 한 번에 계산한다
+    """
+    apt_ids, apt_pos = np.unique(long['apt_id'].to_numpy(), return_inverse=True)
+    ordinal = _to_ordinal(long['yyyymm'])
+    first = np.full(len(apt_ids), np.iinfo(np.int64).max)
+    last = np.full(len(apt_ids), np.iinfo(np.int64).min)
+    np.minimum.at(first, apt_pos, ordinal)
+    np.maximum.at(last, apt_pos, ordinal)
+
+    # 아파트마다 첫 달~마지막 달 칸을 이어 붙인 달력 (거래유형마다 같은 길이)
+    lengths = last - first + 1
+    offset = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    size = lengths.sum()
+    owner = np.repeat(np.arange(len(apt_ids)), lengths)
+    months = first[owner] + np.arange(size) - offset[owner]
+
+    deal_type = long['deal_type'].to_numpy().astype(int)
+    cell = offset[apt_pos] + ordinal - first[apt_pos]
+    frames = []
+    for dt in DEAL_TYPES:
+        mask = deal_type == dt
+        avg = np.full(size, np.nan)
+        cnt = np.zeros(size, dtype=np.int64)
+        observed = np.zeros(size, dtype=bool)
+        avg[cell[mask]] = long['avg'].to_numpy(dtype=float)[mask]
+        cnt[cell[mask]] = long['cnt'].to_numpy()[mask]
+        observed[cell[mask]] = True
+        # 아파트 경계를 넘지 않게 앞 값 채우기 (마지막 거래 칸이 이 아파트 시작보다 앞이면 아직 거래 없음)
+        idx = np.where(observed, np.arange(size), -1)
+        np.maximum.accumulate(idx, out=idx)
+        filled = np.where(idx >= offset[owner], avg[np.maximum(idx, 0)], np.nan)
+        frames.append(pd.DataFrame({'apt_id': apt_ids[owner], 'deal_type': dt, 'yyyymm': months // 12 * 100 + months % 12 + 1,
+                                    'avg': filled, 'cnt': cnt, 'observed': observed}))
+    return pd.concat(frames, ignore_index=True).sort_values(['apt_id', 'deal_type', 'yyyymm'], ignore_index=True)
+
+
+def _records(dense):
+    """upsert/copy_rows에 넘길 dict (NaN -> None, numpy 값 -> 파이썬 값)"""
+    dense = dense[DENSE_COLUMNS].astype(object)
+    return dense.where(dense.notna(), None).to_dict('records')
+
+
+def refresh_dense(client, apt_id, from_month=None):
+    """
+    한 아파트/평형의 from_month(yyyymm, None이면 처음) 이후 채운 시세를 price_monthly에서 다시 만들어서 저장
+    새 거래유형이 처음 들어오면 그 이전 달의 빈 행도 있어야 하므로 None으로 부른다
+    반환값: 쓴 행 수
+    """
+    rows = client.table(MONTHLY_TABLE).select('apt_id, deal_type, yyyymm, avg, cnt').eq('apt_id', apt_id).execute().data or []
+    long = pd.DataFrame(rows, columns=['apt_id', 'deal_type', 'yyyymm', 'avg', 'cnt'])
+    dense = compute_dense(long) if not long.empty else pd.DataFrame(columns=DENSE_COLUMNS)
+    if from_month is not None:
+        dense = dense[dense['yyyymm'] >= from_month]
+
+    # 달력 끝이 당겨진(마지막 거래가 사라진) 달
+    query = client.table(DENSE_TABLE).delete().eq('apt_id', apt_id)
+    if from_month is not None:
+        query = query.gte('yyyymm', from_month)
+    if len(dense):
+        query = query.not_.in_('yyyymm', sorted({int(m) for m in dense['yyyymm']}))
+    query.execute()
+    if len(dense):
+        client.table(DENSE_TABLE).upsert(_records(dense), on_conflict='apt_id, deal_type, yyyymm').execute()
+    return len(dense)
+
+
+def load_dense(client, apt_id, start=None, end=None):
+    """
+    채운 시세를 apt_analytics.align_series와 같은 모양의 프레임으로 읽기
+    index month(period[M]), Date, 매매가/전세/월세(첫 거래 전은 0), 거래량, 매매/전세/월세 관측(bool), PER
+    start/end: 'YYYYMM' (포함), 저장된 행이 없으면 빈 프레임
+    """
+    query = client.table(DENSE_TABLE).select('deal_type, yyyymm, avg, cnt, observed').eq('apt_id', apt_id)
+    if start is not None:
+        query = query.gte('yyyymm', int(start))
+    if end is not None:
+        query = query.lte('yyyymm', int(end))
+    rows = pd.DataFrame(query.order('deal_type').order('yyyymm').execute().data or [],
+                        columns=['deal_type', 'yyyymm', 'avg', 'cnt', 'observed'])
+
+    # 거래유형마다 같은 달 목록이라 잘라서 이어 붙이기만 한다
+    months = np.unique(rows['yyyymm'].to_numpy(dtype=np.int64))
+    df = pd.DataFrame(index=month_index(months))
+    df.insert(0, 'Date', df.index.to_timestamp())
+    for dt, name in DEAL_TYPES.items():
+        price_col, volume_col = COLUMNS[name]
+        part = rows[rows['deal_type'] == dt]
+        pos = np.searchsorted(months, part['yyyymm'].to_numpy(dtype=np.int64))
+        price, volume, observed = np.zeros(len(months)), np.zeros(len(months), dtype=np.int64), np.zeros(len(months), dtype=bool)
+        price[pos] = part['avg'].to_numpy(dtype=float)
+        volume[pos] = part['cnt'].to_numpy(dtype=np.int64)
+        observed[pos] = part['observed'].to_numpy(dtype=bool)
+        df[price_col] = np.nan_to_num(price)
+        df[volume_col] = volume
+        df[OBSERVED_COLUMNS[name]] = observed
+    df['PER'] = masked_per(df['매매가'], df['월세'])
+    return df
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    from pipeline_metrics import setup_logging
+
+    parser = argparse.ArgumentParser(description="price_dense 전체 다시 만들기")
+    parser.parse_args()
+
+    # Load environment variables from the .env file
+    load_dotenv()
+    setup_logging()
+
+    # 로컬 DB 사용
+    from local_db import execute_sql, copy_rows
+
+    ensure_dense_table(execute_sql)
+    long = pd.DataFrame(execute_sql(f'SELECT apt_id, deal_type, yyyymm, avg, cnt FROM {MONTHLY_TABLE}').data,
+                        columns=['apt_id', 'deal_type', 'yyyymm', 'avg', 'cnt'])
+    dense = compute_dense(long)
+    n = copy_rows(DENSE_TABLE, DENSE_COLUMNS, _records(dense), on_conflict='apt_id, deal_type, yyyymm')
+    # 달력 밖이 된 행 (아파트 삭제, 마지막 거래가 사라진 달)
+    execute_sql(f'''
+        DELETE FROM {DENSE_TABLE}
+        WHERE yyyymm > (SELECT MAX(m.yyyymm) FROM {MONTHLY_TABLE} m WHERE m.apt_id = {DENSE_TABLE}.apt_id)
+           OR yyyymm < (SELECT MIN(m.yyyymm) FROM {MONTHLY_TABLE} m WHERE m.apt_id = {DENSE_TABLE}.apt_id)
+           OR NOT EXISTS (SELECT 1 FROM {MONTHLY_TABLE} m WHERE m.apt_id = {DENSE_TABLE}.apt_id)
+    ''')
+    logger.info("price_dense: 아파트 %d개, %d행 (거래 있는 달 %d행)", long['apt_id'].nunique(), n, len(long))
@@ -0,0 +1,151 @@
+"""
+월별 전세가율/임대수익률/전월세 전환율(price_metrics) 읽기/쓰기 모듈
+
+시리즈를 쓸 때(price_trend_store의 write_price_trend / save_series) 그 아파트의 매매/전세/월세 월별 시세를
+apt_analytics.align_series와 같은 규칙(하나라도 있는 달만, 빈 달은 이전 달 값)으로 맞춰서 한 번에 계산하고
+(apt_id, yyyymm) 한 행에 저장한다.
+- jeonse_ratio: 전세 / 매매가 (전세가율)
+- rent_yield: 월세 * 12 / 매매가 (세전 임대수익률, 1 / PER)
+- conv_rate: 월세 * 12 / 전세 (전세를 월세로 바꿀 때의 연 환산율, 시세에 월세 보증금이 없어서 0으로 본다)
+분자나 분모 쪽 거래가 아직 없는 달은 NULL. 빈 달은 앞 달 값을 쓰므로 바뀐 달 이후는 모두 다시 쓴다.
+화면은 get_metrics(), Home은 price_metrics_latest 뷰를 읽기만 한다.
+
+client는 local_db.supabase 또는 Supabase 클라이언트
+
+사용법 (기존 데이터 전체 채우기):
+    python price_metrics.py
+"""
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+
+from price_monthly import MONTHLY_TABLE
+
+logger = logging.getLogger(__name__)
+
+METRICS_TABLE = 'price_metrics'
+METRIC_COLUMNS = ['jeonse_ratio', 'rent_yield', 'conv_rate']
+
+DDL = [
+    f'''
+    CREATE TABLE IF NOT EXISTS {METRICS_TABLE} (
+        apt_id INTEGER NOT NULL,
+        yyyymm INTEGER NOT NULL,
+        jeonse_ratio REAL,
+        rent_yield REAL,
+        conv_rate REAL,
+        PRIMARY KEY (apt_id, yyyymm)
+    )
+    ''',
+]
+
+# 아파트별 마지막 달 (Home 목록용)
+LATEST_VIEW = f'''
+    {METRICS_TABLE}_latest AS
+    SELECT p.* FROM {METRICS_TABLE} p
+    JOIN (SELECT apt_id, MAX(yyyymm) AS yyyymm FROM {METRICS_TABLE} GROUP BY apt_id) m USING (apt_id, yyyymm)
+'''
+
+
+def ensure_metrics_table(execute_sql, backend='postgresql'):
+    """price_metrics 테이블과 price_metrics_latest 뷰 생성"""
+    for sql in DDL:
+        execute_sql(sql)
+    # Postgres는 CREATE VIEW IF NOT EXISTS가 없고, SQLite는 CREATE OR REPLACE VIEW가 없다
+    execute_sql(('CREATE OR REPLACE VIEW ' if backend == 'postgresql' else 'CREATE VIEW IF NOT EXISTS ') + LATEST_VIEW)
+
+
+def _ratio(num, den):
+    """num / den, 둘 중 하나라도 0 이하(아직 거래 없음)인 곳은 NaN"""
+    out = np.full(num.shape, np.nan)
+    np.divide(num, den, out=out, where=(num > 0) & (den > 0))
+    return out
+
+
+def compute_metrics(long):
+    """
+    긴 형식(apt_id, deal_type, yyyymm, avg) -> apt_id, yyyymm, jeonse_ratio, rent_yield, conv_rate
+    여러 아파트를 한 번에 계산한다 (apt_id, yyyymm 순 정렬)
+    """
+    wide = (long.set_index(['apt_id', 'yyyymm', 'deal_type'])['avg']
+            .unstack('deal_type')
+            .reindex(columns=[1, 2, 3])
+            .sort_index())
+    wide = wide.groupby(level='apt_id').ffill().fillna(0)
+    sale, jeonse, rent = (wide[dt].to_numpy(dtype=float) for dt in (1, 2, 3))
+
+    metrics = wide.index.to_frame(index=False)
+    metrics['jeonse_ratio'] = _ratio(jeonse, sale)
+    metrics['rent_yield'] = _ratio(rent * 12, sale)
+    metrics['conv_rate'] = _ratio(rent * 12, jeonse)
+    return metrics
+
+
+def _records(metrics):
+    """upsert/copy_rows에 넘길 dict (NaN -> None, numpy 값 -> 파이썬 값)"""
+    metrics = metrics[['apt_id', 'yyyymm', *METRIC_COLUMNS]].astype(object)
+    return metrics.where(metrics.notna(), None).to_dict('records')
+
+
+def refresh_metrics(client, apt_id, from_month=None):
+    """
+    한 아파트/평형의 from_month(yyyymm, None이면 처음) 이후 지표를 price_monthly에서 다시 계산해서 저장
+    반환값: 쓴 달 수
+    """
+    rows = client.table(MONTHLY_TABLE).select('apt_id, deal_type, yyyymm, avg').eq('apt_id', apt_id).execute().data or []
+    long = pd.DataFrame(rows, columns=['apt_id', 'deal_type', 'yyyymm', 'avg'])
+    metrics = compute_metrics(long) if not long.empty else pd.DataFrame(columns=['apt_id', 'yyyymm', *METRIC_COLUMNS])
+    if from_month is not None:
+        metrics = metrics[metrics['yyyymm'] >= from_month]
+
+    # 시세가 사라진 달
+    query = client.table(METRICS_TABLE).delete().eq('apt_id', apt_id)
+    if from_month is not None:
+        query = query.gte('yyyymm', from_month)
+    if len(metrics):
+        query = query.not_.in_('yyyymm', [int(m) for m in metrics['yyyymm']])
+    query.execute()
+    if len(metrics):
+        client.table(METRICS_TABLE).upsert(_records(metrics), on_conflict='apt_id, yyyymm').execute()
+    return len(metrics)
+
+
+def get_metrics(client, apt_id, start=None, end=None):
+    """한 아파트/평형의 월별 지표 [{'yyyymm', 'jeonse_ratio', 'rent_yield', 'conv_rate'}, ...] (월 순서)"""
+    query = client.table(METRICS_TABLE).select('yyyymm, ' + ', '.join(METRIC_COLUMNS)).eq('apt_id', apt_id)
+    if start is not None:
+        query = query.gte('yyyymm', int(start))
+    if end is not None:
+        query = query.lte('yyyymm', int(end))
+    return query.order('yyyymm').execute().data or []
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    from pipeline_metrics import setup_logging
+
+    parser = argparse.ArgumentParser(description="price_metrics 전체 다시 계산")
+    parser.parse_args()
+
+    # Load environment variables from the .env file
+    load_dotenv()
+    setup_logging()
+
+    # 로컬 DB 사용
+    from local_db import BACKEND, execute_sql, copy_rows
+
+    ensure_metrics_table(execute_sql, BACKEND)
+    long = pd.DataFrame(execute_sql(f'SELECT apt_id, deal_type, yyyymm, avg FROM {MONTHLY_TABLE}').data,
+                        columns=['apt_id', 'deal_type', 'yyyymm', 'avg'])
+    metrics = compute_metrics(long)
+    n = copy_rows(METRICS_TABLE, ['apt_id', 'yyyymm', *METRIC_COLUMNS], _records(metrics), on_conflict='apt_id, yyyymm')
+    execute_sql(f'''
+        DELETE FROM {METRICS_TABLE}
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {MONTHLY_TABLE} m WHERE m.apt_id = {METRICS_TABLE}.apt_id AND m.yyyymm = {METRICS_TABLE}.yyyymm
+        )
+    ''')
+    logger.info("price_metrics: 아파트 %d개, %d행", long['apt_id'].nunique(), n)
@@ -0,0 +1,106 @@
+"""
+월별 시세 정규화 테이블(price_monthly) 읽기/쓰기 모듈
+
+APTInfo.price_trend JSON 대신 (apt_id, deal_type, yyyymm) 한 행에 한 달씩 저장한다.
+- apt_id: 아파트/평형 단위 id (APTInfo에서 같은 name/PY 행들 중 가장 작은 id, APTInfo.apt_id 컬럼)
+- deal_type: 1은 매매, 2는 전세, 3은 월세
+- yyyymm: 202401 같은 정수
+
+읽기 결과는 price_trend와 같은 [{'date': '202401', 'avg': ..., 'min': ..., 'max': ..., 'cnt': ...}, ...] 형식이다.
+client는 local_db.supabase 또는 Supabase 클라이언트
+"""
+MONTHLY_TABLE = 'price_monthly'
+MONTHLY_COLUMNS = ['apt_id', 'deal_type', 'yyyymm', 'avg', 'min', 'max', 'cnt']
+
+DDL = [
+    f'''
+    CREATE TABLE IF NOT EXISTS {MONTHLY_TABLE} (
+        apt_id INTEGER NOT NULL,
+        deal_type SMALLINT NOT NULL,
+        yyyymm INTEGER NOT NULL,
+        avg DOUBLE PRECISION NOT NULL,
+        min DOUBLE PRECISION,
+        max DOUBLE PRECISION,
+        cnt INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (apt_id, deal_type, yyyymm)
+    )
+    ''',
+    # 전체 아파트의 특정 기간을 훑는 분석 쿼리용
+    f'CREATE INDEX IF NOT EXISTS {MONTHLY_TABLE}_deal_month ON {MONTHLY_TABLE} (deal_type, yyyymm)',
+    'ALTER TABLE "APTInfo" ADD COLUMN IF NOT EXISTS apt_id INTEGER',
+    'CREATE INDEX IF NOT EXISTS "APTInfo_apt_id" ON "APTInfo" (apt_id)',
+]
+
+
+def ensure_monthly_table(execute_sql):
+    """price_monthly 테이블과 APTInfo.apt_id 컬럼 생성 (local_db.execute_sql을 넘겨받음)"""
+    for sql in DDL:
+        execute_sql(sql)
+
+
+def to_yyyymm(date):
+    """'202401' / 202401 / None -> 202401 / None"""
+    return int(date) if date not in (None, '') else None
+
+
+def to_rows(apt_id, deal_type, amount):
+    """price_trend 형식 리스트를 price_monthly 행 리스트로 변환"""
+    return [{
+        'apt_id': apt_id,
+        'deal_type': int(deal_type),
+        'yyyymm': int(d['date']),
+        'avg': d['avg'],
+        'min': d.get('min'),
+        'max': d.get('max'),
+        'cnt': d.get('cnt', 0),
+    } for d in amount]
+
+
+def to_price_trend(rows):
+    """price_monthly 행 리스트를 price_trend 형식 리스트로 변환 (월 순서)"""
+    return [{
+        'date': str(r['yyyymm']),
+        'avg': r['avg'],
+        'min': r['min'],
+        'max': r['max'],
+        'cnt': r['cnt'],
+    } for r in sorted(rows, key=lambda r: r['yyyymm'])]
+
+
+def upsert_months(client, apt_id, deal_type, amount, replace_from=None):
+    """
+    월별 데이터를 행 단위로 upsert
+    replace_from('YYYYMM')을 주면 그 달 이후 중 amount에 없는 달은 삭제한다 (price_trend 병합과 같은 의미)
+    """
+    rows = to_rows(apt_id, deal_type, amount)
+    if replace_from is not None:
+        query = client.table(MONTHLY_TABLE).delete().eq('apt_id', apt_id).eq('deal_type', int(deal_type)).gte('yyyymm', int(replace_from))
+        keep = [r['yyyymm'] for r in rows]
+        if keep:
+            # 새로 들어올 달은 지우지 않고 upsert로 덮어쓴다
+            query = query.not_.in_('yyyymm', keep)
+        query.execute()
+    if rows:
+        client.table(MONTHLY_TABLE).upsert(rows, on_conflict='apt_id, deal_type, yyyymm').execute()
+    return len(rows)
+
+
+def get_series(client, apt_id, start=None, end=None, deal_types=(1, 2, 3)):
+    """
+    한 아파트/평형의 거래유형별 월별 시세를 한 번의 쿼리로 가져오기
+    start/end: 'YYYYMM' (포함), None이면 제한 없음
+    반환값: {1: [...], 2: [...], 3: [...]} (price_trend 형식)
+    """
+    query = client.table(MONTHLY_TABLE).select('deal_type, yyyymm, avg, min, max, cnt').eq('apt_id', apt_id)
+    if start is not None:
+        query = query.gte('yyyymm', to_yyyymm(start))
+    if end is not None:
+        query = query.lte('yyyymm', to_yyyymm(end))
+    rows = query.execute().data or []
+
+    series = {int(dt): [] for dt in deal_types}
+    for r in rows:
+        if r['deal_type'] in series:
+            series[r['deal_type']].append(r)
+    return {dt: to_price_trend(rs) for dt, rs in series.items()}
+
@@ -0,0 +1,224 @@
+"""
+전체 아파트 월별 시세 Parquet 스냅샷
+
+price_monthly + APTInfo(name, PY, address, year)를 한 테이블(패널)로 펼쳐서
+deal_type / yyyy(거래 연도) 기준 hive 파티션 Parquet 데이터셋으로 저장한다.
+
+    price_panel/deal_type=1/yyyy=2024/part-0.parquet
+
+- 전체 내보내기: 새 버전 디렉터리(price_panel.<시각>)에 모든 파티션을 쓰고, price_panel 심볼릭 링크를
+  한 번에 바꿔 단다 (읽는 쪽은 항상 이전 버전이나 새 버전 전체를 본다, 바로 이전 버전은 다음 내보내기까지 남겨 둔다)
+- 증분(--incremental): 마지막 내보내기 이후 변경 로그(price_change)에 있는 (거래유형, 연도) 파티션만
+  DB에서 다시 읽어서 통째로 바꿔 쓴다 (행이 모두 지워진 파티션은 삭제). 변경 로그 커서는 _snapshot.json에 둔다
+- load_panel(): pyarrow로 메모리 매핑해서 읽기 (Postgres 없이 전체 패널 조회)
+
+사용법:
+    python price_snapshot.py
+    python price_snapshot.py --incremental
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from price_changes import changes_until, latest_change_id, missing_ids
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_DIR = os.environ.get('PRICE_SNAPSHOT_DIR', 'price_panel')
+META_FILE = '_snapshot.json'
+
+SCHEMA = pa.schema([
+    ('apt_id', pa.int32()),
+    ('name', pa.string()),
+    ('PY', pa.string()),
+    ('address', pa.string()),
+    ('year', pa.int32()),
+    ('yyyymm', pa.int32()),
+    ('avg', pa.float64()),
+    ('min', pa.float64()),
+    ('max', pa.float64()),
+    ('cnt', pa.int32()),
+])
+
+PARTITIONING = ds.partitioning(pa.schema([('deal_type', pa.int16()), ('yyyy', pa.int16())]), flavor='hive')
+
+PANEL_SQL = '''
+    SELECT m.deal_type, m.yyyymm / 100 AS yyyy,
+           m.apt_id, a.name, a."PY", a.address, a.year, m.yyyymm, m.avg, m.min, m.max, m.cnt
+    FROM price_monthly m
+    JOIN (
+        SELECT apt_id, MIN(name) AS name, MIN("PY") AS "PY", MIN(address) AS address, MIN(year) AS year
+        FROM "APTInfo" WHERE apt_id IS NOT NULL GROUP BY apt_id
+    ) a USING (apt_id)
+'''
+
+
+def read_meta(path):
+    meta_path = os.path.join(path, META_FILE)
+    if not os.path.exists(meta_path):
+        return {}
+    with open(meta_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_meta(path, meta):
+    tmp = os.path.join(path, META_FILE + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, os.path.join(path, META_FILE))
+
+
+def _partition_dir(path, deal_type, yyyy):
+    return os.path.join(path, f'deal_type={deal_type}', f'yyyy={yyyy}')
+
+
+def write_partition(path, deal_type, yyyy, rows):
+    """한 파티션 디렉터리를 새 파일로 바꾼다 (다 쓴 뒤 이름을 바꿔서 읽는 쪽이 중간 상태를 보지 않게)"""
+    part_dir = _partition_dir(path, deal_type, yyyy)
+    os.makedirs(part_dir, exist_ok=True)
+    table = pa.Table.from_pylist(sorted(rows, key=lambda r: (r['apt_id'], r['yyyymm'])), schema=SCHEMA)
+    tmp = os.path.join(part_dir, 'part-0.parquet.tmp')
+    pq.write_table(table, tmp, compression='zstd')
+    os.replace(tmp, os.path.join(part_dir, 'part-0.parquet'))
+
+
+def _group(rows):
+    partitions = {}
+    for r in rows:
+        partitions.setdefault((r.pop('deal_type'), r.pop('yyyy')), []).append(r)
+    return partitions
+
+
+def _versions(path):
+    """path.<시각> 버전 디렉터리들"""
+    return [p for p in glob.glob(glob.escape(path) + '.*') if p.rsplit('.', 1)[1].isdigit()]
+
+
+def swap_in(path, new_dir):
+    """
+    path 심볼릭 링크가 new_dir(같은 디렉터리의 버전)을 가리키도록 rename 한 번으로 바꾼다
+    바로 이전 버전은 그것을 읽고 있을 수 있어서 남기고, 그보다 오래된 버전(중단된 내보내기 포함)은 지운다
+    예전 방식의 실제 디렉터리는 먼저 버전 이름으로 옮긴다 (처음 한 번, 중간에 멈춰도 데이터는 남는다)
+    """
+    previous = os.path.realpath(path) if os.path.islink(path) else None
+    if os.path.isdir(path) and not os.path.islink(path):
+        previous = f'{path}.{time.time_ns()}'
+        os.replace(path, previous)
+    link = path + '.link'
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(new_dir), link)
+    os.replace(link, path)
+    keep = {os.path.realpath(new_dir), previous}
+    for version in _versions(path):
+        if os.path.realpath(version) not in keep:
+            shutil.rmtree(version, ignore_errors=True)
+
+
+def export_snapshot(client, execute_sql, path=DEFAULT_SNAPSHOT_DIR):
+    """전체 패널을 새 버전으로 다시 쓰고 바꿔 단다, 반환값: 행 수"""
+    path = path.rstrip('/')
+    started = datetime.now().astimezone()
+    # 데이터를 읽기 전에 변경 로그 위치를 잡아 둬야 읽는 동안 들어온 변경을 다음 증분이 다시 쓴다
+    head = latest_change_id(client)
+    cursor = {'last_id': head, 'gaps': missing_ids(client, head)}
+    partitions = _group(execute_sql(PANEL_SQL).data)
+    version = f'{path}.{time.time_ns()}'
+    for (deal_type, yyyy), rows in partitions.items():
+        write_partition(version, deal_type, yyyy, rows)
+    total = sum(len(rows) for rows in partitions.values())
+    os.makedirs(version, exist_ok=True)
+    write_meta(version, {'exported_at': started.isoformat(), 'rows': total, 'change_cursor': cursor})
+    swap_in(path, version)
+    logger.info("스냅샷 전체 내보내기: %d개 파티션, %d행 -> %s", len(partitions), total, version)
+    return total
+
+
+def changed_partitions(changes, last_year=None):
+    """변경 리스트 -> 다시 쓸 (deal_type, yyyy) 목록 (끝이 열린 replace는 last_year(기본 올해)까지)"""
+    last_year = last_year or datetime.now().year
+    partitions = set()
+    for c in changes:
+        # deactivate는 월별 시세를 바꾸지 않는다
+        if c['from_month'] is None:
+            continue
+        first = c['from_month'] // 100
+        last = c['to_month'] // 100 if c['to_month'] is not None else max(last_year, first)
+        partitions.update((int(c['deal_type']), yyyy) for yyyy in range(first, last + 1))
+    return sorted(partitions)
+
+
+def export_incremental(client, execute_sql, path=DEFAULT_SNAPSHOT_DIR):
+    """
+    마지막 내보내기 이후 변경 로그에 있는 파티션만 다시 쓴다 (행이 남지 않은 파티션은 삭제)
+    스냅샷이 없거나 변경 로그 커서가 없으면 전체 내보내기, 반환값: 다시 쓴 행 수
+    """
+    path = path.rstrip('/')
+    meta = read_meta(path)
+    if not meta.get('change_cursor'):
+        return export_snapshot(client, execute_sql, path)
+
+    started = datetime.now().astimezone()
+    cursor = meta['change_cursor']
+    head = latest_change_id(client)
+    changes, gaps = changes_until(client, cursor['last_id'], head, cursor['gaps'])
+
+    total, partitions = 0, changed_partitions(changes)
+    for deal_type, yyyy in partitions:
+        rows = execute_sql(PANEL_SQL + ' WHERE m.deal_type = :deal_type AND m.yyyymm / 100 = :yyyy',
+                           {'deal_type': deal_type, 'yyyy': yyyy}).data
+        for part, part_rows in _group(rows).items():
+            write_partition(path, *part, part_rows)
+            total += len(part_rows)
+        if not rows:
+            # 행이 모두 지워진 파티션
+            shutil.rmtree(_partition_dir(path, deal_type, yyyy), ignore_errors=True)
+    write_meta(path, dict(meta, exported_at=started.isoformat(), change_cursor={'last_id': head, 'gaps': gaps}))
+    logger.info("스냅샷 증분 내보내기: %d개 파티션, %d행", len(partitions), total)
+    return total
+
+
+def load_panel(path=DEFAULT_SNAPSHOT_DIR, columns=None, filters=None, as_pandas=True):
+    """
+    스냅샷을 메모리 매핑으로 읽기
+    columns: 읽을 컬럼 (None이면 전체, deal_type / yyyy 파티션 컬럼 포함)
+    filters: pyarrow 필터, 예: [('deal_type', 'in', [1, 3]), ('yyyy', '>=', 2020)]
+    """
+    table = pq.read_table(path, columns=columns, filters=filters, memory_map=True, partitioning=PARTITIONING)
+    return table.to_pandas() if as_pandas else table
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    from pipeline_metrics import setup_logging
+
+    parser = argparse.ArgumentParser(description="월별 시세 Parquet 스냅샷 내보내기")
+    parser.add_argument('--path', default=DEFAULT_SNAPSHOT_DIR, help="스냅샷 디렉터리")
+    parser.add_argument('--incremental', action='store_true', help="마지막 내보내기 이후 바뀐 파티션만 다시 쓰기")
+    args = parser.parse_args()
+
+    # Load environment variables from the .env file
+    load_dotenv()
+    setup_logging()
+
+    # 로컬 DB 사용
+    from local_db import supabase, execute_sql
+
+    if args.incremental:
+        export_incremental(supabase, execute_sql, args.path)
+    else:
+        export_snapshot(supabase, execute_sql, args.path)
+
+    start = time.perf_counter()
+    panel = load_panel(args.path)
+    logger.info("전체 패널 %d행 읽기: %.1fms", len(panel), (time.perf_counter() - start) * 1000)
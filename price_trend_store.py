@@ -0,0 +1,137 @@
+"""
+APTInfo.price_trend 쓰기 모듈
+
+price_trend는 jsonb 컬럼이고 (migrate_price_trend_jsonb.py), 새로 수집한 달만 DB 함수 merge_price_trend로 보내서
+서버에서 date 기준으로 병합한다. 전체 이력을 읽어서 다시 직렬화해 보내지 않고,
+한 UPDATE 문으로 처리되므로 여러 갱신 작업이 동시에 써도 앞선 변경을 덮어쓰지 않는다.
+병합할 때마다 APTInfo.version을 1씩 올린다.
+
+client는 local_db.supabase 또는 Supabase 클라이언트 (둘 다 rpc()를 지원)
+
+apt_id가 있는 행(migrate_price_monthly.py 실행 후)은 merge_price_trend가 같은 트랜잭션에서 price_monthly에 같은 달을
+행 단위로 upsert 하고 price_change 변경 로그에 바뀐 구간을 남긴다 (중간에 실패하면 셋 다 쓰지 않는다).
+save_series는 아실 seq + 평형으로 unit을 찾고(migrate_apt_units.py 실행 후, unit이 없으면 이름 + 평형으로), 새 평형이면 unit도 등록한다.
+쓴 뒤에는 바뀐 달 이후의 전세가율/임대수익률(price_metrics.py)과 빈 달을 채운 시세(price_dense.py)를 다시 계산한다.
+"""
+import json
+import logging
+from datetime import datetime
+
+from apt_units import get_unit_id, register_unit
+from price_dense import refresh_dense
+from price_metrics import refresh_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def parse_price_trend(data):
+    """
+    price_trend를 리스트로 변환 - 이미 리스트면 그대로 반환
+    예전 연도별 dict 형식({'2020': [...], '2021': [...]})은 펼쳐서 date 순으로 정렬한다 (change_apt_data.py와 같은 처리)
+    """
+    if data is None:
+        return []
+    if isinstance(data, str):
+        data = json.loads(data)
+    if isinstance(data, dict):
+        data = sorted((d for v in data.values() for d in v), key=lambda x: x['date'])
+    if isinstance(data, list):
+        return data
+    return []
+
+
+def merge_by_month(price_trend, amount, replace_from=None):
+    """
+    기존 price_trend에 새 월별 데이터를 date 기준으로 병합
+    - 같은 달은 새 데이터로 덮어쓴다
+    - replace_from('YYYYMM')을 주면 그 달 이후의 기존 데이터는 버리고 새 데이터로 대체한다
+      (최근 구간을 다시 수집한 경우, 취소된 거래로 사라진 달을 지우기 위함)
+    """
+    merged = {d['date']: d for d in price_trend if replace_from is None or d['date'] < replace_from}
+    for d in amount:
+        merged[d['date']] = d
+    return [merged[k] for k in sorted(merged)]
+
+
+def write_price_trend(client, row_id, amount, replace_from=None, extra=None, kind=None):
+    """
+    APTInfo 한 행의 price_trend에 amount를 서버에서 병합해서 저장 (price_monthly, price_change도 같은 트랜잭션)
+    extra: price_trend와 함께 업데이트할 다른 컬럼 (예: {'status': 1})
+    kind: 변경 로그 kind (None이면 merge/replace, 새 시리즈는 save_series가 'insert')
+    반환값: 저장된 price_trend의 개월 수
+    """
+    amount = sorted(amount, key=lambda d: d['date'])
+    rows = client.rpc('merge_price_trend', {
+        'p_id': row_id,
+        'p_amount': amount,
+        'p_replace_from': replace_from,
+        'p_kind': kind,
+    }).execute().data
+    if not rows:
+        raise KeyError(f"APTInfo id={row_id} 없음")
+    row = rows[0]
+    if extra:
+        client.table('APTInfo').update(extra).eq('id', row_id).execute()
+    if row.get('apt_id') is not None:
+        from_month = _first_month(amount, replace_from)
+        refresh_metrics(client, row['apt_id'], from_month)
+        # 새 거래유형은 달력 처음부터 빈 행이 있어야 한다
+        refresh_dense(client, row['apt_id'], None if kind == 'insert' else from_month)
+    return row['months']
+
+
+def _first_month(amount, replace_from=None):
+    """이번에 바뀐 가장 이른 달 (yyyymm 정수, 없으면 None)"""
+    months = [int(d['date']) for d in amount] + ([int(replace_from)] if replace_from else [])
+    return min(months, default=None)
+
+
+def get_price_trend(client, row_id, start=None, end=None):
+    """APTInfo 한 행의 price_trend 중 start~end('YYYYMM', 포함) 기간만 서버에서 잘라서 가져오기"""
+    data = client.rpc('price_trend_window', {
+        'p_id': row_id,
+        'p_start': str(start) if start is not None else None,
+        'p_end': str(end) if end is not None else None,
+    }).execute().data
+    return parse_price_trend(data)
+
+
+def save_series(client, apt_info, PY, DEAL_TYPE, amount, replace_from=None, extra=None, new_row=None):
+    """
+    아파트/평형/거래유형 시리즈에 amount를 병합 저장, 행이 없으면 새로 만든다
+    new_row: 새로 만들 때 추가로 넣을 컬럼 (year, address 등)
+    반환값: 저장된 price_trend의 개월 수
+    """
+    # 같은 아파트/평형의 다른 거래유형 행이 이미 있으면 그 unit id를 apt_id로 이어받는다
+    apt_id = get_unit_id(client, apt_info['seq'], PY)
+    if apt_id is not None:
+        rows = client.table('APTInfo').select('id, DEAL_TYPE').eq('apt_id', apt_id).execute().data
+    else:
+        # unit이 없는 시리즈 (migrate_apt_units.py 실행 전이거나 마이그레이션이 건너뛴 행)는 예전처럼 이름/평형으로 찾는다
+        rows = client.table('APTInfo').select('id, DEAL_TYPE, apt_id').eq('name', apt_info['name']).eq('PY', PY).execute().data
+        apt_id = next((r['apt_id'] for r in rows if r['apt_id'] is not None), None)
+    for r in rows:
+        if r['DEAL_TYPE'] == DEAL_TYPE:
+            return write_price_trend(client, r['id'], amount, replace_from, extra)
+
+    # 빈 시리즈로 만든 뒤 write_price_trend로 채운다 (채우다 실패하면 다음 실행이 이 행에 다시 병합)
+    values = {
+        'name': apt_info['name'],
+        'PY': PY,
+        'DEAL_TYPE': DEAL_TYPE,
+        'seq': apt_info['seq'],
+        'description': apt_info['desc'],
+        'price_trend': [],
+        'status': 1,
+        'updated_at': datetime.now().isoformat(),
+    }
+    if apt_id is not None:
+        values['apt_id'] = apt_id
+    values.update(new_row or {})
+    values.update(extra or {})
+    row_id = client.table('APTInfo').insert(values).execute().data[0]['id']
+    if apt_id is None:
+        # 처음 등록되는 아파트/평형은 자기 id를 apt_id로 쓴다
+        client.table('APTInfo').update({'apt_id': row_id}).eq('id', row_id).execute()
+        register_unit(client, apt_info, PY, row_id, values.get('address'), values.get('year'))
+    return write_price_trend(client, row_id, amount, kind='insert')
@@ -0,0 +1,361 @@
+"""
+DB 기반 분산 갱신 작업 큐
+
+여러 머신/컨테이너가 같은 PostgreSQL을 바라보고 갱신 작업을 나눠서 처리한다.
+- RefreshJob 테이블 한 행이 시리즈(APTInfo 한 행) 하나의 갱신 작업
+- 작업 가져오기는 SELECT ... FOR UPDATE SKIP LOCKED 로 워커끼리 같은 작업을 잡지 않는다
+- 작업을 잡은 워커는 lease(임대 만료 시각)를 주기적으로 연장(heartbeat)하고,
+  워커가 죽어서 lease가 만료되면 다른 워커가 다시 가져간다
+- lease를 잃은 워커는 저장 직전에 확인해서 수집한 결과를 버린다 (같은 작업을 두 워커가 쓰지 않도록)
+- 실패하면 attempts가 max_attempts에 도달할 때까지 지연 후 재시도, 그 뒤에는 dead 상태로 남긴다
+
+사용법:
+    python refresh_queue.py enqueue --all
+    python refresh_queue.py enqueue 헬리오시티:34 --max-attempts 3
+    python refresh_queue.py worker --processes 4
+    python refresh_queue.py worker --fake --processes 4 --exit-when-empty   # 로컬 테스트
+    python refresh_queue.py status
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+from apt_value import get_APT_transactions
+from update_apt_data import ensure_series_columns, refresh_series
+from pipeline_metrics import setup_logging
+
+# Load environment variables from the .env file
+load_dotenv()
+
+# 로컬 DB 사용
+from local_db import supabase, execute_sql
+
+logger = logging.getLogger(__name__)
+
+JOB_TABLE = 'RefreshJob'
+
+# 상태: queued(대기) -> running(처리 중) -> done(완료) / dead(재시도 한도 초과)
+QUEUED, RUNNING, DONE, DEAD = 'queued', 'running', 'done', 'dead'
+
+LEASE_SECONDS = 120
+HEARTBEAT_SECONDS = 30
+RETRY_DELAY_SECONDS = 60
+
+
+def ensure_job_table():
+    """작업 큐 테이블과 인덱스가 없으면 생성"""
+    execute_sql(f'''
+        CREATE TABLE IF NOT EXISTS "{JOB_TABLE}" (
+            id BIGSERIAL PRIMARY KEY,
+            aptinfo_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            "PY" TEXT NOT NULL,
+            "DEAL_TYPE" TEXT NOT NULL,
+            seq TEXT,
+            description TEXT,
+            status TEXT NOT NULL DEFAULT '{QUEUED}',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 5,
+            run_after TIMESTAMPTZ NOT NULL DEFAULT now(),
+            lease_owner TEXT,
+            lease_expires_at TIMESTAMPTZ,
+            last_error TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    ''')
+    # 같은 시리즈는 대기/처리 중인 작업이 하나만 있도록
+    execute_sql(f'''
+        CREATE UNIQUE INDEX IF NOT EXISTS "{JOB_TABLE}_active_series"
+        ON "{JOB_TABLE}" (aptinfo_id) WHERE status IN ('{QUEUED}', '{RUNNING}')
+    ''')
+    execute_sql(f'''
+        CREATE INDEX IF NOT EXISTS "{JOB_TABLE}_claim"
+        ON "{JOB_TABLE}" (run_after, id) WHERE status = '{QUEUED}'
+    ''')
+    execute_sql(f'''
+        CREATE INDEX IF NOT EXISTS "{JOB_TABLE}_lease"
+        ON "{JOB_TABLE}" (lease_expires_at) WHERE status = '{RUNNING}'
+    ''')
+
+
+def enqueue(targets=None, max_attempts=5):
+    """
+    갱신 작업 등록
+    targets: [(아파트이름, 평형), ...], None이면 활성 시리즈 전체
+    이미 대기/처리 중인 시리즈는 건너뛴다
+    반환값: 새로 등록된 작업 수
+    """
+    rows = supabase.table('APTInfo').select('id, name, PY, DEAL_TYPE, seq, description').eq('status', 1).execute().data
+    if targets is not None:
+        wanted = {(name, PY) for name, PY in targets}
+        rows = [r for r in rows if (r['name'], r['PY']) in wanted]
+
+    jobs = [{
+        'aptinfo_id': r['id'],
+        'name': r['name'],
+        'PY': r['PY'],
+        'DEAL_TYPE': r['DEAL_TYPE'],
+        'seq': str(r['seq']),
+        'description': r['description'],
+        'max_attempts': max_attempts,
+    } for r in rows]
+    # 부분 unique 인덱스와 충돌하면 무시 (ON CONFLICT 대상에 인덱스 조건을 같이 적어야 함)
+    added = 0
+    for job in jobs:
+        added += len(execute_sql(f'''
+            INSERT INTO "{JOB_TABLE}" (aptinfo_id, name, "PY", "DEAL_TYPE", seq, description, max_attempts)
+            VALUES (:aptinfo_id, :name, :PY, :DEAL_TYPE, :seq, :description, :max_attempts)
+            ON CONFLICT (aptinfo_id) WHERE status IN ('{QUEUED}', '{RUNNING}') DO NOTHING
+            RETURNING id
+        ''', job).data)
+    logger.info("작업 %d개 등록 (요청 %d개)", added, len(jobs))
+    return added
+
+
+def reap_expired():
+    """
+    lease가 만료된 작업(워커가 죽었거나 멈춤)을 다시 대기 상태로 돌리거나,
+    재시도 한도를 넘었으면 dead로 옮긴다
+    """
+    rows = execute_sql(f'''
+        UPDATE "{JOB_TABLE}"
+        SET status = CASE WHEN attempts >= max_attempts THEN '{DEAD}' ELSE '{QUEUED}' END,
+            last_error = COALESCE(last_error, '') || ' [lease expired: ' || COALESCE(lease_owner, '') || ']',
+            lease_owner = NULL,
+            lease_expires_at = NULL,
+            updated_at = now()
+        WHERE id IN (
+            SELECT id FROM "{JOB_TABLE}"
+            WHERE status = '{RUNNING}' AND lease_expires_at < now()
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, status
+    ''').data
+    for r in rows:
+        logger.warning("작업 %s lease 만료 -> %s", r['id'], r['status'])
+    return rows
+
+
+def claim(worker_id, lease_seconds=LEASE_SECONDS):
+    """대기 중인 작업 하나를 잡아서 running으로 바꾸고 반환 (없으면 None)"""
+    rows = execute_sql(f'''
+        UPDATE "{JOB_TABLE}"
+        SET status = '{RUNNING}',
+            attempts = attempts + 1,
+            lease_owner = :worker_id,
+            lease_expires_at = now() + make_interval(secs => :lease),
+            updated_at = now()
+        WHERE id = (
+            SELECT id FROM "{JOB_TABLE}"
+            WHERE status = '{QUEUED}' AND run_after <= now()
+            ORDER BY run_after, id
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING *
+    ''', {'worker_id': worker_id, 'lease': lease_seconds}).data
+    return rows[0] if rows else None
+
+
+def heartbeat(job_id, worker_id, lease_seconds=LEASE_SECONDS):
+    """lease 연장, 이미 다른 워커에게 넘어갔으면 False"""
+    rows = execute_sql(f'''
+        UPDATE "{JOB_TABLE}"
+        SET lease_expires_at = now() + make_interval(secs => :lease), updated_at = now()
+        WHERE id = :id AND lease_owner = :worker_id AND status = '{RUNNING}'
+        RETURNING id
+    ''', {'id': job_id, 'worker_id': worker_id, 'lease': lease_seconds}).data
+    return bool(rows)
+
+
+def complete(job_id, worker_id):
+    """작업 완료 처리 (lease를 가진 워커만)"""
+    rows = execute_sql(f'''
+        UPDATE "{JOB_TABLE}"
+        SET status = '{DONE}', lease_owner = NULL, lease_expires_at = NULL, last_error = NULL, updated_at = now()
+        WHERE id = :id AND lease_owner = :worker_id AND status = '{RUNNING}'
+        RETURNING id
+    ''', {'id': job_id, 'worker_id': worker_id}).data
+    return bool(rows)
+
+
+def fail(job_id, worker_id, error, retry_delay=RETRY_DELAY_SECONDS):
+    """작업 실패 처리: 재시도 한도 안이면 지연 후 다시 대기, 아니면 dead"""
+    rows = execute_sql(f'''
+        UPDATE "{JOB_TABLE}"
+        SET status = CASE WHEN attempts >= max_attempts THEN '{DEAD}' ELSE '{QUEUED}' END,
+            run_after = now() + make_interval(secs => :delay * attempts),
+            last_error = :error,
+            lease_owner = NULL,
+            lease_expires_at = NULL,
+            updated_at = now()
+        WHERE id = :id AND lease_owner = :worker_id AND status = '{RUNNING}'
+        RETURNING status
+    ''', {'id': job_id, 'worker_id': worker_id, 'error': str(error)[:1000], 'delay': retry_delay}).data
+    return rows[0]['status'] if rows else None
+
+
+def count_by_status():
+    rows = execute_sql(f'SELECT status, count(*) AS cnt FROM "{JOB_TABLE}" GROUP BY status').data
+    return {r['status']: r['cnt'] for r in rows}
+
+
+class _Heartbeat(threading.Thread):
+    """작업 처리 중 lease를 주기적으로 연장하는 스레드"""
+    def __init__(self, job_id, worker_id, lease_seconds, interval):
+        super().__init__(daemon=True)
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.interval = interval
+        self.lost = False
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                if not heartbeat(self.job_id, self.worker_id, self.lease_seconds):
+                    self.lost = True
+                    logger.warning("작업 %s lease를 잃었습니다", self.job_id)
+                    return
+            except Exception as e:
+                logger.warning("작업 %s heartbeat 실패: %s", self.job_id, e)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def process_job(job, fetch=get_APT_transactions, has_lease=None):
+    """
+    작업 하나 처리: get_APT_transactions로 최근 6개월을 다시 수집해서 저장
+    has_lease: 저장 직전에 lease를 아직 가지고 있는지 확인하는 함수 (False면 수집한 결과를 버린다)
+    반환값: 저장했으면 True
+    """
+    res = supabase.table('APTInfo').select('id').eq('id', job['aptinfo_id']).single().execute().data
+    if res is None:
+        raise KeyError(f"APTInfo id={job['aptinfo_id']} 없음")
+    apt_info = {'desc': job['description'], 'seq': job['seq'], 'name': job['name']}
+    return refresh_series(res, apt_info, job['PY'], job['DEAL_TYPE'], fetch=fetch, before_write=has_lease) is not None
+
+
+def run_worker(worker_id=None, fake=False, exit_when_empty=False, poll_seconds=5.0, pause_seconds=0.0,
+               lease_seconds=LEASE_SECONDS, heartbeat_seconds=HEARTBEAT_SECONDS):
+    """
+    워커 루프: 만료된 lease 정리 -> 작업 가져오기 -> 처리 -> 완료/실패 기록
+    pause_seconds: 작업 사이 대기 시간 (노드별 요청 예산 조절용)
+    """
+    setup_logging()
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    if fake:
+        from refresh_scheduler import FakeScraper
+        fetch = FakeScraper()
+    else:
+        fetch = get_APT_transactions
+
+    processed = 0
+    logger.info("워커 시작: %s", worker_id)
+    while True:
+        reap_expired()
+        job = claim(worker_id, lease_seconds)
+        if job is None:
+            if exit_when_empty:
+                counts = count_by_status()
+                if not counts.get(QUEUED) and not counts.get(RUNNING):
+                    break
+            time.sleep(poll_seconds)
+            continue
+
+        hb = _Heartbeat(job['id'], worker_id, lease_seconds, heartbeat_seconds)
+        hb.start()
+
+        def has_lease():
+            # heartbeat 스레드가 이미 잃었거나, 마지막 연장 뒤에 만료되어 다른 워커가 가져갔으면 저장하지 않는다
+            return not hb.lost and heartbeat(job['id'], worker_id, lease_seconds)
+
+        try:
+            written = process_job(job, fetch, has_lease)
+        except Exception as e:
+            hb.stop()
+            if hb.lost:
+                logger.warning("작업 %s 실패했지만 lease를 잃어서 기록하지 않음: %s", job['id'], e)
+            else:
+                status = fail(job['id'], worker_id, e)
+                logger.error("작업 %s (%s %s평 %s) 실패 -> %s: %s", job['id'], job['name'], job['PY'], job['DEAL_TYPE'], status, e)
+        else:
+            hb.stop()
+            if hb.lost or not written:
+                logger.warning("작업 %s lease를 잃어서 결과를 버림 (다른 워커가 처리)", job['id'])
+            elif complete(job['id'], worker_id):
+                processed += 1
+                logger.info("작업 %s 완료: %s %s평 %s", job['id'], job['name'], job['PY'], job['DEAL_TYPE'])
+            else:
+                logger.warning("작업 %s 완료했지만 lease가 이미 다른 워커에게 넘어감", job['id'])
+        if pause_seconds:
+            time.sleep(pause_seconds)
+
+    logger.info("워커 종료: %s (%d개 처리)", worker_id, processed)
+    return processed
+
+
+def _parse_targets(targets):
+    result = []
+    for t in targets:
+        name, _, PY = t.rpartition(':')
+        if not name or not PY:
+            raise ValueError(f"'아파트이름:평형' 형식이 아니에요: {t}")
+        result.append((name, PY))
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DB 기반 분산 갱신 작업 큐")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_enqueue = sub.add_parser('enqueue', help="갱신 작업 등록")
+    p_enqueue.add_argument('targets', nargs='*', help="아파트이름:평형 (생략하면 --all 필요)")
+    p_enqueue.add_argument('--all', action='store_true', help="활성 시리즈 전체 등록")
+    p_enqueue.add_argument('--max-attempts', type=int, default=5)
+
+    p_worker = sub.add_parser('worker', help="워커 실행")
+    p_worker.add_argument('--processes', type=int, default=1, help="이 노드에서 띄울 워커 프로세스 수")
+    p_worker.add_argument('--fake', action='store_true', help="아실 대신 로컬 가짜 수집기 사용")
+    p_worker.add_argument('--exit-when-empty', action='store_true', help="대기 작업이 없으면 종료")
+    p_worker.add_argument('--pause', type=float, default=0.0, help="작업 사이 대기 시간(초)")
+    p_worker.add_argument('--lease', type=int, default=LEASE_SECONDS, help="lease 길이(초)")
+
+    sub.add_parser('status', help="상태별 작업 수 출력")
+
+    args = parser.parse_args()
+    setup_logging()
+    ensure_series_columns()
+    ensure_job_table()
+
+    if args.command == 'enqueue':
+        if not args.all and not args.targets:
+            parser.error("아파트이름:평형 또는 --all 을 지정하세요")
+        enqueue(None if args.all else _parse_targets(args.targets), max_attempts=args.max_attempts)
+    elif args.command == 'worker':
+        kwargs = dict(fake=args.fake, exit_when_empty=args.exit_when_empty, pause_seconds=args.pause,
+                      lease_seconds=args.lease, heartbeat_seconds=max(1, args.lease // 4))
+        if args.processes > 1:
+            # fork하면 SQLAlchemy 커넥션 풀을 공유하게 되므로 spawn으로 띄운다
+            ctx = multiprocessing.get_context('spawn')
+            procs = [ctx.Process(target=run_worker, kwargs=kwargs) for _ in range(args.processes)]
+            for p in procs:
+                p.start()
+            for p in procs:
+                p.join()
+        else:
+            run_worker(**kwargs)
+    elif args.command == 'status':
+        for status, cnt in sorted(count_by_status().items()):
+            print(f"{status}: {cnt}")
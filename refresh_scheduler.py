@@ -0,0 +1,350 @@
+"""
+시세 갱신 스케줄러 데몬
+
+APTInfo의 각 시리즈(아파트/평형/거래유형)마다 마지막 갱신 시각(updated_at)과
+최근 거래량을 읽어 우선순위를 계산하고, 시간당 요청 예산 안에서
+거래가 많고 오래된 시리즈부터 갱신한다.
+
+- 거래량이 많을수록 갱신 주기가 짧아진다 (MIN_INTERVAL ~ MAX_INTERVAL)
+- 점수 = 마지막 갱신 후 경과 시간 / 갱신 주기 (1 이상이면 갱신 대상)
+- 실패한 시리즈는 refresh_backoff 테이블에 시도 횟수와 다음 시도 시각을 남기고 지수적으로 미룬다 (재시작해도 유지)
+- 현재 큐 상태와 다음 실행 시각은 --state-file 에 JSON으로 기록되고 --status 로 확인할 수 있다
+
+사용법:
+    python refresh_scheduler.py --budget 600
+    python refresh_scheduler.py --fake --once     # 가짜 수집기로 한 번만 실행 (테스트용)
+    python refresh_scheduler.py --status
+"""
+import argparse
+import json
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+from apt_value import get_APT_transactions
+from update_apt_data import ensure_series_columns, refresh_series
+from pipeline_metrics import setup_logging, serve_prometheus, write_prometheus
+
+# Load environment variables from the .env file
+load_dotenv()
+
+# 로컬 DB 사용
+from local_db import supabase, execute_sql
+
+logger = logging.getLogger(__name__)
+
+# 거래량에 따른 갱신 주기 범위 (초)
+MIN_INTERVAL = 6 * 3600
+MAX_INTERVAL = 7 * 24 * 3600
+# 최근 몇 개월의 거래량을 볼지
+VOLUME_MONTHS = 6
+# 시리즈 하나를 갱신할 때 아실에 보내는 HTTP 요청 수 (연도별 거래 조회 + 복호화 키 조회)
+REQUESTS_PER_YEAR = 2
+
+# 실패 후 첫 재시도까지 (초), 실패할 때마다 두 배 (최대 MAX_INTERVAL)
+RETRY_BASE = 15 * 60
+
+DEFAULT_STATE_FILE = 'refresh_scheduler_state.json'
+
+BACKOFF_TABLE = 'refresh_backoff'
+
+# next_at은 epoch 초 (스케줄러 clock과 같은 단위)
+BACKOFF_DDL = [
+    f'''
+    CREATE TABLE IF NOT EXISTS {BACKOFF_TABLE} (
+        aptinfo_id INTEGER PRIMARY KEY,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_at DOUBLE PRECISION NOT NULL,
+        last_error TEXT
+    )
+    ''',
+]
+
+VOLUME_SQL = '''
+    SELECT apt_id, deal_type, SUM(cnt) AS volume
+    FROM price_monthly
+    WHERE yyyymm >= :since
+    GROUP BY apt_id, deal_type
+'''
+
+
+def ensure_backoff_table(run_sql=execute_sql):
+    for sql in BACKOFF_DDL:
+        run_sql(sql)
+
+
+class FakeScraper:
+    """
+    아실 대신 쓰는 로컬 가짜 수집기 (get_APT_transactions와 같은 시그니처)
+    같은 입력이면 항상 같은 데이터를 돌려주고, 호출 내역을 calls에 남긴다
+    """
+    def __init__(self, months_per_year=12):
+        self.months_per_year = months_per_year
+        self.calls = []
+
+    def __call__(self, apt_info, PY, YEAR, DEAL_TYPE):
+        self.calls.append((apt_info['seq'], PY, YEAR, DEAL_TYPE))
+        rnd = random.Random(f"{apt_info['seq']}-{PY}-{YEAR}-{DEAL_TYPE}")
+        base = {'1': 100000, '2': 60000, '3': 250}.get(DEAL_TYPE, 1000)
+        amount = []
+        for m in range(1, self.months_per_year + 1):
+            prices = [base * rnd.uniform(0.9, 1.1) for _ in range(rnd.randint(1, 5))]
+            amount.append({
+                'date': f'{YEAR}{m:02d}',
+                'avg': sum(prices) / len(prices),
+                'min': min(prices),
+                'max': max(prices),
+                'cnt': len(prices)
+            })
+        return amount
+
+
+def parse_updated_at(value):
+    """DB/JSON에서 읽은 updated_at을 epoch 초로 변환 (없으면 0 = 한 번도 갱신 안 됨)"""
+    if not value:
+        return 0.0
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+def volume_since(now, months=VOLUME_MONTHS):
+    """최근 months개월의 시작 달 (YYYYMM 정수)"""
+    return int((datetime.fromtimestamp(now) - timedelta(days=31 * months)).strftime("%Y%m"))
+
+
+def recent_volumes(now, months=VOLUME_MONTHS):
+    """price_monthly에서 최근 months개월의 거래 건수 합계 {(apt_id, deal_type): 건수}"""
+    rows = execute_sql(VOLUME_SQL, {'since': volume_since(now, months)}).data
+    return {(r['apt_id'], r['deal_type']): int(r['volume']) for r in rows}
+
+
+def retry_delay(attempts):
+    """attempts번째 실패 뒤 다음 시도까지 기다릴 시간 (초)"""
+    return min(MAX_INTERVAL, RETRY_BASE * 2 ** (attempts - 1))
+
+
+def refresh_interval(volume):
+    """
+    거래량이 많을수록 짧은 갱신 주기
+    거래가 없으면 MAX_INTERVAL, 월 50건 수준이면 MIN_INTERVAL에 가까워진다
+    """
+    monthly = volume / VOLUME_MONTHS
+    interval = MAX_INTERVAL / (1 + monthly)
+    return max(MIN_INTERVAL, min(MAX_INTERVAL, interval))
+
+
+def request_cost(now):
+    """시리즈 하나 갱신에 드는 요청 수 (refresh_series는 6개월 전 연도부터 올해까지 조회)"""
+    today = datetime.fromtimestamp(now)
+    prev = today - timedelta(days=180)
+    return (today.year - prev.year + 1) * REQUESTS_PER_YEAR
+
+
+class RefreshScheduler:
+    """
+    시간당 요청 예산(token bucket) 안에서 우선순위가 높은 시리즈부터 갱신하는 스케줄러
+    fetch: 수집 함수 (기본은 아실, 테스트에서는 FakeScraper)
+    clock: 현재 시각(epoch 초)을 돌려주는 함수
+    """
+    def __init__(self, fetch=get_APT_transactions, budget_per_hour=600, clock=time.time):
+        self.fetch = fetch
+        self.budget_per_hour = budget_per_hour
+        self.clock = clock
+        self.tokens = float(budget_per_hour)
+        self._last_refill = clock()
+        self.series = {}
+        self.last_error = {}
+
+    def load(self):
+        """APTInfo에서 활성 시리즈의 갱신 시각, price_monthly에서 최근 거래량, refresh_backoff에서 실패 기록을 읽어 큐를 다시 만든다"""
+        now = self.clock()
+        rows = supabase.table('APTInfo').select('id, apt_id, name, PY, DEAL_TYPE, seq, description, updated_at').eq('status', 1).execute().data
+        volumes = recent_volumes(now)
+        backoff = {b['aptinfo_id']: b for b in supabase.table(BACKOFF_TABLE).select('*').execute().data}
+        self.series = {}
+        self.last_error = {}
+        for r in rows:
+            volume = volumes.get((r['apt_id'], int(r['DEAL_TYPE'])), 0)
+            failed = backoff.get(r['id'], {})
+            self.series[r['id']] = {
+                'id': r['id'],
+                'name': r['name'],
+                'PY': r['PY'],
+                'DEAL_TYPE': r['DEAL_TYPE'],
+                'seq': r['seq'],
+                'description': r['description'],
+                'volume': volume,
+                'interval': refresh_interval(volume),
+                'updated_at': parse_updated_at(r.get('updated_at')),
+                'attempts': failed.get('attempts', 0),
+                'next_at': failed.get('next_at', 0.0),
+            }
+            if failed.get('last_error'):
+                self.last_error[r['id']] = failed['last_error']
+        return len(self.series)
+
+    def score(self, s, now):
+        """경과 시간 / 갱신 주기 (1 이상이면 갱신 시점이 지남), 실패 후 재시도 대기 중이면 0"""
+        if now < s['next_at']:
+            return 0.0
+        return (now - s['updated_at']) / s['interval']
+
+    def next_due(self, s):
+        """다음 갱신 시각 (갱신 주기와 실패 후 재시도 시각 중 늦은 쪽)"""
+        return max(s['updated_at'] + s['interval'], s['next_at'])
+
+    def queue(self):
+        """점수가 높은 순으로 정렬한 큐 (점수가 같으면 거래량이 많은 순)"""
+        now = self.clock()
+        return sorted(self.series.values(), key=lambda s: (self.score(s, now), s['volume']), reverse=True)
+
+    def _refill(self):
+        now = self.clock()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self.tokens = min(float(self.budget_per_hour), self.tokens + elapsed * self.budget_per_hour / 3600)
+
+    def tick(self):
+        """
+        예산이 허락하는 만큼 갱신 시점이 지난 시리즈를 갱신
+        반환값: 이번 tick에 갱신한 시리즈 id 리스트
+        """
+        self._refill()
+        now = self.clock()
+        cost = request_cost(now)
+        refreshed = []
+        for s in self.queue():
+            if self.score(s, now) < 1:
+                break
+            if self.tokens < cost:
+                break
+            self.tokens -= cost
+            try:
+                res = supabase.table('APTInfo').select('*').eq('id', s['id']).single().execute().data
+                apt_info = {'desc': s['description'], 'seq': s['seq'], 'name': s['name']}
+                refresh_series(res, apt_info, s['PY'], s['DEAL_TYPE'], fetch=self.fetch)
+            except Exception as e:
+                logger.error("%s %s평 %s 갱신 실패: %s", s['name'], s['PY'], s['DEAL_TYPE'], e)
+                self._record_failure(s, str(e))
+            else:
+                s['updated_at'] = self.clock()
+                if s['attempts']:
+                    self._clear_failure(s)
+            refreshed.append(s['id'])
+        return refreshed
+
+    def _record_failure(self, s, error):
+        """실패 횟수와 다음 시도 시각을 DB에 남겨서 재시작해도 같은 시리즈를 바로 다시 시도하지 않게 한다"""
+        s['attempts'] += 1
+        s['next_at'] = self.clock() + retry_delay(s['attempts'])
+        self.last_error[s['id']] = error
+        supabase.table(BACKOFF_TABLE).upsert({
+            'aptinfo_id': s['id'],
+            'attempts': s['attempts'],
+            'next_at': s['next_at'],
+            'last_error': error,
+        }, on_conflict='aptinfo_id').execute()
+
+    def _clear_failure(self, s):
+        s['attempts'] = 0
+        s['next_at'] = 0.0
+        self.last_error.pop(s['id'], None)
+        supabase.table(BACKOFF_TABLE).delete().eq('aptinfo_id', s['id']).execute()
+
+    def next_wakeup(self):
+        """다음에 깨어날 시각 (가장 빠른 다음 실행 시각 또는 예산이 다시 찰 시각)"""
+        now = self.clock()
+        if not self.series:
+            return now + MIN_INTERVAL
+        next_due = min(self.next_due(s) for s in self.series.values())
+        cost = request_cost(now)
+        if self.tokens < cost:
+            budget_ready = now + (cost - self.tokens) * 3600 / self.budget_per_hour
+            next_due = max(next_due, budget_ready)
+        return max(now, next_due)
+
+    def snapshot(self):
+        """확인용 큐 상태 (우선순위 순)"""
+        now = self.clock()
+        return {
+            'generated_at': datetime.fromtimestamp(now).isoformat(),
+            'budget_per_hour': self.budget_per_hour,
+            'tokens': round(self.tokens, 1),
+            'next_wakeup': datetime.fromtimestamp(self.next_wakeup()).isoformat(),
+            'queue': [
+                {
+                    'id': s['id'],
+                    'name': s['name'],
+                    'PY': s['PY'],
+                    'DEAL_TYPE': s['DEAL_TYPE'],
+                    'volume': s['volume'],
+                    'interval_hours': round(s['interval'] / 3600, 1),
+                    'score': round(self.score(s, now), 2),
+                    'updated_at': datetime.fromtimestamp(s['updated_at']).isoformat() if s['updated_at'] else None,
+                    'next_run': datetime.fromtimestamp(max(now, self.next_due(s))).isoformat(),
+                    'attempts': s['attempts'],
+                    'last_error': self.last_error.get(s['id']),
+                }
+                for s in self.queue()
+            ],
+        }
+
+    def write_state(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+
+    def run(self, state_file=DEFAULT_STATE_FILE, reload_every=3600, once=False, metrics_file=None):
+        """데몬 루프: 주기적으로 큐를 다시 읽고, 갱신하고, 상태 파일을 기록한다"""
+        ensure_series_columns()
+        ensure_backoff_table()
+        self.load()
+        last_load = self.clock()
+        while True:
+            if self.clock() - last_load >= reload_every:
+                self.load()
+                last_load = self.clock()
+            refreshed = self.tick()
+            if refreshed:
+                logger.info("%d개 시리즈 갱신 (남은 예산: %.0f)", len(refreshed), self.tokens)
+            self.write_state(state_file)
+            if metrics_file:
+                write_prometheus(metrics_file, keep_previous=False)
+            if once:
+                return
+            time.sleep(min(max(1.0, self.next_wakeup() - self.clock()), reload_every))
+
+
+def print_status(state_file):
+    """상태 파일을 읽어 큐를 표로 출력"""
+    with open(state_file, encoding='utf-8') as f:
+        state = json.load(f)
+    print(f"기준: {state['generated_at']}  예산: {state['tokens']}/{state['budget_per_hour']}  다음 실행: {state['next_wakeup']}")
+    for s in state['queue']:
+        print(f"{s['score']:>7} | {s['name']} {s['PY']}평 {s['DEAL_TYPE']} | 거래량 {s['volume']} | "
+              f"주기 {s['interval_hours']}h | 마지막 {s['updated_at']} | 다음 {s['next_run']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="시세 갱신 스케줄러")
+    parser.add_argument('--budget', type=int, default=600, help="시간당 최대 요청 수")
+    parser.add_argument('--state-file', default=DEFAULT_STATE_FILE, help="큐 상태를 기록할 JSON 파일")
+    parser.add_argument('--fake', action='store_true', help="아실 대신 로컬 가짜 수집기 사용")
+    parser.add_argument('--once', action='store_true', help="한 번만 실행하고 종료")
+    parser.add_argument('--status', action='store_true', help="상태 파일의 큐를 출력하고 종료")
+    parser.add_argument('--metrics-file', default=None, help="Prometheus 텍스트 포맷 메트릭 파일 경로")
+    parser.add_argument('--metrics-port', type=int, default=None, help="메트릭을 제공할 로컬 HTTP 포트")
+    args = parser.parse_args()
+
+    if args.status:
+        print_status(args.state_file)
+    else:
+        setup_logging()
+        if args.metrics_port:
+            serve_prometheus(args.metrics_port)
+        fetch = FakeScraper() if args.fake else get_APT_transactions
+        RefreshScheduler(fetch=fetch, budget_per_hour=args.budget).run(
+            state_file=args.state_file, once=args.once, metrics_file=args.metrics_file)
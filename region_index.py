@@ -0,0 +1,240 @@
+"""
+지역 시세 지수(region_index)
+
+구(gu, APTInfo.address = extract_address 결과, 예: '서울 송파구', '수원시 영통구')와
+시(si, address의 첫 단어, 예: '서울', '수원시') 단위로 달마다 소속 아파트의 월별 시세를 거래량 가중 평균해서 저장한다.
+- price / jeonse / rent: SUM(avg * cnt) / SUM(cnt) (거래가 있는 달만, 만원)
+- price_cnt / jeonse_cnt / rent_cnt: 거래량 합, apts: 거래가 있었던 아파트/평형 수
+- per: price / (rent * 12), 월세 거래가 없는 달은 NULL
+
+소속은 region_member(apt_id, level, region)에 두고 활성 아파트(status = 1)에서 다시 만든다.
+증분(기본): price_change 변경 로그에서 커서('region_index') 이후 바뀐 아파트의 지역만,
+가장 이르게 바뀐 달부터 다시 집계한다. 소속이 바뀐(추가/삭제/주소 변경) 아파트의 지역은 처음부터 다시 집계한다.
+지역 페이지는 load_region_index()로 이 테이블만 읽는다 (아파트별 데이터는 읽지 않음).
+
+client는 local_db.supabase 또는 Supabase 클라이언트, execute_sql은 local_db.execute_sql
+
+사용법:
+    python region_index.py
+    python region_index.py --full
+"""
+import argparse
+import logging
+import time
+
+import pandas as pd
+
+from apt_analytics import month_index
+from price_changes import changed_from_months, pending_changes, save_cursor
+
+logger = logging.getLogger(__name__)
+
+INDEX_TABLE = 'region_index'
+MEMBER_TABLE = 'region_member'
+LIST_VIEW = 'region_list'
+CONSUMER = 'region_index'
+
+DDL = [
+    f'''
+    CREATE TABLE IF NOT EXISTS {MEMBER_TABLE} (
+        apt_id INTEGER NOT NULL,
+        level TEXT NOT NULL,
+        region TEXT NOT NULL,
+        PRIMARY KEY (apt_id, level)
+    )
+    ''',
+    f'''
+    CREATE TABLE IF NOT EXISTS {INDEX_TABLE} (
+        level TEXT NOT NULL,
+        region TEXT NOT NULL,
+        yyyymm INTEGER NOT NULL,
+        price DOUBLE PRECISION,
+        price_cnt INTEGER NOT NULL DEFAULT 0,
+        jeonse DOUBLE PRECISION,
+        jeonse_cnt INTEGER NOT NULL DEFAULT 0,
+        rent DOUBLE PRECISION,
+        rent_cnt INTEGER NOT NULL DEFAULT 0,
+        per DOUBLE PRECISION,
+        apts INTEGER NOT NULL DEFAULT 0,
+        run_id BIGINT NOT NULL,
+        PRIMARY KEY (level, region, yyyymm)
+    )
+    ''',
+]
+
+# 지역 선택지 (지역 페이지용)
+LIST_VIEW_SQL = f'''
+    {LIST_VIEW} AS
+    SELECT level, region, MIN(yyyymm) AS first_month, MAX(yyyymm) AS last_month
+    FROM {INDEX_TABLE}
+    GROUP BY level, region
+'''
+
+# {region_filter}: 일부 지역만 다시 집계할 때의 조건, run_id: 이번 실행 번호 (덮어쓰지 않은 옛 행을 지우는 데 씀)
+REFRESH_SQL = f'''
+    INSERT INTO {INDEX_TABLE} (level, region, yyyymm, price, price_cnt, jeonse, jeonse_cnt, rent, rent_cnt, per, apts, run_id)
+    SELECT level, region, yyyymm, price, price_cnt, jeonse, jeonse_cnt, rent, rent_cnt,
+           price / NULLIF(rent * 12, 0), apts, :run_id
+    FROM (
+        SELECT r.level, r.region, m.yyyymm,
+               SUM(m.avg * m.cnt) FILTER (WHERE m.deal_type = 1) / SUM(m.cnt) FILTER (WHERE m.deal_type = 1) AS price,
+               COALESCE(SUM(m.cnt) FILTER (WHERE m.deal_type = 1), 0) AS price_cnt,
+               SUM(m.avg * m.cnt) FILTER (WHERE m.deal_type = 2) / SUM(m.cnt) FILTER (WHERE m.deal_type = 2) AS jeonse,
+               COALESCE(SUM(m.cnt) FILTER (WHERE m.deal_type = 2), 0) AS jeonse_cnt,
+               SUM(m.avg * m.cnt) FILTER (WHERE m.deal_type = 3) / SUM(m.cnt) FILTER (WHERE m.deal_type = 3) AS rent,
+               COALESCE(SUM(m.cnt) FILTER (WHERE m.deal_type = 3), 0) AS rent_cnt,
+               COUNT(DISTINCT m.apt_id) AS apts
+        FROM price_monthly m JOIN {MEMBER_TABLE} r ON r.apt_id = m.apt_id
+        WHERE m.yyyymm >= :from_month AND m.cnt > 0 {{region_filter}}
+        GROUP BY r.level, r.region, m.yyyymm
+    ) g
+    WHERE 1 = 1  -- SQLite는 INSERT ... SELECT 뒤의 ON CONFLICT를 WHERE가 있어야 구분한다
+    ON CONFLICT (level, region, yyyymm) DO UPDATE SET
+        price = EXCLUDED.price,
+        price_cnt = EXCLUDED.price_cnt,
+        jeonse = EXCLUDED.jeonse,
+        jeonse_cnt = EXCLUDED.jeonse_cnt,
+        rent = EXCLUDED.rent,
+        rent_cnt = EXCLUDED.rent_cnt,
+        per = EXCLUDED.per,
+        apts = EXCLUDED.apts,
+        run_id = EXCLUDED.run_id
+'''
+
+# 이번 실행에서 다시 집계한 범위 중 거래가 없어진 달
+STALE_SQL = f'DELETE FROM {INDEX_TABLE} WHERE yyyymm >= :from_month AND run_id <> :run_id {{region_filter}}'
+
+
+def ensure_region_tables(execute_sql, backend='postgresql'):
+    """region_member, region_index 테이블과 region_list 뷰 생성"""
+    for sql in DDL:
+        execute_sql(sql)
+    # Postgres는 CREATE VIEW IF NOT EXISTS가 없고, SQLite는 CREATE OR REPLACE VIEW가 없다
+    execute_sql(('CREATE OR REPLACE VIEW ' if backend == 'postgresql' else 'CREATE VIEW IF NOT EXISTS ') + LIST_VIEW_SQL)
+
+
+def region_keys(address):
+    """'서울 송파구' -> {'gu': '서울 송파구', 'si': '서울'} (주소가 없으면 빈 dict)"""
+    if not address or not address.strip():
+        return {}
+    return {'gu': address.strip(), 'si': address.split()[0]}
+
+
+def sync_members(client):
+    """
+    활성 아파트 주소로 region_member를 맞춘다 (바뀐 행만 쓰기)
+    반환값: ({(apt_id, level): region}, 소속이 바뀐 (level, region) 집합 - 예전 지역, 새 지역 모두)
+    """
+    wanted = {}
+    for r in client.table('APTInfo').select('apt_id, address').eq('status', 1).execute().data or []:
+        if r['apt_id'] is not None:
+            for level, region in region_keys(r['address']).items():
+                wanted[(r['apt_id'], level)] = region
+    current = {(r['apt_id'], r['level']): r['region']
+               for r in client.table(MEMBER_TABLE).select('apt_id, level, region').execute().data or []}
+
+    upserts = [{'apt_id': apt_id, 'level': level, 'region': region}
+               for (apt_id, level), region in wanted.items() if current.get((apt_id, level)) != region]
+    removed = [key for key in current if key not in wanted]
+    if upserts:
+        client.table(MEMBER_TABLE).upsert(upserts, on_conflict='apt_id, level').execute()
+    for apt_id, level in removed:
+        client.table(MEMBER_TABLE).delete().eq('apt_id', apt_id).eq('level', level).execute()
+
+    touched = {(level, current[(apt_id, level)]) for apt_id, level in removed}
+    touched |= {(r['level'], r['region']) for r in upserts}
+    touched |= {(r['level'], current[(r['apt_id'], r['level'])]) for r in upserts if (r['apt_id'], r['level']) in current}
+    return wanted, touched
+
+
+def _region_filter(regions, prefix=''):
+    """[(level, region), ...] -> SQL 조건과 파라미터 (None이면 전체), prefix: 컬럼 앞에 붙일 별칭 (예: 'r.')"""
+    if regions is None:
+        return '', {}
+    if not regions:
+        return 'AND 1 = 0', {}
+    params, terms = {}, []
+    for i, (level, region) in enumerate(sorted(regions)):
+        params[f'level_{i}'], params[f'region_{i}'] = level, region
+        terms.append(f'({prefix}level = :level_{i} AND {prefix}region = :region_{i})')
+    return f"AND ({' OR '.join(terms)})", params
+
+
+def aggregate(execute_sql, regions=None, from_month=0):
+    """regions(None이면 전체)의 from_month 이후 지수를 다시 집계, 반환값: 쓴 (지역, 달) 수"""
+    run_id = time.time_ns() // 1000
+    region_filter, params = _region_filter(regions)
+    params.update({'from_month': from_month, 'run_id': run_id})
+    execute_sql(REFRESH_SQL.format(region_filter=_region_filter(regions, 'r.')[0]), params)
+    execute_sql(STALE_SQL.format(region_filter=region_filter), params)
+    rows = execute_sql(f'SELECT COUNT(*) AS n FROM {INDEX_TABLE} WHERE run_id = :run_id', {'run_id': run_id}).data
+    return rows[0]['n']
+
+
+def refresh_region_index(client, execute_sql, full=False):
+    """
+    지역 지수 갱신 (full이거나 커서가 없으면 전체, 아니면 변경 로그 기준 증분)
+    반환값: 다시 쓴 (지역, 달) 수
+    """
+    changes, cursor = pending_changes(client, CONSUMER, full)
+    members, moved = sync_members(client)
+
+    if changes is None:
+        n = aggregate(execute_sql)
+        logger.info("지역 지수 전체 집계: %d행", n)
+    else:
+        from_months = changed_from_months(changes)
+        regions = set(moved) | {(level, region) for (apt_id, level), region in members.items() if apt_id in from_months}
+        if not regions:
+            logger.info("지역 지수: 바뀐 지역 없음")
+            save_cursor(client, CONSUMER, cursor)
+            return 0
+        # 소속이 바뀐 지역은 처음부터
+        from_month = 0 if moved else min(from_months.values())
+        n = aggregate(execute_sql, regions, from_month)
+        logger.info("지역 지수 증분 집계: 지역 %d개, %s 이후 %d행", len(regions), from_month, n)
+
+    save_cursor(client, CONSUMER, cursor)
+    return n
+
+
+def list_regions(client, level='gu'):
+    """지수가 있는 지역 목록 [{'region', 'first_month', 'last_month'}, ...] (이름 순)"""
+    return client.table(LIST_VIEW).select('region, first_month, last_month').eq('level', level) \
+        .order('region').execute().data or []
+
+
+def load_region_index(client, regions, level='gu', start=None, end=None):
+    """
+    지역 지수를 긴 형식으로 읽기
+    start / end: yyyymm (포함), 반환값: region, Date, yyyymm, price, jeonse, rent, per, *_cnt, apts 컬럼 DataFrame
+    """
+    columns = ['region', 'yyyymm', 'price', 'price_cnt', 'jeonse', 'jeonse_cnt', 'rent', 'rent_cnt', 'per', 'apts']
+    query = client.table(INDEX_TABLE).select(', '.join(columns)).eq('level', level).in_('region', list(regions))
+    if start is not None:
+        query = query.gte('yyyymm', start)
+    if end is not None:
+        query = query.lte('yyyymm', end)
+    df = pd.DataFrame(query.order('region').order('yyyymm').execute().data or [], columns=columns)
+    df.insert(1, 'Date', month_index(df['yyyymm']).to_timestamp())
+    return df
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    from pipeline_metrics import setup_logging
+
+    parser = argparse.ArgumentParser(description="지역 시세 지수 집계")
+    parser.add_argument('--full', action='store_true', help="변경 로그와 상관없이 전체 다시 집계")
+    args = parser.parse_args()
+
+    # Load environment variables from the .env file
+    load_dotenv()
+    setup_logging()
+
+    # 로컬 DB 사용
+    from local_db import BACKEND, supabase, execute_sql
+
+    ensure_region_tables(execute_sql, BACKEND)
+    refresh_region_index(supabase, execute_sql, args.full)
@@ -1,4 +1,4 @@
-import json
+from datetime import datetime
 
 from dotenv import load_dotenv
 import os
@@ -7,6 +7,7 @@ from MySQLdb.cursors import DictCursor
 from supabase import create_client, Client
 from apt_value import get_APT_transactions, get_APT_info
 from get_apt_data import extract_and_save_year, extract_address  # year 추출 함수 import
+from price_trend_store import save_series
 
 # Load environment variables from the .env file
 load_dotenv()
@@ -57,46 +58,17 @@ try:
     for d in deal_types:
         DEAL_TYPE = str(d)
         ####
-        years = range(start_year, 2024)
+        years = range(start_year, datetime.today().year + 1)
         for y in years:
             YEAR = str(y)
             amount = get_APT_transactions(apt_info, PY, YEAR, DEAL_TYPE)
-            print(amount)
             if not amount:
                 continue
-            amount = sorted(amount, key=lambda x: x['date'])
-            print(amount)
 
-            response = supabase.table('APTInfo').select('*').eq('name', apt_name).eq('PY', PY).eq('DEAL_TYPE', DEAL_TYPE).limit(1).execute()
-            res = response.data
-            if res:
-                res = res[0]
-                price_trend = json.loads(res['price_trend'])
-                print(amount[-1]['date'])
-                date_exists = any(d['date'] == amount[-1]['date'] for d in price_trend)
-                if date_exists:
-                    print(f'{amount[-1]["date"]} 이미 존재함')
-                else:
-                    price_trend.extend(amount)
-                    response = supabase.table('APTInfo').update({
-                        'price_trend': json.dumps(price_trend),
-                        'year': year  # year 필드도 함께 업데이트
-                    }).eq('id', res['id']).execute()
-                    print("업데이트 완료!!")
-
-            else:
-                print('최초 생성')
-                response = supabase.table('APTInfo').insert({
-                    'name': apt_info['name'], 
-                    'PY': PY, 
-                    'DEAL_TYPE': DEAL_TYPE, 
-                    'seq': apt_info['seq'], 
-                    'description': apt_info['desc'], 
-                    'price_trend': json.dumps(amount),
-                    'status': 1,
-                    'year': year,
-                    'address': address  # address 필드 추가
-                }).execute()
+            # backfill_apt_data.py와 같이 save_series로 병합 저장 (price_monthly, unit, price_change 등도 함께 쓴다)
+            months = save_series(supabase, apt_info, PY, DEAL_TYPE, amount,
+                                 extra={'year': year}, new_row={'address': address})
+            print(f"{YEAR}년 {DEAL_TYPE} 저장 완료: {months}개월")
 
 except MySQLdb.Error as e:
     print("MySQL Error:", e)
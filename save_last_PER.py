@@ -1,133 +1,114 @@
-import json
-import pandas as pd
+"""
+아파트별 최근 PER 계산 및 저장
+
+계산은 last_per.refresh_last_per()의 INSERT ... SELECT 한 문장으로 DB에서 한다.
+기본은 지난 실행 이후 매매/월세 시세가 바뀐 아파트만 계산하고(last_per.refresh_dirty_per), --full 이면 전체를 다시 계산한다.
+--verify N 을 주면 N개 아파트를 예전 방식(get_apt_data + apt_analytics.align_series)으로도 계산해서 결과를 비교한다.
+--verify-panel 을 주면 전체 아파트를 per_panel 벡터화 계산으로 다시 계산해서 비교한다.
+"""
+import argparse
+import logging
+import math
 from dotenv import load_dotenv
-from datetime import datetime
-import os
+from apt_analytics import align_series, recent_means
 from get_apt_data import get_apt_list, get_apt_data
+from pipeline_metrics import setup_logging, stage, rows_written, serve_prometheus, export
 
 # Load environment variables from the .env file
 load_dotenv()
 
 # 로컬 DB 사용
-from local_db import supabase
-
-
-def load_data(dataset1, dataset2):
-    # 데이터프레임 생성
-    # 데이터 프레임 생성
-    df1 = pd.DataFrame(dataset1)
-    df2 = pd.DataFrame(dataset2)
-    # 'date'를 datetime 형식으로 변환
-    df1['date'] = pd.to_datetime(df1['date'], format='%Y%m')
-    df1 = df1.rename(columns={
-        'date': 'Date',
-        'avg': '매매가',
-        'cnt': '매매 거래량'
-    })
-    df1['Date'] = df1['Date'].dt.date
-    df2['date'] = pd.to_datetime(df2['date'], format='%Y%m')
-    df2 = df2.rename(columns={
-        'date': 'Date',
-        'avg': '월세',
-        'cnt': '월세 거래량'
-    })
-    df2['Date'] = df2['Date'].dt.date
-
-    # df1 = pd.DataFrame(list(dataset1.items()), columns=['Date', 'Data'])
-    # df1[['매매가', '매매 거래량']] = pd.DataFrame(df1['Data'].tolist(), index=df1.index)
-    # df1.drop('Data', axis=1, inplace=True)
-    # df2 = pd.DataFrame(list(dataset2.items()), columns=['Date', 'Data'])
-    # df2[['월세', '월세 거래량']] = pd.DataFrame(df2['Data'].tolist(), index=df2.index)
-    # df2.drop('Data', axis=1, inplace=True)
-    #
-    # # 데이터프레임을 날짜로 정렬
-    # df1['Date'] = pd.to_datetime(df1['Date'], format='%Y%m')
-    # df1['Date'] = df1['Date'].dt.date
-    # df2['Date'] = pd.to_datetime(df2['Date'], format='%Y%m')
-    # df2['Date'] = df2['Date'].dt.date
-    # df1 = df1.sort_values(by='Date')
-    # df2 = df2.sort_values(by='Date')
-
-    # Date를 기준으로 병합
-    # df3 = pd.merge(df1, df2, on='Date', how='inner')
-    df3 = pd.merge(df1, df2, on='Date', how='outer')
-    df3 = df3.sort_values(by='Date')
-
-    # 결측치를 이전 달 값으로 채워넣기
-    df3['매매가'] = df3['매매가'].astype(float).ffill()
-    df3['월세'] = df3['월세'].astype(float).ffill()
-    df3 = df3.fillna(0)
-
-    # 'PER' 계산
-    df3['PER'] = df3['매매가'] / (df3['월세'] * 12)
-
-    return df3
-
-
-try:
-    # cur = connection.cursor(DictCursor)
-    # Create a cursor to interact with the database
-    apts = get_apt_list()
-    for apt in apts:
-        apt_name, apt_PY, dataset1, dataset2, dataset3 = get_apt_data(apt['name'])
-        df = load_data(dataset1, dataset3)
-        df = df.set_index('Date')
-
-        # df3 = df3.set_index('Date')
-        # df3.index = df3.index.date
-
-        # 최근 6개월 매매가 평균
-        last_avg_price = round(df[-6:].mean()['매매가']/10000, 1)
-        print(f"- 최근 6개월 매매가 평균: {last_avg_price}억원")
-
-        # 최근 6개월 월세 평균
-        last_avg_rent = int(df[-6:].mean()['월세'])
-        print(f"- 최근 6개월 월세 평균: {last_avg_rent}만원")
-
-        # 최근 월세 시세를 통해 추정한 기대 매매가
-        s_val = df[-6:].mean()['월세'] * 12 * 30
-        e_val = df[-6:].mean()['월세'] * 12 * 35
-        print(f"- 최근 월세 시세를 통해 추정한 기대 매매가: :blue[{round(s_val/10000, 1)}억원] ~ :blue[{round(e_val/10000, 1)}억원]")
-
-        # print(df3[-3:])
-        print(df.iloc[-1]['PER'])
-        last_PER = df.iloc[-1]['PER']
-
-        # TODO: 해당 정보들을 별도 테이블로 만들어서 정기적으로 저장하자
-        # sql = "SELECT * FROM APTLastPER WHERE apt_name = %s AND apt_PY = %s"
-        # cur.execute(sql, (apt_name, apt_PY,))
-        # # SELECT * FROM User WHERE createdAt BETWEEN DATE_ADD (NOW(), INTERVAL -1 DAY) AND NOW();
-        # res = cur.fetchone()
-        print(apt_name, apt_PY)
-        response = supabase.table('APTLastPER').select('*').eq('apt_name', apt_name).eq('apt_PY', apt_PY).limit(
-            1).execute()
-        print(response)
-
-        if response.data:
-            res = response.data[0]
-            # cur.execute(
-            #     f"UPDATE APTLastPER SET "
-            #     f"last_avg_price = '{last_avg_price}', last_avg_rent = '{last_avg_rent}', "
-            #     f"last_PER = '{last_PER}' WHERE id = '{res['id']}'")
-            # connection.commit()
-            response = supabase.table('APTLastPER').update({
-                'last_avg_price': last_avg_price,
-                'last_avg_rent': last_avg_rent,
-                'last_PER': last_PER,
-                'updated': datetime.now().isoformat()
-            }).eq('id', res['id']).execute()
-        else:
-            # print('최초 생성')
-            # cur.execute(
-            #     f"INSERT INTO APTLastPER (apt_name, apt_PY, last_avg_price, last_avg_rent, last_PER) "
-            #     f"VALUES ('{apt_name}', '{apt_PY}', '{last_avg_price}', '{last_avg_rent}', '{last_PER}')")
-            # connection.commit()
-            response = supabase.table('APTLastPER').insert(
-                {'apt_name': apt_name, 'apt_PY': apt_PY, 'last_avg_price': last_avg_price, 'last_avg_rent': last_avg_rent, 'last_PER': last_PER}).execute()
-
-
-except Exception as e:
-    print("Error:", e)
-
-finally:
-    print("Finished")
+from local_db import supabase, execute_sql
+from last_per import ensure_last_per_table, refresh_dirty_per, snapshot_per
+from per_panel import build_panel, last_per_frame, load_long
+from per_stats import refresh_per_stats
+
+logger = logging.getLogger(__name__)
+
+
+def python_last_per(apt):
+    """예전 방식(아파트별로 get_apt_data + align_series)으로 계산한 (최근 6개월 매매가 평균, 월세 평균, PER)"""
+    apt_name, apt_PY, dataset1, dataset2, dataset3 = get_apt_data(apt['id'])
+    df = align_series(sale=dataset1, rent=dataset3)
+    price, rent = recent_means(df)
+    return price, rent, df['PER'].iloc[-1]
+
+
+def same_per(a, b):
+    """PER 비교 (월세가 없어서 NULL/NaN인 경우 둘 다 NaN이면 같음)"""
+    a = math.nan if a is None else a
+    return (math.isnan(a) and math.isnan(b)) or math.isclose(a, b, rel_tol=1e-4)
+
+
+def verify(n):
+    """n개 아파트의 DB 계산 결과와 예전 방식 계산 결과 비교, 다른 아파트 수를 반환"""
+    mismatches = 0
+    for apt in get_apt_list()[:n]:
+        row = supabase.table('APTLastPER').select('*').eq('apt_id', apt['id']).limit(1).execute().data
+        try:
+            expected = python_last_per(apt)
+        except Exception as e:
+            logger.warning("%s: 예전 방식 계산 실패 (%s)", apt['name'], e)
+            continue
+        if not row:
+            logger.error("%s: APTLastPER 행 없음", apt['name'])
+            mismatches += 1
+            continue
+        row = row[0]
+        if (abs(row['last_avg_price'] - expected[0]) > 0.1 or row['last_avg_rent'] != expected[1]
+                or not same_per(row['last_PER'], expected[2])):
+            logger.error("%s: DB %s / 예전 방식 %s", apt['name'],
+                         (row['last_avg_price'], row['last_avg_rent'], row['last_PER']), expected)
+            mismatches += 1
+    return mismatches
+
+
+def verify_panel():
+    """전체 APTLastPER를 per_panel 계산 결과와 비교, 다른 아파트 수를 반환"""
+    expected = last_per_frame(build_panel(load_long(execute_sql))).set_index('apt_id')
+    mismatches = 0
+    for row in execute_sql('SELECT apt_id, last_avg_price, last_avg_rent, "last_PER" FROM "APTLastPER"').data:
+        if row['apt_id'] not in expected.index:
+            logger.error("apt_id=%s: 패널에 시세 없음", row['apt_id'])
+            mismatches += 1
+            continue
+        e = expected.loc[row['apt_id']]
+        if (abs(row['last_avg_price'] - e['last_avg_price']) > 0.1 or row['last_avg_rent'] != e['last_avg_rent']
+                or not same_per(row['last_PER'], e['last_PER'])):
+            logger.error("apt_id=%s: DB %s / 패널 %s", row['apt_id'],
+                         (row['last_avg_price'], row['last_avg_rent'], row['last_PER']), tuple(e))
+            mismatches += 1
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="아파트별 최근 PER 계산 및 저장")
+    parser.add_argument('--full', action='store_true', help="바뀐 아파트만이 아니라 전체 다시 계산")
+    parser.add_argument('--verify', type=int, default=0, help="예전 방식으로도 계산해서 비교할 아파트 수")
+    parser.add_argument('--verify-panel', action='store_true', help="전체 아파트를 벡터화 패널 계산과 비교")
+    parser.add_argument('--metrics-file', default=None, help="Prometheus 텍스트 포맷 메트릭 파일 경로")
+    parser.add_argument('--metrics-port', type=int, default=None, help="메트릭을 제공할 로컬 HTTP 포트")
+    args = parser.parse_args()
+
+    setup_logging()
+    if args.metrics_port:
+        serve_prometheus(args.metrics_port)
+
+    try:
+        ensure_last_per_table()
+        with stage('aggregate'):
+            n, _ = refresh_dirty_per(args.full)
+            snapshot_per()
+            rows_written('per_stats', refresh_per_stats(args.full))
+        rows_written('APTLastPER', n)
+        if args.verify:
+            logger.info("예전 방식과 다른 아파트: %d개", verify(args.verify))
+        if args.verify_panel:
+            logger.info("패널 계산과 다른 아파트: %d개", verify_panel())
+
+    except Exception as e:
+        logger.exception("Error: %s", e)
+
+    finally:
+        export(args.metrics_file)
+        logger.info("Finished")
@@ -0,0 +1,381 @@
+"""
+DB 스키마/인덱스 관리
+
+- bootstrap: 테이블과 자주 쓰는 조회에 필요한 인덱스, price_trend 병합/조회 함수를 만든다 (여러 번 실행해도 됨)
+  price_trend가 아직 text인 예전 DB는 먼저 migrate_price_trend_jsonb.py로 jsonb로 바꾼다
+- check: 등록된 조회 형태마다 EXPLAIN을 돌려서 순차 스캔(Seq Scan)으로 빠지는 쿼리가 있거나
+  쓰기/읽기가 부르는 DB 함수(merge_price_trend, price_trend_window)가 없으면 실패한다
+  기본은 임시 스키마에 큰 데이터셋을 만들어서 확인하고 롤백한다
+  (--live면 실제 테이블로 확인, 행이 적은 테이블은 Seq Scan이 더 싸서 실패할 수 있다)
+
+작업별 테이블(BackfillCheckpoint, RefreshJob)은 각 스크립트가 시작할 때 만든다.
+DATABASE_URL이 sqlite:// 또는 duckdb:// 이면 bootstrap은 같은 컬럼의 임베디드용 테이블을 만든다 (check는 Postgres 전용).
+
+사용법:
+    python schema.py bootstrap
+    python schema.py check --apts 20000
+"""
+import argparse
+import json
+import logging
+import sys
+from datetime import date
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from pipeline_metrics import setup_logging
+from apt_units import DDL as UNIT_DDL, ensure_unit_tables
+from price_changes import DDL as CHANGE_DDL, ensure_change_table
+from per_history import DDL as HISTORY_DDL, partition_sql
+from price_monthly import DDL as MONTHLY_DDL, ensure_monthly_table
+from migrate_price_trend_jsonb import FUNCTIONS_SQL as PRICE_TREND_FUNCTIONS
+
+# Load environment variables from the .env file
+load_dotenv()
+
+# 로컬 DB 사용
+from local_db import BACKEND, engine, execute_sql
+from last_per import ENSURE_SQL as LAST_PER_SQL, ensure_screen_views
+from per_stats import ensure_stats_table
+from region_index import ensure_region_tables
+from similarity import ensure_similar_table
+from price_metrics import ensure_metrics_table
+from price_dense import ensure_dense_table
+
+logger = logging.getLogger(__name__)
+
+TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS "APTInfo" (
+        id SERIAL PRIMARY KEY,
+        name TEXT NOT NULL,
+        "PY" TEXT NOT NULL,
+        "DEAL_TYPE" TEXT NOT NULL,
+        seq TEXT,
+        description TEXT,
+        price_trend JSONB NOT NULL DEFAULT '[]'::jsonb,
+        status INTEGER NOT NULL DEFAULT 1,
+        year INTEGER,
+        address TEXT,
+        updated_at TIMESTAMPTZ,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS "APTLastPER" (
+        id SERIAL PRIMARY KEY,
+        apt_id INTEGER,
+        apt_name TEXT NOT NULL,
+        "apt_PY" TEXT NOT NULL,
+        address TEXT,
+        year INTEGER,
+        area_py REAL,
+        last_avg_price REAL,
+        last_avg_rent INTEGER,
+        "last_PER" REAL,
+        updated TIMESTAMPTZ DEFAULT now()
+    )
+    ''',
+    # 예전에 만들어진 DB에는 없는 컬럼
+    'ALTER TABLE "APTInfo" ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ',
+    'ALTER TABLE "APTInfo" ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0',
+]
+
+INDEXES = [
+    # save_apt_data / 수집 스크립트 (name + PY + DEAL_TYPE)
+    'CREATE INDEX IF NOT EXISTS "APTInfo_name_py_deal" ON "APTInfo" (name, "PY", "DEAL_TYPE")',
+    # get_apt_list: 활성 아파트 목록(apt_id 포함)만 인덱스에서 바로 읽는다
+    'DROP INDEX IF EXISTS "APTInfo_active"',
+    'CREATE INDEX IF NOT EXISTS "APTInfo_active_unit" ON "APTInfo" (name, "PY") INCLUDE (apt_id, year, address) WHERE status = 1',
+]
+
+# SQLite/DuckDB 파일용: Postgres 전용 문법(SERIAL, JSONB, INCLUDE, ADD COLUMN IF NOT EXISTS) 없이 같은 컬럼
+EMBEDDED_ID = {
+    'sqlite': 'INTEGER PRIMARY KEY AUTOINCREMENT',
+    'duckdb': "INTEGER PRIMARY KEY DEFAULT nextval('{seq}')",
+}
+
+EMBEDDED_TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS "APTInfo" (
+        id {aptinfo_id},
+        name TEXT NOT NULL,
+        "PY" TEXT NOT NULL,
+        "DEAL_TYPE" TEXT NOT NULL,
+        seq TEXT,
+        description TEXT,
+        price_trend TEXT NOT NULL DEFAULT '[]',
+        status INTEGER NOT NULL DEFAULT 1,
+        year INTEGER,
+        address TEXT,
+        updated_at TIMESTAMP,
+        version INTEGER NOT NULL DEFAULT 0,
+        apt_id INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS "APTLastPER" (
+        id {aptlastper_id},
+        apt_id INTEGER,
+        apt_name TEXT NOT NULL,
+        "apt_PY" TEXT NOT NULL,
+        address TEXT,
+        year INTEGER,
+        area_py REAL,
+        last_avg_price REAL,
+        last_avg_rent INTEGER,
+        "last_PER" REAL,
+        updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    MONTHLY_DDL[0],
+    *UNIT_DDL,
+    '''
+    CREATE TABLE IF NOT EXISTS price_change (
+        id {price_change_id},
+        apt_id INTEGER NOT NULL,
+        deal_type SMALLINT NOT NULL,
+        from_month INTEGER,
+        to_month INTEGER,
+        kind TEXT NOT NULL,
+        changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    CHANGE_DDL[2],
+    # per_daily: 임베디드는 파티션 없이 한 테이블
+    '''
+    CREATE TABLE IF NOT EXISTS per_daily (
+        snap_date DATE NOT NULL,
+        apt_id INTEGER NOT NULL,
+        per REAL,
+        avg_price REAL,
+        avg_rent INTEGER,
+        PRIMARY KEY (snap_date, apt_id)
+    )
+    ''',
+]
+
+EMBEDDED_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS "APTInfo_name_py_deal" ON "APTInfo" (name, "PY", "DEAL_TYPE")',
+    'CREATE INDEX IF NOT EXISTS "APTInfo_apt_id" ON "APTInfo" (apt_id)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS "APTLastPER_apt_id_key" ON "APTLastPER" (apt_id)',
+    MONTHLY_DDL[1],
+    'CREATE INDEX IF NOT EXISTS price_change_changed_at ON price_change (changed_at)',
+]
+
+# price_trend_store가 rpc로 부르는 함수 (check에서 있는지 확인)
+REQUIRED_FUNCTIONS = ['merge_price_trend', 'price_trend_window']
+
+# check에서 EXPLAIN 할 조회 형태 (이름, SQL, 파라미터)
+QUERY_SHAPES = [
+    ('get_apt_data', 'SELECT id, name, "PY", "DEAL_TYPE" FROM "APTInfo" WHERE apt_id = :apt_id', {'apt_id': 1}),
+    ('save_series', 'SELECT id FROM unit WHERE seq = :seq AND "PY" = :py LIMIT 1', {'seq': 1001, 'py': '34'}),
+    ('get_apt_list', 'SELECT name, year, "PY", address, apt_id FROM "APTInfo" WHERE status = 1', {}),
+    ('save_last_PER', 'SELECT * FROM "APTLastPER" WHERE apt_id = :apt_id LIMIT 1', {'apt_id': 1}),
+    ('price_monthly_series', 'SELECT deal_type, yyyymm, avg, min, max, cnt FROM price_monthly '
+     'WHERE apt_id = :apt_id AND yyyymm >= :start AND yyyymm <= :end',
+     {'apt_id': 1, 'start': 202001, 'end': 202312}),
+    ('screen_apartments', 'SELECT * FROM apt_screen WHERE address IN (:region) AND "last_PER" >= :per_min '
+     'ORDER BY "last_PER", apt_id LIMIT 50', {'region': '서울 송파구', 'per_min': 20}),
+    ('per_stats_series', 'SELECT yyyymm, per_12m, per_36m, per_z, market_pct FROM per_stats WHERE apt_id = :apt_id',
+     {'apt_id': 1}),
+    ('similar_apartments', 'SELECT similar_id, corr, overlap FROM apt_similar WHERE apt_id = :apt_id AND kind = :kind '
+     'ORDER BY rank_no', {'apt_id': 1, 'kind': 'price'}),
+    ('price_metrics_series', 'SELECT yyyymm, jeonse_ratio, rent_yield, conv_rate FROM price_metrics '
+     'WHERE apt_id = :apt_id ORDER BY yyyymm', {'apt_id': 1}),
+    ('price_dense_series', 'SELECT deal_type, yyyymm, avg, cnt, observed FROM price_dense '
+     'WHERE apt_id = :apt_id AND yyyymm >= :start AND yyyymm <= :end ORDER BY deal_type, yyyymm',
+     {'apt_id': 1, 'start': 202001, 'end': 202312}),
+]
+
+# 기간 전체를 읽는 조회: 기간에 해당하는 월 파티션만 Seq Scan 하면 통과 (이름, SQL, 파라미터, 허용 파티션)
+PARTITION_SHAPES = [
+    ('per_panel', 'SELECT snap_date, apt_id, per, avg_price, avg_rent FROM per_daily '
+     'WHERE snap_date >= :start AND snap_date <= :end', {'start': '2024-01-01', 'end': '2024-03-31'},
+     {'per_daily_202401', 'per_daily_202402', 'per_daily_202403'}),
+]
+
+# 임시 스키마에 넣을 데이터 (아파트/평형 수 기준)
+SEED_SQL = [
+    '''
+    INSERT INTO "APTInfo" (name, "PY", "DEAL_TYPE", seq, description, status, year, address)
+    SELECT '아파트' || a, py, dt, (1000 + a)::text, '', CASE WHEN random() < :active_ratio THEN 1 ELSE 0 END,
+           200001 + (a % 24) * 100, (ARRAY['서울 송파구', '서울 강남구', '서울 서초구', '서울 성동구', '수원시 영통구'])[1 + a % 5]
+    FROM generate_series(1, :apts) a, unnest(ARRAY['25', '34']) py, unnest(ARRAY['1', '2', '3']) dt
+    ''',
+    '''
+    UPDATE "APTInfo" a SET apt_id = m.apt_id
+    FROM (SELECT name, "PY", MIN(id) AS apt_id FROM "APTInfo" GROUP BY name, "PY") m
+    WHERE a.name = m.name AND a."PY" = m."PY"
+    ''',
+    '''
+    INSERT INTO unit (id, seq, "PY") SELECT DISTINCT apt_id, seq::int, "PY" FROM "APTInfo"
+    ''',
+    '''
+    INSERT INTO price_monthly (apt_id, deal_type, yyyymm, avg, min, max, cnt)
+    SELECT apt_id, "DEAL_TYPE"::smallint, y * 100 + m, 100000, 90000, 110000, 3
+    FROM "APTInfo", generate_series(2019, 2024) y, generate_series(1, 12) m
+    WHERE status = 1
+    ''',
+    '''
+    INSERT INTO "APTLastPER" (apt_id, apt_name, "apt_PY", address, year, area_py, last_avg_price, last_avg_rent, "last_PER")
+    SELECT DISTINCT apt_id, name, "PY", address, year, CAST("PY" AS REAL), 10.0, 250, 20 + (apt_id % 30) FROM "APTInfo"
+    ''',
+    '''
+    INSERT INTO per_stats (apt_id, yyyymm, per, per_12m)
+    SELECT apt_id, yyyymm, 30.0, 30.0 FROM price_monthly WHERE deal_type = 1
+    ''',
+    '''
+    INSERT INTO apt_similar (apt_id, kind, rank_no, similar_id, corr, overlap, run_id)
+    SELECT apt_id, kind, r, apt_id + r, 0.9, 60, 0
+    FROM "APTLastPER", unnest(ARRAY['price', 'per']) kind, generate_series(1, 10) r
+    ''',
+    '''
+    INSERT INTO price_metrics (apt_id, yyyymm, jeonse_ratio, rent_yield, conv_rate)
+    SELECT apt_id, yyyymm, 0.6, 0.03, 0.05 FROM price_monthly WHERE deal_type = 1
+    ''',
+    '''
+    INSERT INTO price_dense (apt_id, deal_type, yyyymm, avg, cnt, observed)
+    SELECT apt_id, deal_type, yyyymm, avg, cnt, true FROM price_monthly
+    ''',
+    *[partition_sql(date(2024, m, 1)) for m in range(1, 7)],
+    '''
+    INSERT INTO per_daily (snap_date, apt_id, per, avg_price, avg_rent)
+    SELECT d::date, apt_id, "last_PER", last_avg_price, last_avg_rent
+    FROM "APTLastPER", generate_series('2024-01-01'::date, '2024-06-30'::date, '1 day') d
+    ''',
+]
+
+
+def bootstrap_embedded(backend=BACKEND, run_sql=execute_sql):
+    """SQLite/DuckDB 파일에 테이블과 인덱스 생성"""
+    ids = {}
+    for table in ('aptinfo', 'aptlastper', 'price_change'):
+        if backend == 'duckdb':
+            run_sql(f'CREATE SEQUENCE IF NOT EXISTS {table}_id_seq')
+        ids[f'{table}_id'] = EMBEDDED_ID[backend].format(seq=f'{table}_id_seq')
+    for sql in EMBEDDED_TABLES:
+        run_sql(sql.format(**ids))
+    for sql in EMBEDDED_INDEXES:
+        run_sql(sql)
+    ensure_screen_views(run_sql)
+    ensure_stats_table(run_sql)
+    ensure_region_tables(run_sql, backend)
+    ensure_similar_table(run_sql)
+    ensure_metrics_table(run_sql, backend)
+    ensure_dense_table(run_sql)
+
+
+def bootstrap(run_sql=execute_sql):
+    """테이블과 인덱스 생성 (run_sql: SQL 문자열을 실행하는 함수)"""
+    if BACKEND != 'postgresql':
+        return bootstrap_embedded(BACKEND, run_sql)
+    for sql in TABLES:
+        run_sql(sql)
+    ensure_monthly_table(run_sql)
+    ensure_unit_tables(run_sql)
+    ensure_change_table(run_sql)
+    # write_price_trend / get_price_trend가 rpc로 부르는 함수
+    for sql in PRICE_TREND_FUNCTIONS:
+        run_sql(sql)
+    # APTLastPER apt_id 유니크 인덱스, per_daily 스냅샷 테이블
+    for sql in LAST_PER_SQL + HISTORY_DDL:
+        run_sql(sql)
+    ensure_screen_views(run_sql)
+    ensure_stats_table(run_sql)
+    ensure_region_tables(run_sql)
+    ensure_similar_table(run_sql)
+    ensure_metrics_table(run_sql)
+    ensure_dense_table(run_sql)
+    for sql in INDEXES:
+        run_sql(sql)
+
+
+def seq_scans(plan):
+    """EXPLAIN (FORMAT JSON) 계획 트리에서 Seq Scan 하는 테이블 이름 리스트"""
+    found = [plan.get('Relation Name')] if plan['Node Type'] == 'Seq Scan' else []
+    for child in plan.get('Plans', []):
+        found.extend(seq_scans(child))
+    return found
+
+
+def missing_functions(conn):
+    """REQUIRED_FUNCTIONS 중 search_path에서 보이지 않는 함수 이름 리스트"""
+    found = set(conn.execute(text(
+        'SELECT proname FROM pg_proc WHERE proname = ANY(:names) AND pg_function_is_visible(oid)'
+    ), {'names': REQUIRED_FUNCTIONS}).scalars())
+    return [name for name in REQUIRED_FUNCTIONS if name not in found]
+
+
+def explain_shapes(conn):
+    """반환값: [(이름, 사용한 인덱스/허용된 파티션 리스트, Seq Scan 테이블 리스트), ...]"""
+    def indexes(plan):
+        found = [plan['Index Name']] if 'Index Name' in plan else []
+        for child in plan.get('Plans', []):
+            found.extend(indexes(child))
+        return found
+
+    result = []
+    shapes = [(*shape, set()) for shape in QUERY_SHAPES] + PARTITION_SHAPES
+    for name, sql, params, allowed in shapes:
+        plan = conn.execute(text('EXPLAIN (FORMAT JSON) ' + sql), params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        root = plan[0]['Plan']
+        scans = seq_scans(root)
+        used = indexes(root) + [t for t in scans if t in allowed]
+        result.append((name, used, [t for t in scans if t not in allowed]))
+    return result
+
+
+def check(apts=20000, active_ratio=0.1, live=False):
+    """
+    조회 형태마다 EXPLAIN 결과를 출력하고, Seq Scan이 하나라도 있거나 REQUIRED_FUNCTIONS가 없으면 False
+    live=False면 임시 스키마에 apts개 아파트(평형 2개 x 거래유형 3개)를 넣어서 확인하고 롤백한다
+    """
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            if not live:
+                conn.execute(text('CREATE SCHEMA schema_check'))
+                conn.execute(text('SET LOCAL search_path TO schema_check, public'))
+                bootstrap(lambda sql: conn.execute(text(sql)))
+                for sql in SEED_SQL:
+                    conn.execute(text(sql), {'apts': apts, 'active_ratio': active_ratio})
+                conn.execute(text('ANALYZE'))
+            results = explain_shapes(conn)
+            missing = missing_functions(conn)
+        finally:
+            trans.rollback()
+
+    ok = not missing
+    if missing:
+        logger.error("DB 함수 없음: %s (python schema.py bootstrap 또는 migrate_price_trend_jsonb.py)", ', '.join(missing))
+    for name, used, seq in results:
+        if seq:
+            ok = False
+            logger.error("%-22s Seq Scan: %s", name, ', '.join(seq))
+        else:
+            logger.info("%-22s %s", name, ', '.join(used) or '(인덱스 없음)')
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DB 스키마/인덱스 관리")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('bootstrap', help="테이블과 인덱스 생성")
+    p = sub.add_parser('check', help="조회 형태별 EXPLAIN 확인")
+    p.add_argument('--apts', type=int, default=20000, help="임시 데이터셋의 아파트 수")
+    p.add_argument('--active-ratio', type=float, default=0.1, help="임시 데이터셋에서 status=1 비율")
+    p.add_argument('--live', action='store_true', help="임시 데이터 대신 실제 테이블로 확인")
+    args = parser.parse_args()
+
+    setup_logging()
+    if args.command == 'bootstrap':
+        bootstrap()
+        logger.info("스키마 준비 완료")
+    elif BACKEND != 'postgresql':
+        sys.exit(f"check는 Postgres에서만 지원합니다 (현재: {BACKEND})")
+    else:
+        sys.exit(0 if check(args.apts, args.active_ratio, args.live) else 1)
@@ -0,0 +1,43 @@
+"""
+저PER 아파트 스크리닝 (필터/정렬/페이지를 DB에서)
+
+apt_screen 뷰(활성 아파트의 APTLastPER, last_per.SCREEN_VIEWS)에 지역/준공년월/평형/PER 조건과
+정렬, range(offset, limit)를 그대로 넘겨서 화면에 보일 한 페이지만 읽는다.
+PER 순 정렬은 APTLastPER_PER / APTLastPER_address_PER 인덱스를 탄다 (schema.py check의 screen_apartments).
+
+client는 local_db.supabase 또는 Supabase 클라이언트
+"""
+SCREEN_VIEW = 'apt_screen'
+REGION_VIEW = 'apt_screen_regions'
+
+# 정렬할 수 있는 컬럼
+SORT_COLUMNS = ('last_PER', 'last_avg_price', 'last_avg_rent', 'year', 'area_py', 'apt_name')
+
+
+def screen_apartments(client, regions=None, years=None, PYs=None, PERs=None,
+                      order='last_PER', desc=False, limit=50, offset=0):
+    """
+    조건에 맞는 아파트 한 페이지
+    regions: 주소 리스트, years: (최소, 최대) 준공 yyyymm, PYs: (최소, 최대) 평형, PERs: (최소, 최대) PER
+    범위의 한쪽이 None이면 그쪽은 제한 없음, PERs를 주면 PER이 없는(월세 없음) 아파트는 빠진다
+    반환값: (행 리스트, 조건에 맞는 전체 개수)
+    """
+    if order not in SORT_COLUMNS:
+        raise ValueError(f"정렬할 수 없는 컬럼: {order}")
+    query = client.table(SCREEN_VIEW).select('*', count='exact')
+    if regions:
+        query = query.in_('address', list(regions))
+    for col, bounds in (('year', years), ('area_py', PYs), ('last_PER', PERs)):
+        low, high = bounds or (None, None)
+        if low is not None:
+            query = query.gte(col, low)
+        if high is not None:
+            query = query.lte(col, high)
+    # 같은 값이면 apt_id 순으로 고정해서 페이지가 겹치지 않게 한다
+    result = query.order(order, desc=desc).order('apt_id').range(offset, offset + limit - 1).execute()
+    return result.data or [], result.count
+
+
+def screen_regions(client):
+    """지역별 아파트 수와 준공년월/평형 범위 (필터 선택지용, 주소 순)"""
+    return client.table(REGION_VIEW).select('*').order('address').execute().data or []
@@ -0,0 +1,204 @@
+"""
+비슷한 단지 사전 계산(apt_similar)
+
+활성 아파트의 월별 시세를 아파트 x 연속된 달 행렬로 맞추고 두 가지 시계열의 쌍별 상관계수를 NumPy로 계산해서
+아파트마다 상관계수가 가장 높은 TOP_K개 단지만 저장한다. 아파트 비교 화면은 이 테이블만 읽는다.
+- price: 월별 매매가 로그 수익률 (연속된 두 달 모두 매매 거래가 있을 때만)
+- per: 월별 PER (per_panel.build_panel과 같은 값, 매매가가 아직 없거나 월세가 없는 달은 빈칸)
+- 두 아파트 모두 값이 있는 달(overlap)만으로 상관계수를 계산하고, overlap이 MIN_OVERLAP 미만인 쌍은 후보에서 뺀다
+- N x N 행렬을 한 번에 만들지 않고 BLOCK개 행씩 행렬곱(겹친 달의 합/제곱합/곱의 합)으로 계산한다
+
+상관계수는 모든 쌍에 걸리므로 부분 갱신 없이 전체를 다시 계산한다.
+변경 로그 커서('similarity') 이후 변경(시세, 아파트 추가 insert, 비활성 deactivate)이 하나라도 있으면 다시 계산하고,
+없더라도 apt_similar에 비활성 아파트가 남아 있으면(변경 로그 없이 status만 바뀐 경우) 다시 계산한다.
+
+사용법:
+    python similarity.py
+    python similarity.py --full
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from local_db import supabase, execute_sql, copy_rows
+from per_panel import build_panel, load_long
+from price_changes import pending_changes, save_cursor
+
+logger = logging.getLogger(__name__)
+
+SIMILAR_TABLE = 'apt_similar'
+CONSUMER = 'similarity'
+KINDS = ('price', 'per')
+TOP_K = 10
+MIN_OVERLAP = 24
+BLOCK = 512
+SIMILAR_COLUMNS = ['apt_id', 'kind', 'rank_no', 'similar_id', 'corr', 'overlap', 'run_id']
+
+DDL = [
+    f'''
+    CREATE TABLE IF NOT EXISTS {SIMILAR_TABLE} (
+        apt_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        rank_no INTEGER NOT NULL,
+        similar_id INTEGER NOT NULL,
+        corr REAL NOT NULL,
+        overlap INTEGER NOT NULL,
+        run_id BIGINT NOT NULL,
+        PRIMARY KEY (apt_id, kind, rank_no)
+    )
+    ''',
+]
+
+
+def ensure_similar_table(run_sql=execute_sql):
+    for sql in DDL:
+        run_sql(sql)
+
+
+def series_matrix(long):
+    """
+    긴 형식(apt_id, deal_type, yyyymm, avg) -> (apt_ids, {'price': 로그 수익률 행렬, 'per': PER 행렬})
+    행렬은 아파트 x 첫 달부터 마지막 달까지 빠짐없는 달, 값이 없는 칸은 NaN
+    """
+    panel = build_panel(long)
+    apt_ids, rows = np.unique(panel['apt_id'].to_numpy(), return_inverse=True)
+    yyyymm = panel['yyyymm'].to_numpy()
+    ordinal = yyyymm // 100 * 12 + yyyymm % 100 - 1
+    cols = ordinal - ordinal.min()
+    shape = (len(apt_ids), cols.max() + 1)
+
+    per = np.full(shape, np.nan)
+    price = panel['price'].to_numpy(dtype=float)
+    # 첫 매매 거래 전 달은 build_panel에서 0으로 채워져 있다
+    per[rows, cols] = np.where(price > 0, panel['PER'].to_numpy(dtype=float), np.nan)
+
+    # 수익률은 앞 값 채우기 전의 실제 매매 시세로
+    sale = long[long['deal_type'] == 1]
+    log_price = np.full(shape, np.nan)
+    sale_ordinal = sale['yyyymm'].to_numpy() // 100 * 12 + sale['yyyymm'].to_numpy() % 100 - 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_price[np.searchsorted(apt_ids, sale['apt_id'].to_numpy()), sale_ordinal - ordinal.min()] = \
+            np.log(np.where(sale['avg'].to_numpy(dtype=float) > 0, sale['avg'].to_numpy(dtype=float), np.nan))
+    returns = np.full(shape, np.nan)
+    returns[:, 1:] = np.diff(log_price, axis=1)
+    return apt_ids, {'price': returns, 'per': per}
+
+
+def top_similar(values, k=TOP_K, min_overlap=MIN_OVERLAP, block=BLOCK):
+    """
+    아파트 x 달 행렬(NaN = 값 없음)에서 행마다 상관계수가 가장 높은 k개 다른 행
+    반환값: (행 번호, 비슷한 행 번호, 상관계수, 겹친 달 수) 1차원 배열들 (행 번호, 순위 순)
+    """
+    valid = ~np.isnan(values)
+    v = valid.astype(float)
+    x = np.where(valid, values, 0.0)
+    # 행 평균을 빼 두면 합/제곱합 차이로 분산을 구할 때 자릿수 손실이 적다
+    x = np.where(valid, x - x.sum(axis=1, keepdims=True) / np.maximum(v.sum(axis=1, keepdims=True), 1), 0.0)
+    # 행렬곱은 float32로 (상관계수 순위에는 충분하고 두 배 빠르다)
+    v, x = v.astype(np.float32), x.astype(np.float32)
+    xx = x * x
+    n_rows = len(values)
+    k = max(min(k, n_rows - 1), 1)
+
+    found = ([np.empty(0, dtype=int)], [np.empty(0, dtype=int)], [np.empty(0)], [np.empty(0, dtype=int)])
+    for lo in range(0, n_rows, block):
+        xb, vb = x[lo:lo + block], v[lo:lo + block]
+        # 겹친 달만의 개수, 합, 제곱합, 곱의 합 (B x N)
+        n = vb @ v.T
+        sx, sy = xb @ v.T, vb @ x.T
+        sxx, syy = (xb * xb) @ v.T, vb @ xx.T
+        sxy = xb @ x.T
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = sxy - sx * sy / n
+            var_x, var_y = sxx - sx * sx / n, syy - sy * sy / n
+            # 겹친 달 동안 값이 (거의) 그대로인 쌍은 빼기 (float32 자릿수 손실 기준)
+            ok = (n >= min_overlap) & (var_x > 1e-5 * sxx) & (var_y > 1e-5 * syy)
+            corr = np.where(ok, cov / np.sqrt(var_x * var_y), -np.inf)
+        corr[np.arange(len(xb)), np.arange(lo, lo + len(xb))] = -np.inf
+
+        top = np.argpartition(-corr, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(corr, top, axis=1), axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        best = np.take_along_axis(corr, top, axis=1)
+        keep = np.isfinite(best)
+        row = np.broadcast_to(np.arange(lo, lo + len(xb))[:, None], top.shape)
+        found[0].append(row[keep])
+        found[1].append(top[keep])
+        found[2].append(np.clip(best[keep], -1, 1))
+        found[3].append(np.take_along_axis(n, top, axis=1)[keep].astype(int))
+    return tuple(np.concatenate(parts) for parts in found)
+
+
+def similar_frame(apt_ids, matrices, k=TOP_K, min_overlap=MIN_OVERLAP):
+    """series_matrix 결과 -> SIMILAR_COLUMNS 프레임 (run_id 제외)"""
+    frames = []
+    for kind in KINDS:
+        rows, others, corr, overlap = top_similar(matrices[kind], k, min_overlap)
+        frame = pd.DataFrame({'apt_id': apt_ids[rows], 'kind': kind, 'similar_id': apt_ids[others],
+                              'corr': corr, 'overlap': overlap})
+        frame.insert(2, 'rank_no', frame.groupby('apt_id').cumcount() + 1)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def write_similar(similar):
+    """아파트별 상위 단지 upsert 후 이번 실행에서 쓰지 않은 옛 행(순위가 줄었거나 빠진 아파트) 삭제"""
+    run_id = time.time_ns() // 1000
+    records = ((int(r.apt_id), r.kind, int(r.rank_no), int(r.similar_id), float(r.corr), int(r.overlap), run_id)
+               for r in similar.itertuples(index=False))
+    n = copy_rows(SIMILAR_TABLE, SIMILAR_COLUMNS, records, on_conflict='apt_id, kind, rank_no')
+    execute_sql(f'DELETE FROM {SIMILAR_TABLE} WHERE run_id <> :run_id', {'run_id': run_id})
+    return n
+
+
+# apt_similar에서 활성이 아닌 아파트를 가리키는 행 수
+STALE_SQL = f'''
+    SELECT COUNT(*) AS n FROM {SIMILAR_TABLE} s
+    WHERE NOT EXISTS (SELECT 1 FROM "APTInfo" a WHERE a.apt_id = s.apt_id AND a.status = 1)
+       OR NOT EXISTS (SELECT 1 FROM "APTInfo" a WHERE a.apt_id = s.similar_id AND a.status = 1)
+'''
+
+
+def active_apt_ids():
+    rows = supabase.table('APTInfo').select('apt_id').eq('status', 1).execute().data or []
+    return sorted({r['apt_id'] for r in rows if r['apt_id'] is not None})
+
+
+def refresh_similarity(full=False):
+    """
+    apt_similar 다시 계산 (full이 아니면 커서 이후 변경이 없고 비활성 아파트도 남아 있지 않을 때 건너뜀)
+    반환값: 쓴 행 수
+    """
+    ensure_similar_table()
+    changes, cursor = pending_changes(supabase, CONSUMER, full)
+    if changes is not None and not changes and not execute_sql(STALE_SQL).data[0]['n']:
+        logger.info("비슷한 단지: 바뀐 시세 없음")
+        save_cursor(supabase, CONSUMER, cursor)
+        return 0
+
+    start = time.perf_counter()
+    long = load_long(execute_sql)
+    long = long[long['apt_id'].isin(active_apt_ids())]
+    if long.empty:
+        n = write_similar(pd.DataFrame(columns=SIMILAR_COLUMNS[:-1]))
+    else:
+        apt_ids, matrices = series_matrix(long)
+        n = write_similar(similar_frame(apt_ids, matrices))
+        logger.info("비슷한 단지: 아파트 %d개 x %d개월, %d행 (%.1f초)",
+                    len(apt_ids), matrices['per'].shape[1], n, time.perf_counter() - start)
+    save_cursor(supabase, CONSUMER, cursor)
+    return n
+
+
+if __name__ == "__main__":
+    from pipeline_metrics import setup_logging
+
+    parser = argparse.ArgumentParser(description="비슷한 단지 사전 계산")
+    parser.add_argument('--full', action='store_true', help="변경 로그와 상관없이 다시 계산")
+    args = parser.parse_args()
+
+    setup_logging()
+    refresh_similarity(args.full)
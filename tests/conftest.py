@@ -0,0 +1,55 @@
+"""
+테스트 공통 설정
+
+local_db는 import할 때 DATABASE_URL로 연결하므로, 테스트 모듈을 읽기 전에 임시 SQLite 파일로 바꾸고 스키마를 만든다.
+Postgres가 필요한 테스트는 TEST_POSTGRES_URL이 있을 때만 실행한다.
+
+사용법:
+    python -m pytest -q tests
+    TEST_POSTGRES_URL=postgresql://localhost/invest_test python -m pytest -q tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DB_DIR = tempfile.mkdtemp(prefix='invest_info_test_')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(DB_DIR, 'test.db')}"
+
+from local_db import supabase, execute_sql  # noqa: E402
+from schema import bootstrap_embedded  # noqa: E402
+from refresh_scheduler import ensure_backoff_table  # noqa: E402
+
+bootstrap_embedded()
+ensure_backoff_table()
+
+# 테스트마다 비우는 테이블
+TABLES = ['"APTInfo"', '"APTLastPER"', 'unit', 'price_monthly', 'price_change', 'change_cursor',
+          'price_metrics', 'price_dense', 'per_stats', 'apt_similar', 'per_daily', 'region_member', 'region_index',
+          'refresh_backoff']
+
+
+@pytest.fixture
+def db():
+    """빈 테이블의 로컬 DB 클라이언트 (local_db.supabase)"""
+    for table in TABLES:
+        execute_sql(f'DELETE FROM {table}')
+    return supabase
+
+
+@pytest.fixture
+def postgres_url():
+    """TEST_POSTGRES_URL (없으면 건너뜀)"""
+    url = os.environ.get('TEST_POSTGRES_URL')
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL 없음")
+    return url
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(DB_DIR, ignore_errors=True)
@@ -0,0 +1,103 @@
+"""apt_analytics: 시리즈 정렬(align_series), PER(masked_per), 최근 평균(recent_means)과 per_panel 계산이 같은지 확인"""
+import numpy as np
+import pandas as pd
+
+from apt_analytics import align_series, masked_per, recent_means
+from per_panel import build_panel, last_per_frame
+
+
+def series(*points):
+    """(yyyymm, avg, cnt) -> price_trend 형식 리스트"""
+    return [{'date': str(date), 'avg': avg, 'min': avg, 'max': avg, 'cnt': cnt} for date, avg, cnt in points]
+
+
+# 매매는 2월/6월, 월세는 1월/4월이 비어 있다 (8개 달 중 5월은 전세만 있음)
+SALE = series((202301, 100000, 2), (202303, 104000, 1), (202304, 106000, 3), (202305, 107000, 1),
+              (202307, 111000, 2), (202308, 113000, 1))
+JEONSE = series((202305, 60000, 4))
+RENT = series((202302, 250, 1), (202303, 260, 2), (202306, 270, 1), (202307, 280, 1), (202308, 290, 2))
+
+
+def test_gaps_filled_forward():
+    df = align_series(SALE, JEONSE, RENT)
+
+    assert [str(m) for m in df.index] == ['2023-01', '2023-02', '2023-03', '2023-04', '2023-05', '2023-06',
+                                          '2023-07', '2023-08']
+    assert df['Date'].iloc[0] == pd.Timestamp('2023-01-01')
+    # 빈 달은 이전 달 값, 첫 거래 전은 0
+    assert df['매매가'].tolist() == [100000, 100000, 104000, 106000, 107000, 107000, 111000, 113000]
+    assert df['월세'].tolist() == [0, 250, 260, 260, 260, 270, 280, 290]
+    assert df['전세'].tolist() == [0, 0, 0, 0, 60000, 60000, 60000, 60000]
+    # 거래량 빈 달은 앞 값이 아니라 0
+    assert df['매매 거래량'].tolist() == [2, 0, 1, 3, 1, 0, 2, 1]
+
+
+def test_volume_dtypes():
+    df = align_series(SALE, JEONSE, RENT)
+
+    for col in ('매매 거래량', '전세 거래량', '월세 거래량'):
+        assert df[col].dtype == np.int64
+    for col in ('매매가', '전세', '월세', 'PER'):
+        assert df[col].dtype == np.float64
+    assert isinstance(df.index, pd.PeriodIndex)
+
+
+def test_zero_rent_gives_nan_per():
+    df = align_series(SALE, None, RENT)
+
+    # 월세가 아직 없는 1월은 inf가 아니라 NaN
+    assert np.isnan(df['PER'].iloc[0])
+    assert df['PER'].iloc[1] == 100000 / (250 * 12)
+    assert not np.isinf(df['PER']).any()
+    assert np.isnan(masked_per([100, 100, 100], [0, -1, np.nan])).all()
+    assert masked_per(pd.Series([120.0]), pd.Series([1.0]))[0] == 10.0
+
+
+def test_empty_sale_or_rent():
+    no_sale = align_series([], None, RENT)
+    assert (no_sale['매매가'] == 0).all()
+    assert no_sale['매매 거래량'].dtype == np.int64
+    assert (no_sale['PER'] == 0).all()
+    # 월세가 있는 달만 행이 된다
+    assert len(no_sale) == len(RENT)
+    assert recent_means(no_sale) == (0.0, 270)
+
+    no_rent = align_series(SALE, None, [])
+    assert (no_rent['월세'] == 0).all()
+    assert no_rent['PER'].isna().all()
+
+    empty = align_series([], None, [])
+    assert empty.empty
+    assert list(empty.columns) == ['Date', '매매가', '매매 거래량', '월세', '월세 거래량', 'PER']
+    assert recent_means(empty) == (0.0, 0)
+
+
+def test_recent_means_last_rows():
+    df = align_series(SALE, None, RENT)
+
+    # 달력 6개월이 아니라 마지막 6개 행
+    assert recent_means(df) == (round(np.mean([104000, 106000, 107000, 107000, 111000, 113000]) / 10000, 1),
+                                int(np.mean([260, 260, 260, 270, 280, 290])))
+    assert recent_means(df, months=2) == (11.2, 285)
+
+
+def test_per_panel_matches_align_series():
+    long = pd.DataFrame(
+        [(1, 1, int(r['date']), r['avg']) for r in SALE] + [(1, 3, int(r['date']), r['avg']) for r in RENT]
+        # 다른 아파트가 섞여 있어도 앞 값이 넘어오지 않는다
+        + [(2, 1, 202309, 50000), (2, 3, 202310, 100)],
+        columns=['apt_id', 'deal_type', 'yyyymm', 'avg'])
+    panel = build_panel(long)
+    one = panel[panel['apt_id'] == 1]
+    df = align_series(SALE, None, RENT)
+
+    assert one['yyyymm'].tolist() == [int(m.strftime('%Y%m')) for m in df.index]
+    np.testing.assert_array_equal(one['price'].to_numpy(), df['매매가'].to_numpy())
+    np.testing.assert_array_equal(one['rent'].to_numpy(), df['월세'].to_numpy())
+    np.testing.assert_array_equal(one['PER'].to_numpy(), df['PER'].to_numpy())
+
+    last = last_per_frame(panel).set_index('apt_id')
+    assert (last.loc[1, 'last_avg_price'], last.loc[1, 'last_avg_rent']) == recent_means(df)
+    assert last.loc[1, 'last_PER'] == df['PER'].iloc[-1]
+    assert panel[panel['apt_id'] == 2]['price'].tolist() == [50000, 50000]
+    assert panel[panel['apt_id'] == 2]['rent'].tolist() == [0, 100]
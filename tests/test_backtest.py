@@ -0,0 +1,38 @@
+"""backtest: 보유 구간(체결 지연), 거래 수익률/보유 개월/최대 낙폭"""
+import numpy as np
+
+from backtest import _trades, positions
+
+
+def test_positions_and_trade_returns():
+    # 0월 매수 신호(PER < 20), 3월 매도 신호(PER > 50), 5월 매수 신호는 체결 전에 끝난다
+    per = np.array([[10.0, 30, 30, 60, 60, 10]])
+    price = np.array([[100.0, 100, 120, 90, 110, 130]])
+
+    held = positions(per, 20, 50, lag=1)
+    # 신호 다음 달에 사고(1월), 매도 신호 다음 달(4월)에 판다
+    assert held.tolist() == [[False, True, True, True, False, False]]
+    assert positions(per, 20, 50, lag=0).tolist() == [[True, True, True, False, False, True]]
+
+    rows, returns, hold, drawdown, fwd = _trades(held, np.log(price), horizons=(2,))
+    assert rows.tolist() == [0]
+    # 1월 100에 사서 4월 110에 판다, 고점 120 -> 90이 최대 낙폭
+    np.testing.assert_allclose(returns, [0.1])
+    assert hold.tolist() == [3]
+    np.testing.assert_allclose(drawdown, [-0.25])
+    # 산 달부터 2개월 뒤(3월 90)
+    np.testing.assert_allclose(fwd[2], [-0.1])
+
+
+def test_open_trade_and_no_trade():
+    per = np.array([[10.0, 30, 30], [40.0, 40, 40]])
+    price = np.array([[100.0, 150, 200], [100.0, 100, 100]])
+
+    held = positions(per, 20, 50, lag=1)
+    rows, returns, hold, drawdown, fwd = _trades(held, np.log(price), horizons=(12,))
+    # 끝까지 보유 중이면 마지막 달 가격으로 평가, 12개월 뒤 가격이 없으면 빠진다
+    assert rows.tolist() == [0]
+    np.testing.assert_allclose(returns, [200 / 150 - 1])
+    np.testing.assert_allclose(drawdown, [0.0])
+    assert len(fwd[12]) == 0
+    assert _trades(np.zeros((1, 3), dtype=bool), np.log(price[:1]), (12,)) is None
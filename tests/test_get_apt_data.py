@@ -0,0 +1,19 @@
+"""get_apt_data: apt_id가 없는 예전 행은 아파트 목록에서 빠진다"""
+import logging
+
+from get_apt_data import get_apt_list
+from price_trend_store import save_series
+
+
+def test_apt_list_skips_rows_without_apt_id(db, caplog):
+    info = {'name': '목록아파트', 'seq': '555', 'desc': '서울 송파구 / 19년12월 / 1000세대 / 아파트'}
+    save_series(db, info, '34', '1', [{'date': '202401', 'avg': 100000, 'cnt': 1}], new_row={'year': 2019})
+    save_series(db, info, '34', '3', [{'date': '202401', 'avg': 250, 'cnt': 1}], new_row={'year': 2019})
+    db.table('APTInfo').insert({'name': '예전아파트', 'PY': '25', 'DEAL_TYPE': '1', 'status': 1}).execute()
+    apt_id = db.table('APTInfo').select('apt_id').eq('name', '목록아파트').execute().data[0]['apt_id']
+
+    with caplog.at_level(logging.WARNING, logger='get_apt_data'):
+        apts = get_apt_list()
+
+    assert [(a['id'], a['name']) for a in apts] == [(apt_id, '목록아파트 (34평)')]
+    assert '예전아파트 (25평)' in caplog.text and 'migrate_price_monthly.py' in caplog.text
@@ -0,0 +1,40 @@
+"""last_per: 변경 로그로 바뀐 아파트만 APTLastPER 다시 계산 (refresh_dirty_per)"""
+from last_per import refresh_dirty_per
+from price_trend_store import save_series, write_price_trend
+
+
+def months(avg, *dates):
+    return [{'date': d, 'avg': avg, 'min': avg, 'max': avg, 'cnt': 1} for d in dates]
+
+
+def last_per(db):
+    rows = db.table('APTLastPER').select('apt_name, last_avg_price, "last_PER"').execute().data
+    return {r['apt_name']: (r['last_avg_price'], r['last_PER']) for r in rows}
+
+
+def test_only_changed_apartments_recomputed(db):
+    for k in range(3):
+        info = {'name': f'변경아파트{k}', 'seq': str(800 + k), 'desc': '서울 송파구 / 19년12월 / 1000세대 / 아파트'}
+        save_series(db, info, '34', '1', months(120000, '202401', '202402'))
+        save_series(db, info, '34', '2', months(60000, '202401'))
+        save_series(db, info, '34', '3', months(250, '202401', '202402'))
+
+    # 커서가 없는 첫 실행은 전체
+    assert refresh_dirty_per() == (3, 0)
+    before = last_per(db)
+    assert before['변경아파트0'] == (12.0, 40.0)
+    # 바뀐 게 없으면 아무것도 계산하지 않는다
+    assert refresh_dirty_per() == (0, 3)
+
+    ids = {(r['name'], r['DEAL_TYPE']): r['id'] for r in db.table('APTInfo').select('id, name, DEAL_TYPE').execute().data}
+    write_price_trend(db, ids[('변경아파트0', '1')], months(150000, '202403'))
+    # 전세(2) 변경은 APTLastPER에 쓰이지 않는다
+    write_price_trend(db, ids[('변경아파트1', '2')], months(70000, '202403'))
+
+    assert refresh_dirty_per() == (1, 2)
+    after = last_per(db)
+    assert after['변경아파트0'] == (13.0, 50.0)
+    assert {k: v for k, v in after.items() if k != '변경아파트0'} == {k: v for k, v in before.items() if k != '변경아파트0'}
+
+    # full이면 커서가 있어도 전체
+    assert refresh_dirty_per(full=True) == (3, 0)
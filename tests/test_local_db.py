@@ -0,0 +1,35 @@
+"""local_db: not_ 필터가 연산자마다 반대 조건이 되는지"""
+import pytest
+
+from local_db import FilterMixin
+
+
+def months(db):
+    db.table('price_monthly').upsert([
+        {'apt_id': 1, 'deal_type': 1, 'yyyymm': m, 'avg': 100, 'min': 100, 'max': 100, 'cnt': 1}
+        for m in (202401, 202402, 202403)
+    ], on_conflict='apt_id, deal_type, yyyymm').execute()
+
+    def where(build):
+        rows = build(db.table('price_monthly').select('yyyymm')).order('yyyymm').execute().data
+        return [r['yyyymm'] for r in rows]
+    return where
+
+
+def test_not_negates_every_filter(db):
+    where = months(db)
+
+    assert where(lambda q: q.not_.eq('yyyymm', 202402)) == [202401, 202403]
+    assert where(lambda q: q.not_.gt('yyyymm', 202402)) == [202401, 202402]
+    assert where(lambda q: q.not_.gte('yyyymm', 202402)) == [202401]
+    assert where(lambda q: q.not_.lte('yyyymm', 202402)) == [202403]
+    assert where(lambda q: q.not_.in_('yyyymm', [202401, 202403])) == [202402]
+    # not_은 바로 다음 필터 하나에만 붙는다
+    assert where(lambda q: q.not_.eq('yyyymm', 202401).lte('yyyymm', 202402)) == [202402]
+
+
+def test_not_unsupported_operator():
+    query = FilterMixin()
+    query._conditions = []
+    with pytest.raises(ValueError, match='LIKE'):
+        query.not_._add('name', 'LIKE', '%아파트%')
@@ -0,0 +1,58 @@
+"""per_stats: 달력 기준 이동 평균, 증분 계산"""
+import numpy as np
+import pandas as pd
+
+from per_stats import calendar_mean, compute_stats, refresh_per_stats
+from price_trend_store import save_series, write_price_trend
+
+
+def test_calendar_mean_uses_calendar_months():
+    # 아파트 1은 거래가 드물어서 6개 행이 4년에 걸쳐 있다, 아파트 2의 값은 창에 들어오지 않는다
+    apt_ids = [1, 1, 1, 1, 2, 2]
+    yyyymm = [202001, 202012, 202106, 202107, 202106, 202107]
+    values = [10.0, 20.0, np.nan, 40.0, 100.0, 200.0]
+
+    got = calendar_mean(values, apt_ids, yyyymm, 12)
+
+    # 202106의 12개월 창은 202007~202106 -> 202012 하나, 202107은 202008~202107 -> 202012, 202107
+    np.testing.assert_array_equal(got, [10.0, 15.0, 20.0, 30.0, 100.0, 150.0])
+    np.testing.assert_array_equal(calendar_mean(values, apt_ids, yyyymm, 1), [10.0, 20.0, np.nan, 40.0, 100.0, 200.0])
+
+
+def test_stats_windows_do_not_stretch_over_years():
+    panel = pd.DataFrame({
+        'apt_id': [1, 1, 1],
+        'yyyymm': [201501, 202001, 202401],
+        'PER': [10.0, 20.0, 30.0],
+    })
+    stats = compute_stats(panel)
+
+    # 행 기준이면 36개 행 안에 10년이 다 들어가서 20이 된다
+    assert stats['per_36m'].tolist() == [10.0, 20.0, 30.0]
+    assert stats['per_6m'].tolist() == [10.0, 20.0, 30.0]
+
+
+def test_incremental_matches_full(db):
+    def series(base, n, start=2021):
+        return [{'date': f'{start + i // 12}{i % 12 + 1:02d}', 'avg': base + i * 7 % 13, 'cnt': 1} for i in range(0, n, 2)]
+
+    for k in range(3):
+        info = {'name': f'통계아파트{k}', 'seq': str(900 + k), 'desc': '서울 송파구 / 19년12월 / 1000세대 / 아파트'}
+        save_series(db, info, '34', '1', series(100000 + k * 5000, 40))
+        save_series(db, info, '34', '3', series(250 + k * 10, 40))
+    refresh_per_stats(full=True)
+
+    # 한 아파트의 매매 최근 구간을 다시 쓰고, 다른 아파트에는 새 달 추가
+    rows = db.table('APTInfo').select('id, name, DEAL_TYPE').execute().data
+    ids = {(r['name'], r['DEAL_TYPE']): r['id'] for r in rows}
+    write_price_trend(db, ids[('통계아파트0', '1')], [{'date': '202206', 'avg': 150000, 'cnt': 2}], replace_from='202205')
+    write_price_trend(db, ids[('통계아파트2', '3')], [{'date': '202407', 'avg': 400, 'cnt': 1}])
+    assert refresh_per_stats() > 0
+
+    def table():
+        rows = db.table('per_stats').select('*').order('apt_id').order('yyyymm').execute().data
+        return pd.DataFrame(rows)
+
+    incremental = table()
+    refresh_per_stats(full=True)
+    pd.testing.assert_frame_equal(incremental, table())
@@ -0,0 +1,56 @@
+"""price_changes: 커밋이 늦은(작은 id가 나중에 보이는) 변경을 소비자가 건너뛰지 않는지"""
+import price_changes
+from price_changes import CHANGE_TABLE, pending_changes, save_cursor
+
+
+def add_change(client, change_id, apt_id, deal_type=1, from_month=202401):
+    client.table(CHANGE_TABLE).insert({'id': change_id, 'apt_id': apt_id, 'deal_type': deal_type,
+                                       'from_month': from_month, 'to_month': from_month, 'kind': 'merge'}).execute()
+
+
+def test_first_run_is_full(db):
+    add_change(db, 1, 10)
+    add_change(db, 3, 30)
+    changes, cursor = pending_changes(db, 'test')
+    assert changes is None
+    # 전체 계산 중에 커밋 전이던 id 2도 다음 번에 읽는다
+    assert cursor == {'last_id': 3, 'gaps': [2]}
+
+
+def test_late_commit_is_read_next_time(db):
+    add_change(db, 1, 10)
+    save_cursor(db, 'test', {'last_id': 1, 'gaps': []})
+    # id 2는 발급됐지만 아직 커밋 전, 3, 4는 커밋됨
+    add_change(db, 3, 30)
+    add_change(db, 4, 40)
+    changes, cursor = pending_changes(db, 'test')
+    assert [c['id'] for c in changes] == [3, 4]
+    assert cursor == {'last_id': 4, 'gaps': [2]}
+    save_cursor(db, 'test', cursor)
+
+    # 다음 실행: 새 변경이 없어도 늦게 커밋된 id 2를 돌려준다
+    add_change(db, 2, 20)
+    changes, cursor = pending_changes(db, 'test')
+    assert [(c['id'], c['apt_id']) for c in changes] == [(2, 20)]
+    assert cursor == {'last_id': 4, 'gaps': []}
+    save_cursor(db, 'test', cursor)
+
+    changes, cursor = pending_changes(db, 'test')
+    assert changes == []
+
+
+def test_gap_is_forgotten_after_window(db, monkeypatch):
+    monkeypatch.setattr(price_changes, 'GAP_WINDOW', 3)
+    add_change(db, 1, 10)
+    save_cursor(db, 'test', {'last_id': 1, 'gaps': []})
+    add_change(db, 3, 30)
+    changes, cursor = pending_changes(db, 'test')
+    assert cursor['gaps'] == [2]
+    save_cursor(db, 'test', cursor)
+
+    # 롤백된 id 2는 head가 GAP_WINDOW 넘게 지나가면 더 기다리지 않는다
+    for change_id in range(4, 7):
+        add_change(db, change_id, change_id * 10)
+    changes, cursor = pending_changes(db, 'test')
+    assert [c['id'] for c in changes] == [4, 5, 6]
+    assert cursor == {'last_id': 6, 'gaps': []}
@@ -0,0 +1,53 @@
+"""price_dense: 빈 달 채우기 (아파트 경계, 첫 거래 전 NULL), load_dense 프레임"""
+import numpy as np
+import pandas as pd
+
+from price_dense import compute_dense, load_dense
+from price_trend_store import save_series
+
+APT = {'name': '채우기아파트', 'seq': '444', 'desc': '서울 송파구 / 19년12월 / 1000세대 / 아파트'}
+
+
+def test_forward_fill_within_apartment():
+    long = pd.DataFrame([
+        # 아파트 1: 매매 2023-11, 2024-02 / 월세 2024-01 (연도를 넘는 달력)
+        (1, 1, 202311, 100.0, 2), (1, 1, 202402, 130.0, 1), (1, 3, 202401, 5.0, 3),
+        # 아파트 2: 매매 2024-03 하나 (아파트 1의 2월 값이 넘어오지 않는다)
+        (2, 1, 202403, 200.0, 1),
+    ], columns=['apt_id', 'deal_type', 'yyyymm', 'avg', 'cnt'])
+
+    dense = compute_dense(long)
+
+    sale = dense[(dense['apt_id'] == 1) & (dense['deal_type'] == 1)]
+    assert sale['yyyymm'].tolist() == [202311, 202312, 202401, 202402]
+    assert sale['avg'].tolist() == [100.0, 100.0, 100.0, 130.0]
+    assert sale['cnt'].tolist() == [2, 0, 0, 1]
+    assert sale['observed'].tolist() == [True, False, False, True]
+    rent = dense[(dense['apt_id'] == 1) & (dense['deal_type'] == 3)]
+    # 첫 월세 거래 전은 NULL
+    np.testing.assert_array_equal(rent['avg'].to_numpy(), [np.nan, np.nan, 5.0, 5.0])
+    jeonse = dense[(dense['apt_id'] == 1) & (dense['deal_type'] == 2)]
+    assert jeonse['avg'].isna().all() and not jeonse['observed'].any()
+
+    two = dense[dense['apt_id'] == 2]
+    assert two['yyyymm'].unique().tolist() == [202403]
+    assert two[two['deal_type'] == 1]['avg'].tolist() == [200.0]
+    assert two[two['deal_type'] == 3]['avg'].isna().all()
+
+
+def test_load_dense_frame(db):
+    save_series(db, APT, '34', '1', [{'date': '202401', 'avg': 100000, 'cnt': 1}, {'date': '202404', 'avg': 110000, 'cnt': 2}])
+    save_series(db, APT, '34', '3', [{'date': '202402', 'avg': 250, 'cnt': 1}])
+    apt_id = db.table('APTInfo').select('apt_id').execute().data[0]['apt_id']
+
+    df = load_dense(db, apt_id)
+
+    assert [str(m) for m in df.index] == ['2024-01', '2024-02', '2024-03', '2024-04']
+    assert df['매매가'].tolist() == [100000, 100000, 100000, 110000]
+    # 첫 거래 전은 0, PER은 월세가 없는 달 NaN
+    assert df['월세'].tolist() == [0, 250, 250, 250]
+    assert df['매매 관측'].tolist() == [True, False, False, True]
+    assert df['매매 거래량'].tolist() == [1, 0, 0, 2]
+    assert np.isnan(df['PER'].iloc[0])
+    assert df['PER'].iloc[3] == 110000 / (250 * 12)
+    assert load_dense(db, apt_id, start='202403')['매매가'].tolist() == [100000, 110000]
@@ -0,0 +1,46 @@
+"""price_metrics: 전세가율/임대수익률/전환율 계산"""
+import numpy as np
+import pandas as pd
+
+from price_metrics import compute_metrics, get_metrics, refresh_metrics
+from price_trend_store import save_series
+
+APT = {'name': '지표아파트', 'seq': '555', 'desc': '서울 송파구 / 19년12월 / 1000세대 / 아파트'}
+
+
+def test_ratios_and_months_before_first_deal():
+    long = pd.DataFrame([
+        # 매매는 1월부터, 전세는 2월, 월세는 3월에 처음 거래
+        (1, 1, 202401, 100000), (1, 2, 202402, 60000), (1, 3, 202403, 250),
+        (1, 1, 202404, 125000),
+        # 다른 아파트의 값이 앞 값 채우기로 넘어오지 않는다
+        (2, 3, 202401, 100),
+    ], columns=['apt_id', 'deal_type', 'yyyymm', 'avg'])
+
+    m = compute_metrics(long)
+
+    one = m[m['apt_id'] == 1].set_index('yyyymm')
+    assert one.index.tolist() == [202401, 202402, 202403, 202404]
+    # 1월은 전세/월세가 아직 없음
+    assert one.loc[202401, ['jeonse_ratio', 'rent_yield', 'conv_rate']].isna().all()
+    assert one.loc[202402, 'jeonse_ratio'] == 0.6
+    assert np.isnan(one.loc[202402, 'rent_yield'])
+    assert one.loc[202403, 'rent_yield'] == 250 * 12 / 100000
+    assert one.loc[202403, 'conv_rate'] == 250 * 12 / 60000
+    # 4월은 매매만 바뀌고 전세/월세는 앞 달 값
+    assert one.loc[202404, 'jeonse_ratio'] == 60000 / 125000
+    assert one.loc[202404, 'rent_yield'] == 250 * 12 / 125000
+
+    two = m[m['apt_id'] == 2]
+    assert two[['jeonse_ratio', 'rent_yield', 'conv_rate']].isna().all().all()
+
+
+def test_refresh_writes_from_month(db):
+    save_series(db, APT, '34', '1', [{'date': '202401', 'avg': 100000, 'cnt': 1}, {'date': '202402', 'avg': 100000, 'cnt': 1}])
+    save_series(db, APT, '34', '2', [{'date': '202401', 'avg': 50000, 'cnt': 1}])
+    apt_id = db.table('APTInfo').select('apt_id').execute().data[0]['apt_id']
+
+    assert [(r['yyyymm'], r['jeonse_ratio']) for r in get_metrics(db, apt_id)] == [(202401, 0.5), (202402, 0.5)]
+    # 2월 이후만 다시 쓰면 1월 행은 그대로 둔다
+    assert refresh_metrics(db, apt_id, 202402) == 1
+    assert len(get_metrics(db, apt_id)) == 2
@@ -0,0 +1,54 @@
+"""price_snapshot: 버전 디렉터리 바꿔 달기, 변경 로그 기준 증분 (지워진 파티션 포함)"""
+import os
+
+from price_snapshot import export_incremental, export_snapshot, load_panel, read_meta
+from price_trend_store import save_series, write_price_trend
+from local_db import execute_sql
+
+APT = {'name': '스냅샷아파트', 'seq': '500', 'desc': '서울 송파구 / 19년12월 / 1000세대 / 아파트'}
+
+
+def months(start, end, avg=100000):
+    out = []
+    for yyyymm in range(start, end + 1):
+        if 1 <= yyyymm % 100 <= 12:
+            out.append({'date': str(yyyymm), 'avg': avg, 'min': avg, 'max': avg, 'cnt': 1})
+    return out
+
+
+def test_snapshot_swaps_whole_versions(db, tmp_path):
+    save_series(db, APT, '34', '1', months(202201, 202312))
+    path = str(tmp_path / 'price_panel')
+    # 예전 방식의 실제 디렉터리도 버전으로 옮겨서 바꿔 단다
+    os.makedirs(path)
+
+    export_snapshot(db, execute_sql, path)
+    first = os.path.realpath(path)
+    assert os.path.islink(path) and len(load_panel(path)) == 24
+
+    export_snapshot(db, execute_sql, path)
+    second = os.path.realpath(path)
+    assert second != first
+    # 바로 이전 버전만 남긴다
+    assert sorted(os.listdir(tmp_path)) == sorted(['price_panel', os.path.basename(first), os.path.basename(second)])
+    export_snapshot(db, execute_sql, path)
+    assert not os.path.exists(first)
+
+
+def test_incremental_rewrites_logged_partitions(db, tmp_path):
+    save_series(db, APT, '34', '1', months(202201, 202312))
+    path = str(tmp_path / 'price_panel')
+    export_incremental(db, execute_sql, path)
+    assert read_meta(path)['change_cursor']['last_id'] > 0
+
+    # 2023년 이후를 다시 쓰면서 2023년 거래가 모두 사라지고 2024년이 생김
+    row_id = db.table('APTInfo').select('id').eq('name', APT['name']).execute().data[0]['id']
+    write_price_trend(db, row_id, months(202401, 202402, avg=120000), replace_from='202301')
+    assert export_incremental(db, execute_sql, path) == 2
+
+    assert sorted(os.listdir(os.path.join(path, 'deal_type=1'))) == ['yyyy=2022', 'yyyy=2024']
+    panel = load_panel(path)
+    assert sorted(panel['yyyymm']) == [int(m['date']) for m in months(202201, 202212)] + [202401, 202402]
+
+    # 바뀐 게 없으면 아무 파티션도 다시 쓰지 않는다
+    assert export_incremental(db, execute_sql, path) == 0
@@ -0,0 +1,66 @@
+"""price_trend_store: 시세(price_trend), price_monthly, price_change를 한 트랜잭션으로 쓰기"""
+import pytest
+
+import price_changes
+from price_trend_store import get_price_trend, save_series, write_price_trend
+
+APT = {'name': '트랜잭션아파트', 'seq': '777', 'desc': '서울 송파구 / 19년12월 / 1000세대 / 아파트'}
+
+
+def months(*dates, avg=100000):
+    return [{'date': d, 'avg': avg, 'min': avg, 'max': avg, 'cnt': 1} for d in dates]
+
+
+def stored(db, apt_id):
+    monthly = db.table('price_monthly').select('yyyymm, avg').eq('apt_id', apt_id).order('yyyymm').execute().data
+    changes = db.table('price_change').select('kind, from_month, to_month').eq('apt_id', apt_id).order('id').execute().data
+    return [(r['yyyymm'], r['avg']) for r in monthly], [(c['kind'], c['from_month'], c['to_month']) for c in changes]
+
+
+def test_save_series_writes_all_tables(db):
+    assert save_series(db, APT, '34', '1', months('202402', '202401')) == 2
+    row = db.table('APTInfo').select('id, apt_id, version').execute().data[0]
+
+    assert [d['date'] for d in get_price_trend(db, row['id'])] == ['202401', '202402']
+    assert stored(db, row['apt_id']) == ([(202401, 100000), (202402, 100000)], [('insert', 202401, 202402)])
+
+    write_price_trend(db, row['id'], months('202402', '202403', avg=120000), replace_from='202402')
+    assert stored(db, row['apt_id']) == (
+        [(202401, 100000), (202402, 120000), (202403, 120000)],
+        [('insert', 202401, 202402), ('replace', 202402, None)],
+    )
+
+
+def test_failed_change_log_rolls_back_series(db, monkeypatch):
+    save_series(db, APT, '34', '1', months('202401'))
+    row = db.table('APTInfo').select('id, apt_id, version').execute().data[0]
+
+    def broken(*args, **kwargs):
+        raise RuntimeError('변경 로그 실패')
+
+    monkeypatch.setattr(price_changes, 'change_row', broken)
+    with pytest.raises(RuntimeError):
+        write_price_trend(db, row['id'], months('202402', avg=130000))
+
+    # 시세만 앞서 나가지 않는다 (다음 실행이 같은 달을 다시 쓰면 변경 로그도 남는다)
+    assert [d['date'] for d in get_price_trend(db, row['id'])] == ['202401']
+    assert db.table('APTInfo').select('version').eq('id', row['id']).execute().data[0]['version'] == row['version']
+    assert stored(db, row['apt_id']) == ([(202401, 100000)], [('insert', 202401, 202401)])
+
+
+def test_embedded_merge_gives_up_on_endless_conflict(db, monkeypatch):
+    import local_db
+
+    save_series(db, APT, '34', '1', months('202401'))
+    row_id = db.table('APTInfo').select('id').execute().data[0]['id']
+    calls = []
+
+    def never_matches(session, sql, params):
+        calls.append(sql)
+        return 0
+
+    # 다른 작업이 매번 먼저 version을 올리는 경우
+    monkeypatch.setattr(local_db, '_execute_count', never_matches)
+    with pytest.raises(RuntimeError, match='version 충돌'):
+        write_price_trend(db, row_id, months('202402'))
+    assert len(calls) == local_db.MERGE_RETRIES
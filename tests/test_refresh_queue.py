@@ -0,0 +1,84 @@
+"""
+refresh_queue: 로컬 워커 프로세스 여러 개로 작업 나눠 처리, lease를 잃은 워커의 결과 버리기
+
+큐는 Postgres 전용(SKIP LOCKED)이라 TEST_POSTGRES_URL이 있을 때만 실행한다 (테스트가 APTInfo, RefreshJob을 비운다).
+워커는 DATABASE_URL을 그 DB로 바꾼 하위 프로세스로 띄운다.
+"""
+import os
+import subprocess
+import sys
+
+from sqlalchemy import create_engine, text
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERIES = 12
+
+
+def run(url, *args, timeout=120):
+    env = dict(os.environ, DATABASE_URL=url)
+    return subprocess.run([sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True,
+                          check=True, timeout=timeout)
+
+
+def seed(url, n, max_attempts=1):
+    """스키마(병합 함수 포함)를 만들고 APTInfo n행만 남긴 뒤 전부 작업으로 등록 (기본은 실패하면 재시도 없이 dead)"""
+    run(url, 'schema.py', 'bootstrap')
+    run(url, 'refresh_queue.py', 'status')
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text('DELETE FROM "RefreshJob"'))
+        conn.execute(text('DELETE FROM "APTInfo"'))
+        for i in range(n):
+            conn.execute(text('''
+                INSERT INTO "APTInfo" (name, "PY", "DEAL_TYPE", seq, description, status)
+                VALUES (:name, '34', '1', :seq, '서울 송파구 / 19년12월 / 1000세대 / 아파트', 1)
+            '''), {'name': f'아파트{i}', 'seq': str(1000 + i)})
+    run(url, 'refresh_queue.py', 'enqueue', '--all', '--max-attempts', str(max_attempts))
+    return engine
+
+
+def test_workers_split_jobs(postgres_url):
+    engine = seed(postgres_url, SERIES)
+    run(postgres_url, 'refresh_queue.py', 'worker', '--fake', '--processes', '4', '--exit-when-empty')
+
+    with engine.connect() as conn:
+        jobs = conn.execute(text('SELECT status, attempts, lease_owner FROM "RefreshJob"')).fetchall()
+        versions = conn.execute(text('SELECT version FROM "APTInfo"')).scalars().all()
+    assert len(jobs) == SERIES
+    assert {(status, attempts, owner) for status, attempts, owner in jobs} == {('done', 1, None)}
+    # 시리즈마다 한 번만 저장
+    assert sorted(versions) == [1] * SERIES
+
+
+# 수집 중에 lease가 만료되어 다른 워커(thief)가 작업을 가져가서 끝낸 경우
+LOST_LEASE_SCRIPT = '''
+import time
+import refresh_queue as q
+import refresh_scheduler
+
+class SlowScraper(refresh_scheduler.FakeScraper):
+    def __call__(self, apt_info, PY, YEAR, DEAL_TYPE):
+        if not self.calls:
+            time.sleep(1.5)
+            q.reap_expired()
+            job = q.claim('thief')
+            q.complete(job['id'], 'thief')
+        return super().__call__(apt_info, PY, YEAR, DEAL_TYPE)
+
+refresh_scheduler.FakeScraper = SlowScraper
+print(q.run_worker('slow', fake=True, exit_when_empty=True, poll_seconds=0.2, lease_seconds=1, heartbeat_seconds=100))
+'''
+
+
+def test_worker_drops_result_after_losing_lease(postgres_url):
+    engine = seed(postgres_url, 1, max_attempts=2)
+    out = run(postgres_url, '-c', LOST_LEASE_SCRIPT).stdout
+
+    assert out.strip() == '0'
+    with engine.connect() as conn:
+        job = conn.execute(text('SELECT status, attempts FROM "RefreshJob"')).one()
+        version = conn.execute(text('SELECT version FROM "APTInfo"')).scalar_one()
+    assert tuple(job) == ('done', 2)
+    # 느린 워커는 lease를 잃었으므로 쓰지 않았다
+    assert version == 0
@@ -0,0 +1,151 @@
+"""refresh_scheduler: 가짜 수집기(FakeScraper)로 요청 예산, 우선순위, --status 확인"""
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from refresh_scheduler import (BACKOFF_TABLE, REQUESTS_PER_YEAR, RETRY_BASE, FakeScraper, RefreshScheduler,
+                               request_cost)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def add_series(client, name, monthly_cnt=0, updated_at=None, DEAL_TYPE='1'):
+    """최근 6개월 동안 달마다 monthly_cnt건 거래된 시리즈 한 행 (거래량은 price_monthly에서 읽는다)"""
+    today = datetime.today()
+    row_id = client.table('APTInfo').insert({
+        'name': name, 'PY': '34', 'DEAL_TYPE': DEAL_TYPE, 'seq': str(abs(hash(name)) % 100000),
+        'description': '서울 송파구 / 19년12월 / 1000세대 / 아파트', 'status': 1,
+        'updated_at': updated_at.isoformat() if updated_at else None,
+    }).execute().data[0]['id']
+    client.table('APTInfo').update({'apt_id': row_id}).eq('id', row_id).execute()
+    client.table('price_monthly').upsert([
+        {'apt_id': row_id, 'deal_type': int(DEAL_TYPE), 'yyyymm': int((today - timedelta(days=31 * m)).strftime('%Y%m')),
+         'avg': 100000, 'min': 90000, 'max': 110000, 'cnt': monthly_cnt}
+        for m in range(6, 0, -1)
+    ], on_conflict='apt_id, deal_type, yyyymm').execute()
+    return row_id
+
+
+def test_budget_caps_requests_per_hour(db):
+    for i in range(20):
+        add_series(db, f'아파트{i}')
+    clock = FakeClock(time.time())
+    cost = request_cost(clock.now)
+    budget = 5 * cost
+    fetch = FakeScraper()
+    scheduler = RefreshScheduler(fetch=fetch, budget_per_hour=budget, clock=clock)
+    scheduler.load()
+
+    # 처음에는 한 시간 치 예산만큼만
+    assert len(scheduler.tick()) == 5
+    assert len(fetch.calls) * REQUESTS_PER_YEAR == budget
+    assert scheduler.tick() == []
+
+    # 그 뒤 한 시간 동안 6분마다 깨어나도 예산이 다시 차는 만큼만 보낸다
+    fetch.calls.clear()
+    refreshed = []
+    for _ in range(10):
+        clock.now += 360
+        refreshed += scheduler.tick()
+    assert len(refreshed) == 5
+    assert len(fetch.calls) * REQUESTS_PER_YEAR <= budget
+    assert len(set(refreshed)) == len(refreshed)
+
+
+def test_high_volume_stale_series_first(db):
+    month_ago = datetime.now() - timedelta(days=30)
+    quiet = add_series(db, '조용한아파트', monthly_cnt=0, updated_at=month_ago)
+    busy = add_series(db, '거래많은아파트', monthly_cnt=40, updated_at=month_ago)
+    medium = add_series(db, '보통아파트', monthly_cnt=5, updated_at=month_ago)
+    # 거래가 많아도 방금 갱신한 시리즈는 아직 차례가 아니다
+    fresh = add_series(db, '방금갱신아파트', monthly_cnt=40, updated_at=datetime.now())
+
+    clock = FakeClock(time.time())
+    fetch = FakeScraper()
+    scheduler = RefreshScheduler(fetch=fetch, budget_per_hour=request_cost(clock.now), clock=clock)
+    scheduler.load()
+
+    assert [s['id'] for s in scheduler.queue()] == [busy, medium, quiet, fresh]
+    assert scheduler.tick() == [busy]
+    assert {seq for seq, *_ in fetch.calls} == {scheduler.series[busy]['seq']}
+    # 병합할 때마다 version이 오른다
+    rows = db.table('APTInfo').select('id, version').execute().data
+    assert {r['id']: r['version'] for r in rows} == {quiet: 0, busy: 1, medium: 0, fresh: 0}
+
+
+def test_status_shows_saved_state(db, tmp_path):
+    add_series(db, '상태확인아파트', monthly_cnt=10)
+    clock = FakeClock(time.time())
+    scheduler = RefreshScheduler(fetch=FakeScraper(), budget_per_hour=100, clock=clock)
+    scheduler.load()
+    scheduler.tick()
+    state_file = tmp_path / 'state.json'
+    scheduler.write_state(state_file)
+
+    out = subprocess.run([sys.executable, 'refresh_scheduler.py', '--status', '--state-file', str(state_file)],
+                         cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    lines = out.splitlines()
+    assert lines[0].startswith('기준: ')
+    assert f"예산: {round(scheduler.tokens, 1)}/100" in lines[0]
+    assert len(lines) == 2
+    assert '상태확인아파트 34평 1' in lines[1]
+    assert '거래량 60' in lines[1]
+
+
+def test_volume_from_price_monthly(db):
+    busy = add_series(db, '거래량아파트', monthly_cnt=7)
+    # 같은 아파트/평형의 다른 거래유형, 6개월보다 오래된 거래는 세지 않는다
+    db.table('price_monthly').upsert([
+        {'apt_id': busy, 'deal_type': 3, 'yyyymm': 209901, 'avg': 250, 'min': 250, 'max': 250, 'cnt': 100},
+        {'apt_id': busy, 'deal_type': 1, 'yyyymm': 201001, 'avg': 1, 'min': 1, 'max': 1, 'cnt': 100},
+    ], on_conflict='apt_id, deal_type, yyyymm').execute()
+    scheduler = RefreshScheduler(fetch=FakeScraper(), clock=FakeClock(time.time()))
+    scheduler.load()
+
+    assert scheduler.series[busy]['volume'] == 42
+
+
+def test_failures_back_off_across_restarts(db):
+    failing = add_series(db, '실패아파트', monthly_cnt=10)
+    clock = FakeClock(time.time())
+
+    def broken(*args):
+        raise RuntimeError('아실 응답 없음')
+
+    scheduler = RefreshScheduler(fetch=broken, budget_per_hour=100, clock=clock)
+    scheduler.load()
+    assert scheduler.tick() == [failing]
+    saved = db.table(BACKOFF_TABLE).select('*').execute().data
+    assert [(r['aptinfo_id'], r['attempts'], r['next_at'], r['last_error']) for r in saved] == [
+        (failing, 1, clock.now + RETRY_BASE, '아실 응답 없음')]
+
+    # 다시 시작해도 다음 시도 시각 전에는 건너뛴다
+    restarted = RefreshScheduler(fetch=broken, budget_per_hour=100, clock=clock)
+    restarted.load()
+    assert restarted.snapshot()['queue'][0]['last_error'] == '아실 응답 없음'
+    assert restarted.tick() == []
+    assert restarted.next_wakeup() == clock.now + RETRY_BASE
+
+    # 다시 실패하면 두 배로 미룬다
+    clock.now += RETRY_BASE
+    assert restarted.tick() == [failing]
+    saved = db.table(BACKOFF_TABLE).select('attempts, next_at').execute().data[0]
+    assert (saved['attempts'], saved['next_at']) == (2, clock.now + 2 * RETRY_BASE)
+
+    # 성공하면 기록을 지운다
+    clock.now += 2 * RETRY_BASE
+    recovered = RefreshScheduler(fetch=FakeScraper(), budget_per_hour=100, clock=clock)
+    recovered.load()
+    assert recovered.tick() == [failing]
+    assert db.table(BACKOFF_TABLE).select('*').execute().data == []
+    assert recovered.snapshot()['queue'][0]['last_error'] is None
@@ -0,0 +1,43 @@
+"""region_index: 거래량 가중 평균 집계, 다시 집계한 범위의 옛 행 삭제 (SQLite)"""
+from local_db import execute_sql
+from region_index import aggregate
+
+
+def add_month(db, apt_id, deal_type, yyyymm, avg, cnt):
+    db.table('price_monthly').insert({'apt_id': apt_id, 'deal_type': deal_type, 'yyyymm': yyyymm,
+                                      'avg': avg, 'min': avg, 'max': avg, 'cnt': cnt}).execute()
+
+
+def index_rows(db):
+    rows = db.table('region_index').select('level, region, yyyymm, price, price_cnt, rent, per, apts').execute().data
+    return {(r['level'], r['region'], r['yyyymm']): r for r in rows}
+
+
+def test_weighted_means_and_stale_rows(db):
+    for apt_id, gu in ((1, '서울 송파구'), (2, '서울 송파구'), (3, '서울 강남구')):
+        db.table('region_member').insert({'apt_id': apt_id, 'level': 'gu', 'region': gu}).execute()
+        db.table('region_member').insert({'apt_id': apt_id, 'level': 'si', 'region': '서울'}).execute()
+    add_month(db, 1, 1, 202401, 100000, 1)
+    add_month(db, 2, 1, 202401, 130000, 2)
+    add_month(db, 1, 3, 202401, 250, 1)
+    add_month(db, 3, 1, 202401, 200000, 1)
+    # 거래량 0인 달은 집계하지 않는다
+    add_month(db, 2, 3, 202401, 999, 0)
+    add_month(db, 1, 1, 202402, 110000, 1)
+
+    assert aggregate(execute_sql) == 5
+    rows = index_rows(db)
+    songpa = rows[('gu', '서울 송파구', 202401)]
+    # (100000 * 1 + 130000 * 2) / 3
+    assert (songpa['price'], songpa['price_cnt'], songpa['rent'], songpa['apts']) == (120000, 3, 250, 2)
+    assert songpa['per'] == 120000 / (250 * 12)
+    assert rows[('si', '서울', 202401)]['price'] == (100000 + 260000 + 200000) / 4
+    assert rows[('gu', '서울 강남구', 202401)]['per'] is None
+
+    # 2월 거래가 사라지면 다시 집계한 지역의 2월 행만 지운다 (다시 집계하지 않은 si는 그대로)
+    db.table('price_monthly').delete().eq('apt_id', 1).eq('yyyymm', 202402).execute()
+    assert aggregate(execute_sql, [('gu', '서울 송파구')], 202402) == 0
+    rows = index_rows(db)
+    assert ('gu', '서울 송파구', 202402) not in rows
+    assert ('gu', '서울 송파구', 202401) in rows
+    assert ('si', '서울', 202402) in rows
@@ -0,0 +1,30 @@
+"""screening: PER 순 정렬, 동률은 apt_id 순, 페이지가 겹치지 않음, 비활성 아파트 제외"""
+from screening import screen_apartments
+
+
+def add_apt(db, apt_id, per, address='서울 송파구', status=1, year=201912, py='34'):
+    db.table('APTInfo').insert({'id': apt_id, 'apt_id': apt_id, 'name': f'아파트{apt_id}', 'PY': py, 'DEAL_TYPE': '1',
+                                'seq': str(apt_id), 'status': status, 'address': address, 'year': year}).execute()
+    db.table('APTLastPER').insert({'apt_id': apt_id, 'apt_name': f'아파트{apt_id}', 'apt_PY': py, 'area_py': float(py),
+                                   'address': address, 'year': year, 'last_PER': per}).execute()
+
+
+def test_order_and_pages_with_ties(db):
+    # 3, 1, 4는 PER 20 동률, 6은 비활성, 7은 월세가 없어 PER 없음, 8은 다른 지역
+    for apt_id, per in ((3, 20.0), (2, 15.0), (1, 20.0), (4, 20.0), (5, 30.0), (7, None)):
+        add_apt(db, apt_id, per)
+    add_apt(db, 6, 10.0, status=0)
+    add_apt(db, 8, 5.0, address='서울 강남구')
+
+    pages = [screen_apartments(db, regions=['서울 송파구'], PERs=(0, None), limit=2, offset=offset)
+             for offset in (0, 2, 4)]
+
+    assert [[r['apt_id'] for r in rows] for rows, _ in pages] == [[2, 1], [3, 4], [5]]
+    assert {total for _, total in pages} == {5}
+
+    rows, total = screen_apartments(db, PERs=(None, 20), order='last_PER', desc=True, limit=10)
+    assert [r['apt_id'] for r in rows] == [1, 3, 4, 2, 8]
+    assert total == 5
+
+    rows, total = screen_apartments(db, regions=['서울 송파구'], years=(201901, 201912), PYs=(30, 40), limit=10)
+    assert total == 6
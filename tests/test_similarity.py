@@ -0,0 +1,65 @@
+"""similarity: 상관계수 상위 단지 (겹친 달 수 기준, 자기 자신 제외), 비활성 아파트 반영"""
+import numpy as np
+
+from price_changes import record_change
+from price_trend_store import save_series
+from similarity import refresh_similarity, top_similar
+
+
+def test_top_similar_overlap_cutoff_and_self():
+    months = np.arange(30, dtype=float)
+    short = np.full(30, np.nan)
+    short[:10] = months[:10] * 3
+    values = np.array([
+        months,
+        months * 2 + 1,           # 0과 상관계수 1
+        -months,                  # 0과 상관계수 -1
+        short,                    # 0과 같은 방향이지만 겹친 달이 10개뿐
+    ])
+
+    rows, others, corr, overlap = top_similar(values, k=3, min_overlap=24, block=2)
+
+    pairs = {(int(r), int(o)): (c, n) for r, o, c, n in zip(rows, others, corr, overlap)}
+    # 자기 자신과 겹친 달이 부족한 3번은 후보가 아니다
+    assert [int(o) for r, o in zip(rows, others) if r == 0] == [1, 2]
+    assert all(r != o for r, o in pairs)
+    assert 3 not in rows and 3 not in others
+    np.testing.assert_allclose(pairs[(0, 1)][0], 1.0, atol=1e-5)
+    np.testing.assert_allclose(pairs[(0, 2)][0], -1.0, atol=1e-5)
+    assert pairs[(0, 1)][1] == 30
+
+    # 겹친 달 기준을 낮추면 3번도 후보가 된다 (0번, 1번과 상관계수 1로 동률)
+    rows, others, corr, overlap = top_similar(values, k=1, min_overlap=10)
+    best = dict(zip(rows.tolist(), zip(others.tolist(), overlap.tolist())))
+    assert best[3][0] in (0, 1) and best[3][1] == 10
+
+
+def test_refresh_drops_deactivated_apartments(db):
+    rnd = np.random.default_rng(3)
+    common = np.cumsum(rnd.normal(0, 0.02, 36))
+    for k in range(3):
+        info = {'name': f'비슷한아파트{k}', 'seq': str(600 + k), 'desc': '서울 송파구 / 19년12월 / 1000세대 / 아파트'}
+        prices = 100000 * np.exp(common + rnd.normal(0, 0.005, 36))
+        dates = [f'{2021 + i // 12}{i % 12 + 1:02d}' for i in range(36)]
+        save_series(db, info, '34', '1', [{'date': d, 'avg': float(p), 'cnt': 1} for d, p in zip(dates, prices)])
+        save_series(db, info, '34', '3', [{'date': d, 'avg': 250.0 + k, 'cnt': 1} for d in dates])
+    ids = sorted({r['apt_id'] for r in db.table('APTInfo').select('apt_id').execute().data})
+
+    def similar_ids():
+        rows = db.table('apt_similar').select('apt_id, similar_id').eq('kind', 'price').execute().data
+        return {r['apt_id'] for r in rows} | {r['similar_id'] for r in rows}
+
+    assert refresh_similarity() > 0
+    assert similar_ids() == set(ids)
+    assert refresh_similarity() == 0
+
+    # 비활성(deactivate 변경 로그)만 있어도 다시 계산한다
+    db.table('APTInfo').update({'status': 0}).eq('apt_id', ids[0]).execute()
+    record_change(db, ids[0], 1, 'deactivate')
+    assert refresh_similarity() > 0
+    assert similar_ids() == set(ids[1:])
+
+    # 변경 로그 없이 status만 바뀌어도 남은 행이 비활성 아파트를 가리키면 다시 계산한다
+    db.table('APTInfo').update({'status': 0}).eq('apt_id', ids[1]).execute()
+    refresh_similarity()
+    assert similar_ids() == set()
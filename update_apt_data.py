@@ -1,16 +1,30 @@
-import json
+import argparse
+import logging
 from datetime import datetime, timedelta
 
 from dotenv import load_dotenv
 import os
 
+from apt_units import ensure_unit_tables
 from apt_value import get_APT_transactions, get_APT_info
+from pipeline_metrics import setup_logging, stage, rows_written, serve_prometheus, export
+from price_trend_store import write_price_trend
+from price_changes import ensure_change_table
+from price_dense import ensure_dense_table
+from price_metrics import ensure_metrics_table
+from price_snapshot import export_incremental
 
 # Load environment variables from the .env file
 load_dotenv()
 
 # 로컬 DB 사용
-from local_db import supabase
+from local_db import BACKEND, supabase, execute_sql
+from last_per import ensure_last_per_table, refresh_dirty_per, snapshot_per
+from per_stats import refresh_per_stats
+from region_index import ensure_region_tables, refresh_region_index
+from similarity import refresh_similarity
+
+logger = logging.getLogger(__name__)
 
 
 # # Connect to the database
@@ -23,90 +37,139 @@ from local_db import supabase
 #   # ssl_mode="VERIFY_IDENTITY",
 # )
 
-try:
-    # Create a cursor to interact with the database
-    # cur = connection.cursor(DictCursor)
-    # sql = "SELECT DISTINCT name, PY, seq, description FROM APTInfo WHERE status = 1"
-    # cur.execute(sql)
-    # sql_result = cur.fetchall()
-    response = supabase.table('APTInfo').select('name, PY, seq, description', count='exact').eq('status', 1).execute()
-    print(response)
-
-    for r in response.data:
-        ####
-        apt_name = r['name']
-        PY = r['PY']
-        print(f"{apt_name} - {PY}")
-
-        apt_info = {
-            'desc': r['description'],
-            'seq': r['seq'],
-            'name': r['name'],
-        }
-
-        # 1은 매매, 2는 전세, 3은 월세
-        deal_types = range(1, 4)
-        for d in deal_types:
-            DEAL_TYPE = str(d)
-
-            # sql = "SELECT * FROM APTInfo WHERE name = %s AND PY = %s AND DEAL_TYPE = %s"
-            # cur.execute(sql, (apt_name, PY, DEAL_TYPE,))
-            # res = cur.fetchone()
-            response = supabase.table('APTInfo').select('*', count='exact').eq('name', apt_name).eq('PY', PY).eq('DEAL_TYPE', DEAL_TYPE).execute()
-            res = response.data[0]
-            if not res:
-                print(f'{apt_name} - {PY} - {DEAL_TYPE}: 데이터 없음')
-
-            # price_trend가 이미 리스트인 경우 처리
-            pt = res['price_trend']
-            if pt is None:
-                price_trend = []
-            elif isinstance(pt, str):
-                price_trend = json.loads(pt)
-            elif isinstance(pt, list):
-                price_trend = pt
-            else:
-                price_trend = []
-            print("현재 price_trend:")
-            print(price_trend)
-
-            # 오늘 날짜
-            today = datetime.today()
-            # 6개월 전 날짜부터 업데이트
-            prev_date = today - timedelta(days=180)
-            str_date = prev_date.strftime("%Y%m")
-            print(f'기준일: {str_date}')
-            price_trend = [d for d in price_trend if d['date'] < str_date]
-            print(price_trend)
-
-            years = range(prev_date.year, today.year + 1)
-            for y in years:
-                YEAR = str(y)
-                print(f'{YEAR}로 가져 온 아실 데이터')
-                amount = get_APT_transactions(apt_info, PY, YEAR, DEAL_TYPE)
-                amount = sorted(amount, key=lambda x: x['date'])
-                print(amount)
-
-                print(f'{YEAR}로 가져 온 아실 데이터 중 이어 붙일 데이터')
-                filtered_amount = [d for d in amount if d['date'] >= str_date]
-                print(filtered_amount)
-                price_trend.extend(filtered_amount)
-
-            price_trend = sorted(price_trend, key=lambda x: x['date'])
-            print("최종적으로 DB에 업데이트 할 price_trend 데이터")
-            print(price_trend)
-
-            # cur.execute(
-            #     f"UPDATE APTInfo SET price_trend  = '{json.dumps(price_trend)}' WHERE id = '{res['id']}'")
-            # connection.commit()
-
-            # TODO: 주석 해제 필요
-            response = supabase.table('APTInfo').update({'price_trend': json.dumps(price_trend)}).eq('id', res['id']).execute()
-            print("업데이트 완료!!")
-
-
-except Exception as e:
-    print("Error:", e)
-
-finally:
-    print('Finished')
+
+def ensure_series_columns():
+    """APTInfo에 갱신 시각(updated_at)과 낙관적 동시성 제어용 version 컬럼, 시리즈 쓰기가 같이 채우는 테이블이 없으면 추가"""
+    # SQLite/DuckDB 파일은 schema.py bootstrap이 이 컬럼과 테이블까지 만든다 (ADD COLUMN IF NOT EXISTS 없음)
+    if BACKEND != 'postgresql':
+        return
+    execute_sql('ALTER TABLE "APTInfo" ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ')
+    execute_sql('ALTER TABLE "APTInfo" ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0')
+    # 새 아파트/평형을 쓸 때 등록하는 apartment, unit (price_trend_store.save_series)
+    ensure_unit_tables(execute_sql)
+    # 쓰기마다 남기는 변경 로그
+    ensure_change_table(execute_sql)
+    # 시리즈를 쓸 때 같이 다시 계산하는 월별 지표, 빈 달을 채운 시세 (price_trend_store.write_price_trend)
+    ensure_metrics_table(execute_sql, BACKEND)
+    ensure_dense_table(execute_sql)
+
+
+def refresh_series(res, apt_info, PY, DEAL_TYPE, fetch=get_APT_transactions, before_write=None):
+    """
+    APTInfo 한 행(아파트/평형/거래유형)의 최근 6개월 데이터를 다시 수집해서 업데이트
+    fetch: get_APT_transactions와 같은 시그니처의 수집 함수 (스케줄러 테스트용 가짜 수집기 주입 가능)
+    before_write: 수집이 끝나고 저장하기 직전에 부르는 함수, False를 돌려주면 저장하지 않는다 (작업 큐의 lease 확인)
+    반환값: 아실에 보낸 연도별 요청 수 (저장하지 않았으면 None)
+    """
+    # 오늘 날짜
+    today = datetime.today()
+    # 6개월 전 날짜부터 업데이트
+    prev_date = today - timedelta(days=180)
+    str_date = prev_date.strftime("%Y%m")
+    logger.debug('기준일: %s', str_date)
+
+    collected = []
+    years = range(prev_date.year, today.year + 1)
+    for y in years:
+        YEAR = str(y)
+        amount = fetch(apt_info, PY, YEAR, DEAL_TYPE)
+        amount = sorted(amount, key=lambda x: x['date'])
+
+        filtered_amount = [d for d in amount if d['date'] >= str_date]
+        logger.debug('%s년 아실 데이터 %d개월 중 %d개월 이어 붙임', YEAR, len(amount), len(filtered_amount))
+        collected.extend(filtered_amount)
+
+    # cur.execute(
+    #     f"UPDATE APTInfo SET price_trend  = '{json.dumps(price_trend)}' WHERE id = '{res['id']}'")
+    # connection.commit()
+
+    if before_write is not None and not before_write():
+        logger.warning("저장 안 함: %s %s평 %s", apt_info['name'], PY, DEAL_TYPE)
+        return None
+
+    # 기준일 이후 구간은 새로 수집한 데이터로 대체 (새 달만 보내서 DB에서 병합)
+    with stage('write'):
+        months = write_price_trend(supabase, res['id'], collected, replace_from=str_date)
+    rows_written('APTInfo')
+    logger.info("업데이트 완료: %s %s평 %s (%d개월)", apt_info['name'], PY, DEAL_TYPE, months)
+    return len(years)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="활성 아파트의 최근 6개월 시세 갱신")
+    parser.add_argument('--metrics-file', default=None, help="Prometheus 텍스트 포맷 메트릭 파일 경로")
+    parser.add_argument('--metrics-port', type=int, default=None, help="메트릭을 제공할 로컬 HTTP 포트")
+    args = parser.parse_args()
+
+    setup_logging()
+    if args.metrics_port:
+        serve_prometheus(args.metrics_port)
+
+    try:
+        ensure_series_columns()
+
+        # Create a cursor to interact with the database
+        # cur = connection.cursor(DictCursor)
+        # sql = "SELECT DISTINCT name, PY, seq, description FROM APTInfo WHERE status = 1"
+        # cur.execute(sql)
+        # sql_result = cur.fetchall()
+        with stage('plan'):
+            response = supabase.table('APTInfo').select('name, PY, seq, description, apt_id', count='exact').eq('status', 1).execute()
+        logger.info("갱신 대상: %d개 시리즈", len(response.data))
+
+        for r in response.data:
+            ####
+            apt_name = r['name']
+            PY = r['PY']
+            logger.info("%s - %s", apt_name, PY)
+
+            apt_info = {
+                'desc': r['description'],
+                'seq': r['seq'],
+                'name': r['name'],
+            }
+
+            # 1은 매매, 2는 전세, 3은 월세
+            deal_types = range(1, 4)
+            for d in deal_types:
+                DEAL_TYPE = str(d)
+
+                # sql = "SELECT * FROM APTInfo WHERE name = %s AND PY = %s AND DEAL_TYPE = %s"
+                # cur.execute(sql, (apt_name, PY, DEAL_TYPE,))
+                # res = cur.fetchone()
+                with stage('plan'):
+                    query = supabase.table('APTInfo').select('*', count='exact').eq('DEAL_TYPE', DEAL_TYPE)
+                    # apt_id가 없는 행(migrate_price_monthly.py 전, 마이그레이션이 건너뛴 행)은 이름/평형으로 찾는다
+                    if r['apt_id'] is not None:
+                        query = query.eq('apt_id', r['apt_id'])
+                    else:
+                        query = query.eq('name', apt_name).eq('PY', PY)
+                    response = query.execute()
+                if not response.data:
+                    logger.warning('%s - %s - %s: 데이터 없음', apt_name, PY, DEAL_TYPE)
+                    continue
+                res = response.data[0]
+
+                refresh_series(res, apt_info, PY, DEAL_TYPE)
+
+        # 수집이 끝나면 시세가 바뀐 아파트만 APTLastPER, PER 통계 다시 계산 (비슷한 단지는 바뀐 시세가 있으면 전체)
+        with stage('aggregate'):
+            ensure_last_per_table()
+            rows_written('APTLastPER', refresh_dirty_per()[0])
+            snapshot_per()
+            rows_written('per_stats', refresh_per_stats())
+            ensure_region_tables(execute_sql, BACKEND)
+            rows_written('region_index', refresh_region_index(supabase, execute_sql))
+            rows_written('apt_similar', refresh_similarity())
+
+        # PRICE_SNAPSHOT_DIR이 있으면 Parquet 스냅샷에서 바뀐 파티션만 다시 쓴다
+        if os.environ.get('PRICE_SNAPSHOT_DIR'):
+            with stage('export'):
+                export_incremental(supabase, execute_sql, os.environ['PRICE_SNAPSHOT_DIR'])
+
+    except Exception as e:
+        logger.exception("Error: %s", e)
+
+    finally:
+        export(args.metrics_file)
+        logger.info('Finished')